@@ -0,0 +1,35 @@
+"""Recreate iot_data table for batched ingestion
+
+Revision ID: 3b9f2c1d7e4a
+Revises: 1e07743c5c21
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9f2c1d7e4a'
+down_revision: Union[str, None] = '1e07743c5c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('iot_data',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('device_id', sa.Integer(), nullable=False),
+    sa.Column('parameter', sa.String(length=50), nullable=False),
+    sa.Column('sensor_value', sa.Float(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_iot_data_id'), 'iot_data', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_iot_data_id'), table_name='iot_data')
+    op.drop_table('iot_data')
@@ -0,0 +1,27 @@
+"""Composite index for per-user notification queries
+
+Revision ID: 5d2e8f4a1c67
+Revises: 8c41d0e5a9b2
+Create Date: 2026-10-18 18:52:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2e8f4a1c67'
+down_revision: Union[str, None] = '8c41d0e5a9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_notifications_user_read_created', 'notifications',
+                    ['user_id', 'is_read', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notifications_user_read_created', table_name='notifications')
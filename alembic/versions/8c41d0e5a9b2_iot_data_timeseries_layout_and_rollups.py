@@ -0,0 +1,59 @@
+"""IoT data time-series layout and rollup table
+
+Revision ID: 8c41d0e5a9b2
+Revises: 3b9f2c1d7e4a
+Create Date: 2026-10-18 11:47:05.662913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41d0e5a9b2'
+down_revision: Union[str, None] = '3b9f2c1d7e4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    is_mysql = op.get_bind().dialect.name == 'mysql'
+    if is_mysql:
+        op.alter_column('iot_data', 'timestamp',
+                   existing_type=mysql.DATETIME(),
+                   type_=mysql.DATETIME(fsp=6),
+                   nullable=False)
+        # Cluster readings by device and time (InnoDB orders rows by primary key)
+        op.execute('ALTER TABLE iot_data DROP PRIMARY KEY, ADD PRIMARY KEY (device_id, timestamp, id)')
+    else:
+        with op.batch_alter_table('iot_data') as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+    op.create_index('ix_iot_data_device_param_ts', 'iot_data', ['device_id', 'parameter', 'timestamp', 'sensor_value'], unique=False)
+
+    op.create_table('iot_data_rollups',
+    sa.Column('resolution', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('device_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('parameter', sa.String(length=50), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('min_value', sa.Float(), nullable=False),
+    sa.Column('max_value', sa.Float(), nullable=False),
+    sa.Column('sum_value', sa.Double(), nullable=False),
+    sa.Column('sample_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('resolution', 'device_id', 'parameter', 'bucket_start')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('iot_data_rollups')
+    op.drop_index('ix_iot_data_device_param_ts', table_name='iot_data')
+    if op.get_bind().dialect.name == 'mysql':
+        op.execute('ALTER TABLE iot_data DROP PRIMARY KEY, ADD PRIMARY KEY (id)')
+        op.alter_column('iot_data', 'timestamp',
+                   existing_type=mysql.DATETIME(fsp=6),
+                   type_=mysql.DATETIME(),
+                   nullable=True)
+    else:
+        with op.batch_alter_table('iot_data') as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
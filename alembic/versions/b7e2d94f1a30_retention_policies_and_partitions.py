@@ -0,0 +1,62 @@
+"""Retention policies, notification age index and monthly iot_data partitions
+
+Revision ID: b7e2d94f1a30
+Revises: e6d1a9b4c053
+Create Date: 2026-10-18 21:04:12.381907
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d94f1a30'
+down_revision: Union[str, None] = 'e6d1a9b4c053'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Keep in step with app/service/retention_service.PARTITIONS_AHEAD_MONTHS
+PARTITIONS_AHEAD_MONTHS = 3
+
+
+def _next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    op.create_table('retention_policies',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('owner_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('days', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('table_name', 'owner_id')
+    )
+    op.create_index('ix_notifications_created_at', 'notifications', ['created_at'], unique=False)
+
+    if op.get_bind().dialect.name == 'mysql':
+        # One partition per month from the oldest reading to a few months
+        # ahead, plus a catch-all. Rebuilds the table: run in a quiet window.
+        oldest = op.get_bind().execute(sa.text('SELECT MIN(timestamp) FROM iot_data')).scalar()
+        now = datetime.utcnow()
+        month = datetime((oldest or now).year, (oldest or now).month, 1)
+        end = datetime(now.year, now.month, 1)
+        for _ in range(PARTITIONS_AHEAD_MONTHS + 1):
+            end = _next_month(end)
+        partitions = []
+        while month < end:
+            partitions.append(
+                f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{_next_month(month):%Y-%m-%d %H:%M:%S}')"
+            )
+            month = _next_month(month)
+        partitions.append('PARTITION pmax VALUES LESS THAN (MAXVALUE)')
+        op.execute(f"ALTER TABLE iot_data PARTITION BY RANGE COLUMNS(timestamp) ({', '.join(partitions)})")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'mysql':
+        op.execute('ALTER TABLE iot_data REMOVE PARTITIONING')
+    op.drop_index('ix_notifications_created_at', table_name='notifications')
+    op.drop_table('retention_policies')
@@ -0,0 +1,42 @@
+"""Add delivery jobs table
+
+Revision ID: c2b85e17d3f9
+Revises: a4f7c3e91b28
+Create Date: 2026-10-18 19:21:48.930114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2b85e17d3f9'
+down_revision: Union[str, None] = 'a4f7c3e91b28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('delivery_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('channel', sa.String(length=20), nullable=False),
+    sa.Column('recipient', sa.String(length=255), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_delivery_jobs_id'), 'delivery_jobs', ['id'], unique=False)
+    op.create_index('ix_delivery_jobs_status_next_attempt', 'delivery_jobs', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_delivery_jobs_status_next_attempt', table_name='delivery_jobs')
+    op.drop_index(op.f('ix_delivery_jobs_id'), table_name='delivery_jobs')
+    op.drop_table('delivery_jobs')
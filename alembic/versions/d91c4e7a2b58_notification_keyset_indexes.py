@@ -0,0 +1,32 @@
+"""Notification indexes matching the id-ordered keyset pagination
+
+Revision ID: d91c4e7a2b58
+Revises: b7e2d94f1a30
+Create Date: 2026-10-19 10:12:05.417263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd91c4e7a2b58'
+down_revision: Union[str, None] = 'b7e2d94f1a30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Created before the old index is dropped: MySQL needs one for the user_id foreign key
+    op.create_index('ix_notifications_user_read_id', 'notifications', ['user_id', 'is_read', 'id'], unique=False)
+    op.create_index('ix_notifications_user_id_id', 'notifications', ['user_id', 'id'], unique=False)
+    op.drop_index('ix_notifications_user_read_created', table_name='notifications')
+
+
+def downgrade() -> None:
+    op.create_index('ix_notifications_user_read_created', 'notifications',
+                    ['user_id', 'is_read', 'created_at'], unique=False)
+    op.drop_index('ix_notifications_user_id_id', table_name='notifications')
+    op.drop_index('ix_notifications_user_read_id', table_name='notifications')
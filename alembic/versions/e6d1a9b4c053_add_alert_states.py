@@ -0,0 +1,35 @@
+"""Add alert states checkpoint table
+
+Revision ID: e6d1a9b4c053
+Revises: c2b85e17d3f9
+Create Date: 2026-10-18 19:38:26.774519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6d1a9b4c053'
+down_revision: Union[str, None] = 'c2b85e17d3f9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('alert_states',
+    sa.Column('rule_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('cooldown_until', sa.Double(), nullable=False),
+    sa.Column('window_start', sa.Double(), nullable=False),
+    sa.Column('suppressed', sa.Integer(), nullable=False),
+    sa.Column('last_value', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('rule_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('alert_states')
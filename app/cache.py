@@ -0,0 +1,137 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# topic -> callbacks that drop the named key from a local cache
+_invalidation_handlers: Dict[str, List[Callable[[Hashable], None]]] = defaultdict(list)
+# topic -> callbacks that empty the whole cache
+_clear_handlers: Dict[str, List[Callable[[], None]]] = defaultdict(list)
+
+# Broadcasts local invalidations to the other workers (see invalidation_bus)
+_publisher: Optional[Callable[[str, Hashable], None]] = None
+
+# True while applying an invalidation that another worker published
+_remote: contextvars.ContextVar = contextvars.ContextVar("remote_invalidation", default=False)
+
+
+def on_invalidate(topic: str, handler: Callable[[Hashable], None], clear: Callable[[], None] = None) -> None:
+    """
+    Register `handler(key)` to run whenever `key` is invalidated under `topic`,
+    and optionally `clear()` for when the cache must be emptied entirely.
+    """
+    _invalidation_handlers[topic].append(handler)
+    if clear is not None:
+        _clear_handlers[topic].append(clear)
+
+
+def set_publisher(publisher: Optional[Callable[[str, Hashable], None]]) -> None:
+    """
+    Install `publisher(topic, key)`, called after every local invalidation.
+    """
+    global _publisher
+    _publisher = publisher
+
+
+def invalidate(topic: str, key: Hashable) -> None:
+    """
+    Signal that cached data for `key` under `topic` is stale.
+
+    Callers describe *what* changed; the caches decide what to drop. The
+    other workers are told too when an invalidation bus is running.
+    """
+    _apply(topic, key)
+    if _publisher is not None:
+        try:
+            _publisher(topic, key)
+        except Exception:
+            logger.exception("Publishing invalidation of %s failed", topic)
+
+
+def apply_remote(topic: str, key: Hashable) -> None:
+    """
+    Apply an invalidation published by another worker (not re-published).
+    """
+    token = _remote.set(True)
+    try:
+        _apply(topic, key)
+    finally:
+        _remote.reset(token)
+
+
+def is_remote_invalidation() -> bool:
+    """
+    Whether the running handler is applying another worker's invalidation,
+    so caches on shared storage can skip work that worker already did.
+    """
+    return _remote.get()
+
+
+def clear_all() -> None:
+    """
+    Empty every cache registered with a `clear` callback, e.g. after this
+    worker may have missed invalidations.
+    """
+    for topic, handlers in list(_clear_handlers.items()):
+        for handler in handlers:
+            try:
+                handler()
+            except Exception:
+                logger.exception("Clear handler for %s failed", topic)
+
+
+def _apply(topic: str, key: Hashable) -> None:
+    for handler in _invalidation_handlers.get(topic, ()):
+        try:
+            handler(key)
+        except Exception:
+            logger.exception("Invalidation handler for %s failed", topic)
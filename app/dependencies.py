@@ -1,25 +1,215 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import secrets
+from dataclasses import dataclass
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlalchemy.orm import Session
+from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials
+from jose import JWTError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import database, models
-from app.utils import verify_password
-
-security = HTTPBasic()  # Initialize HTTP Basic authentication
-
-def get_current_user(
-    credentials: HTTPBasicCredentials = Depends(security), 
-    db: Session = Depends(database.get_db)
-):
-    """
-    Authenticate user using HTTP Basic Authentication.
-    """
-    user = db.query(models.User).filter(models.User.username == credentials.username).first()
-    
-    if user is None or not verify_password(credentials.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid username or password",
-            headers={"WWW-Authenticate": "Basic"},
-        )
-    
-    return user  # Returning the actual User model
+from app.cache import TTLCache, invalidate, on_invalidate
+from app.security import decode_token, tokens_enabled
+from app.service import password_service
+
+# Both schemes read the Authorization header; whichever matches is used
+security = HTTPBasic(auto_error=False)  # Initialize HTTP Basic authentication
+bearer_scheme = HTTPBearer(auto_error=False)  # JWT bearer tokens issued by /auth/token
+
+# Bearer tokens are accepted on every protected router once SECRET_KEY is set
+# (see app.security); Basic auth is always accepted
+
+# Verified-credential cache: avoids a bcrypt verify on every request
+AUTH_CACHE_TTL_SECONDS = 300
+AUTH_CACHE_MAX_ENTRIES = 10_000
+
+# Per-process key so cached digests are useless outside this worker
+_credential_key = secrets.token_bytes(32)
+credential_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
+CREDENTIALS_TOPIC = "credentials"
+on_invalidate(CREDENTIALS_TOPIC, credential_cache.pop, credential_cache.clear)
+
+# Users behind bearer tokens, so a deleted user or a revoked admin role takes
+# effect without waiting for the token to expire
+USER_CACHE_TTL_SECONDS = 60
+user_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL_SECONDS)
+
+USERS_TOPIC = "users"
+on_invalidate(USERS_TOPIC, user_cache.pop, user_cache.clear)
+
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """
+    Identity of the authenticated caller, detached from any DB session.
+    """
+    id: int
+    username: str
+    email: str
+    is_admin: bool = False
+
+    @classmethod
+    def from_model(cls, user: models.User) -> "AuthenticatedUser":
+        return cls(id=user.id, username=user.username, email=user.email, is_admin=bool(user.is_admin))
+
+
+def _credential_digest(password: str) -> bytes:
+    return hmac.new(_credential_key, password.encode("utf-8"), hashlib.sha256).digest()
+
+
+def invalidate_credentials(username: Optional[str]) -> None:
+    """
+    Drop any cached verification for `username` (call after password/role changes).
+    """
+    if username is not None:
+        invalidate(CREDENTIALS_TOPIC, username)
+
+
+def invalidate_user(user_id: Optional[int]) -> None:
+    """
+    Drop the cached identity of `user_id` (call after any change to the user row).
+    """
+    if user_id is not None:
+        invalidate(USERS_TOPIC, user_id)
+
+
+def _unauthorized(detail: str = "Invalid username or password") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Basic"},
+    )
+
+
+async def _find_user(db: AsyncSession, *criteria) -> Optional[models.User]:
+    result = await db.execute(select(models.User).where(*criteria).limit(1))
+    return result.scalars().first()
+
+
+async def _user_from_token(token: str, db: AsyncSession) -> AuthenticatedUser:
+    """
+    Resolve a bearer token to the user it was issued to, as currently stored:
+    the token only names the user, its role claims are not trusted.
+    """
+    try:
+        payload = decode_token(token)
+    except JWTError:
+        raise _unauthorized("Invalid authentication credentials")
+
+    user_id = payload.get("uid")
+    if user_id is not None:
+        identity = user_cache.get(user_id)
+        if identity is not None:
+            return identity
+        user = await _find_user(db, models.User.id == user_id)
+    else:
+        # Older tokens only carry the email in "sub"
+        user = await _find_user(db, models.User.email == payload.get("sub"))
+    if user is None:
+        raise _unauthorized("Invalid authentication credentials")
+    identity = AuthenticatedUser.from_model(user)
+    user_cache.set(identity.id, identity)
+    return identity
+
+
+async def rehash_password(db: AsyncSession, user: models.User, new_hash: Optional[str]) -> None:
+    """
+    Store an upgraded hash returned by `password_service.verify_password`.
+
+    Only replaces the hash it was computed from, so a concurrent password
+    change wins.
+    """
+    if new_hash is None:
+        return
+    await db.execute(
+        update(models.User)
+        .where(models.User.id == user.id, models.User.hashed_password == user.hashed_password)
+        .values(hashed_password=new_hash)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def _user_from_basic(credentials: HTTPBasicCredentials, db: AsyncSession) -> AuthenticatedUser:
+    digest = _credential_digest(credentials.password)
+    cached = credential_cache.get(credentials.username)
+    if cached is not None and hmac.compare_digest(cached[0], digest):
+        return cached[1]
+
+    user = await _find_user(db, models.User.username == credentials.username)
+    if user is None:
+        raise _unauthorized()
+    valid, new_hash = await password_service.verify_password(credentials.password, user.hashed_password)
+    if not valid:
+        raise _unauthorized()
+    await rehash_password(db, user, new_hash)
+
+    identity = AuthenticatedUser.from_model(user)
+    credential_cache.set(credentials.username, (digest, identity))
+    return identity
+
+
+async def get_current_user(
+    credentials: Optional[HTTPBasicCredentials] = Depends(security),
+    bearer: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: AsyncSession = Depends(database.get_async_db)
+) -> AuthenticatedUser:
+    """
+    Authenticate user using HTTP Basic Authentication or a JWT bearer token.
+
+    Successful Basic verifications are cached per (username, credential digest)
+    so bcrypt only runs on a cache miss, in the password worker pool; bearer
+    tokens resolve to their user through a short-lived per-user cache.
+    """
+    if credentials is not None:
+        return await _user_from_basic(credentials, db)
+    if bearer is not None and tokens_enabled():
+        return await _user_from_token(bearer.credentials, db)
+    raise _unauthorized("Not authenticated")
+
+
+def cached_identity(authorization: Optional[str]) -> Optional[AuthenticatedUser]:
+    """
+    The caller of a raw Authorization value, if it can be verified without the
+    database or bcrypt: bearer tokens whose user is cached, or Basic
+    credentials with a cached verification. None otherwise.
+    """
+    scheme, _, param = (authorization or "").partition(" ")
+    if scheme.lower() == "bearer" and param and tokens_enabled():
+        try:
+            payload = decode_token(param)
+        except JWTError:
+            return None
+        return user_cache.get(payload.get("uid")) if payload.get("uid") is not None else None
+    if scheme.lower() == "basic" and param:
+        try:
+            username, separator, password = base64.b64decode(param).decode("utf-8").partition(":")
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        cached = credential_cache.get(username) if separator else None
+        if cached is not None and hmac.compare_digest(cached[0], _credential_digest(password)):
+            return cached[1]
+    return None
+
+
+async def user_from_authorization(authorization: Optional[str], db: AsyncSession) -> AuthenticatedUser:
+    """
+    Authenticate a raw Authorization value (for WebSocket connections, where the
+    HTTP security dependencies are unavailable).
+    """
+    scheme, _, param = (authorization or "").partition(" ")
+    if scheme.lower() == "bearer" and param and tokens_enabled():
+        return await _user_from_token(param, db)
+    if scheme.lower() == "basic" and param:
+        try:
+            username, separator, password = base64.b64decode(param).decode("utf-8").partition(":")
+        except (binascii.Error, UnicodeDecodeError):
+            raise _unauthorized()
+        if separator:
+            return await _user_from_basic(HTTPBasicCredentials(username=username, password=password), db)
+    raise _unauthorized("Not authenticated")
@@ -0,0 +1,299 @@
+"""
+Broadcasts cache invalidations between worker processes.
+
+Every `app.cache.invalidate` call in one worker is published and applied in
+the others with `app.cache.apply_remote`, so process-local caches (verified
+credentials, the device registry, alert rules, dashboards, cached responses)
+stay correct behind several uvicorn workers.
+
+Events carry the publishing worker's id and a sequence number. A receiver
+that finds a gap in a worker's sequence (an event that could not be
+delivered) empties all of its caches instead of serving stale data.
+
+Transports:
+  "unix"  - a datagram socket per worker in one directory; publishing sends
+            to every socket there. Workers on the same host.
+  "redis" - a pub/sub channel, for workers on several hosts.
+  "none"  - invalidations stay in the process.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import secrets
+import socket
+import tempfile
+import threading
+from typing import Dict, Hashable, Optional
+
+from app import cache
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "iot-backend:invalidation"
+SOCKET_SUFFIX = ".sock"
+MAX_EVENT_BYTES = 65_536
+
+RECEIVE_TIMEOUT_SECONDS = 1.0  # how often the receiver checks for stop
+SEND_TIMEOUT_SECONDS = 0.5  # per peer; a peer that can't keep up resyncs on the next event
+RECONNECT_DELAY_SECONDS = 1.0
+
+EVENTS_PUBLISHED = registry.counter("invalidation_events_published_total", "Cache invalidations published to other workers.")
+EVENTS_RECEIVED = registry.counter("invalidation_events_received_total", "Cache invalidations applied from other workers.")
+SEND_FAILURES = registry.counter("invalidation_send_failures_total", "Invalidation events that could not be sent to a worker.")
+RESYNCS = registry.counter("invalidation_resyncs_total", "Times every cache was emptied after missed invalidations.")
+
+
+def encode_event(origin: str, seq: int, topic: str, key: Hashable) -> bytes:
+    return json.dumps({"o": origin, "s": seq, "t": topic, "k": key}, separators=(",", ":")).encode()
+
+
+def _hashable(value):
+    # JSON turns the tuple keys (e.g. ("device", 7)) into lists
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+def decode_event(payload: bytes) -> tuple:
+    """
+    (origin, seq, topic, key) of an encoded event; ValueError if malformed.
+    """
+    try:
+        event = json.loads(payload)
+        return str(event["o"]), int(event["s"]), str(event["t"]), _hashable(event["k"])
+    except (KeyError, TypeError) as exc:
+        raise ValueError(f"Malformed invalidation event: {exc!r}") from None
+
+
+def default_socket_dir(database_url: str) -> str:
+    """
+    A directory shared by the workers of one deployment: derived from the
+    database URL, so apps on other databases don't exchange events.
+    """
+    digest = hashlib.sha256(database_url.encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"iot-backend-invalidation-{digest}")
+
+
+class UnixSocketTransport:
+    """
+    One datagram socket per worker in `directory`. Sockets left by workers
+    that died are removed when sending to them is refused.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self._receiver: Optional[socket.socket] = None
+        self._sender: Optional[socket.socket] = None
+
+    def open(self) -> None:
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{secrets.token_hex(4)}{SOCKET_SUFFIX}")
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+        self._receiver.settimeout(RECEIVE_TIMEOUT_SECONDS)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.settimeout(SEND_TIMEOUT_SECONDS)
+
+    def send(self, payload: bytes) -> None:
+        for name in os.listdir(self.directory):
+            peer = os.path.join(self.directory, name)
+            if not name.endswith(SOCKET_SUFFIX) or peer == self.path:
+                continue
+            try:
+                self._sender.sendto(payload, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nobody is bound there any more
+                try:
+                    os.unlink(peer)
+                except FileNotFoundError:
+                    pass
+            except OSError as exc:
+                SEND_FAILURES.inc()
+                logger.warning("Invalidation event not delivered to %s: %r", name, exc)
+
+    def receive(self) -> Optional[bytes]:
+        try:
+            return self._receiver.recv(MAX_EVENT_BYTES)
+        except socket.timeout:
+            return None
+
+    def close(self) -> None:
+        for sock in (self._receiver, self._sender):
+            if sock is not None:
+                sock.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class RedisTransport:
+    """
+    A Redis pub/sub channel shared by every worker, on any host.
+    """
+
+    def __init__(self, url: str, channel: str = INVALIDATION_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._pubsub = None
+
+    def open(self) -> None:
+        import redis  # optional dependency, only needed for the redis transport
+        self._client = redis.Redis.from_url(self.url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+
+    def send(self, payload: bytes) -> None:
+        self._client.publish(self.channel, payload)
+
+    def receive(self) -> Optional[bytes]:
+        message = self._pubsub.get_message(timeout=RECEIVE_TIMEOUT_SECONDS)
+        return message["data"] if message else None
+
+    def close(self) -> None:
+        if self._pubsub is not None:
+            self._pubsub.close()
+        if self._client is not None:
+            self._client.close()
+
+
+def create_transport(kind: str, path: str = None, url: str = None):
+    if kind == "none":
+        return None
+    if kind == "unix":
+        return UnixSocketTransport(path)
+    if kind == "redis":
+        return RedisTransport(url)
+    raise ValueError(f"Unknown invalidation bus transport: {kind}")
+
+
+class InvalidationBus:
+    """
+    Publishes this worker's invalidations and applies everyone else's.
+
+    Publishing only queues the event; a sender thread delivers events in
+    sequence order, so requests never wait on the transport. A receiver
+    thread applies incoming events.
+    """
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.transport = None
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self._outbox: queue.SimpleQueue = queue.SimpleQueue()
+        self._last_seq: Dict[str, int] = {}  # origin -> latest sequence number applied
+        self._stop = threading.Event()
+        self._sender: Optional[threading.Thread] = None
+        self._receiver: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self.transport is not None
+
+    def start(self, transport) -> None:
+        """
+        Open `transport` and start exchanging events. Call before the caches
+        are first filled, so no invalidation after that is missed.
+        """
+        if self.running or transport is None:
+            return
+        try:
+            transport.open()
+        except Exception:
+            transport.close()
+            raise
+        self.transport = transport
+        self._stop.clear()
+        self._sender = threading.Thread(target=self._send_loop, name="invalidation-sender", daemon=True)
+        self._receiver = threading.Thread(target=self._receive_loop, name="invalidation-receiver", daemon=True)
+        self._sender.start()
+        self._receiver.start()
+        cache.set_publisher(self.publish)
+
+    def stop(self) -> None:
+        """
+        Send the events still queued, then close the transport.
+        """
+        if not self.running:
+            return
+        cache.set_publisher(None)
+        self._stop.set()
+        self._outbox.put(None)
+        self._sender.join()
+        self._receiver.join()
+        self.transport.close()
+        self.transport = None
+
+    def publish(self, topic: str, key: Hashable) -> None:
+        with self._seq_lock:
+            self._seq += 1
+            # Queued under the lock so the sender sees sequence order
+            self._outbox.put(encode_event(self.origin, self._seq, topic, key))
+
+    def _send_loop(self) -> None:
+        while True:
+            payload = self._outbox.get()
+            if payload is None:
+                return
+            try:
+                self.transport.send(payload)
+                EVENTS_PUBLISHED.inc()
+            except Exception:
+                # Receivers notice the skipped sequence number and resync
+                SEND_FAILURES.inc()
+                logger.exception("Publishing invalidation event failed")
+
+    def _receive_loop(self) -> None:
+        resync = False
+        while not self._stop.is_set():
+            try:
+                payload = self.transport.receive()
+            except Exception:
+                logger.exception("Receiving invalidation events failed")
+                # Events may be lost until the transport recovers
+                resync = True
+                self._stop.wait(RECONNECT_DELAY_SECONDS)
+                continue
+            if resync:
+                self._resync("the transport reconnected")
+                resync = False
+            if payload is not None:
+                self.apply(payload)
+
+    def apply(self, payload: bytes) -> None:
+        """
+        Apply one received event: ignore our own and repeated events, resync
+        on a gap in the sender's sequence.
+        """
+        try:
+            origin, seq, topic, key = decode_event(payload)
+        except ValueError:
+            logger.warning("Dropping malformed invalidation event %r", payload[:200])
+            return
+        if origin == self.origin:
+            return
+        last = self._last_seq.get(origin)
+        if last is not None and seq <= last:
+            return
+        self._last_seq[origin] = seq
+        # The first event from a worker has no predecessor to compare with:
+        # this worker started after it and filled its caches since
+        if last is not None and seq > last + 1:
+            self._resync(f"{seq - last - 1} events from {origin} were missed")
+        cache.apply_remote(topic, key)
+        EVENTS_RECEIVED.inc()
+
+    def _resync(self, reason: str) -> None:
+        logger.warning("Clearing all caches: %s", reason)
+        RESYNCS.inc()
+        cache.clear_all()
+
+
+invalidation_bus = InvalidationBus()
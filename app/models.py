@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, Float, Double, DateTime, Index
+from sqlalchemy.dialects import mysql
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
+
+# Microsecond timestamps on MySQL so high-rate readings keep their order
+PreciseDateTime = DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql")
+
 class User(Base):
     __tablename__ = "users"
     
@@ -13,6 +18,7 @@ class User(Base):
     notifications = relationship("Notification", back_populates="user", cascade="all, delete-orphan")
     systems = relationship("System", back_populates="owner", cascade="all, delete-orphan")
     device_inputs = relationship("DeviceInput", back_populates="owner", cascade="all, delete-orphan")
+    retention_policies = relationship("RetentionPolicy", cascade="all, delete-orphan")
     hashed_password = Column(String)
     is_admin = Column(Boolean, default=False)
 
@@ -55,6 +61,14 @@ class DeviceInput(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    # The lists are keyset-paginated on id: (user_id, is_read, id) serves the
+    # unread listing and (user_id, id) the alert history without a filesort;
+    # created_at alone serves the retention purge
+    __table_args__ = (
+        Index("ix_notifications_user_read_id", "user_id", "is_read", "id"),
+        Index("ix_notifications_user_id_id", "user_id", "id"),
+        Index("ix_notifications_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -64,10 +78,78 @@ class Notification(Base):
 
     user = relationship("User", back_populates="notifications")
 
+class AlertState(Base):
+    """Checkpoint of the alert engine's per-rule dedup state (see alert_service)."""
+    __tablename__ = "alert_states"
+
+    rule_id = Column(Integer, primary_key=True, autoincrement=False)  # DeviceInput.id
+    active = Column(Boolean, nullable=False, default=False)
+    cooldown_until = Column(Double, nullable=False, default=0)  # epoch seconds
+    window_start = Column(Double, nullable=False, default=0)  # epoch seconds
+    suppressed = Column(Integer, nullable=False, default=0)  # breaches not yet reported
+    last_value = Column(Float, nullable=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class DeliveryJob(Base):
+    __tablename__ = "delivery_jobs"
+    # Workers claim due jobs in next_attempt_at order
+    __table_args__ = (Index("ix_delivery_jobs_status_next_attempt", "status", "next_attempt_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String(20), nullable=False)  # "email", "webhook"
+    recipient = Column(String(255), nullable=False)  # address or URL
+    payload = Column(Text, nullable=True)  # JSON message; cleared once delivered
+    status = Column(String(20), nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # also the lease expiry while sending
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+class PasswordResetToken(Base):
+    __tablename__ = "password_reset_tokens"
+    # Per-email issue history drives the rate limit
+    __table_args__ = (Index("ix_password_reset_tokens_email_created", "email", "created_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False)  # sha256 hex; the token itself is never stored
+    email = Column(String(100), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime, nullable=True)
+
+class RetentionPolicy(Base):
+    """Per-tenant retention override (see retention_service); 0 days keeps rows forever."""
+    __tablename__ = "retention_policies"
+
+    table_name = Column(String(50), primary_key=True)  # "iot_data" or "notifications"
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True, autoincrement=False)
+    days = Column(Integer, nullable=False)
+
 class IoTData(Base):
     __tablename__ = "iot_data"
+    # On MySQL the migration clusters rows by (device_id, timestamp, id) and
+    # partitions them by month of timestamp (dropped whole by retention_service);
+    # the covering index below serves range scans on other backends.
+    __table_args__ = (
+        Index("ix_iot_data_device_param_ts", "device_id", "parameter", "timestamp", "sensor_value"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(Integer, nullable=False)  # Foreign key if applicable
+    parameter = Column(String(50), nullable=False)  # e.g., "Temperature"
     sensor_value = Column(Float, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = Column(PreciseDateTime, nullable=False, default=datetime.utcnow)
+
+class IoTDataRollup(Base):
+    __tablename__ = "iot_data_rollups"
+
+    # Bucket width in seconds: 60 (1 minute), 3600 (1 hour) or 86400 (1 day)
+    resolution = Column(Integer, primary_key=True, autoincrement=False)
+    device_id = Column(Integer, primary_key=True, autoincrement=False)
+    parameter = Column(String(50), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    sum_value = Column(Double, nullable=False)
+    sample_count = Column(Integer, nullable=False)
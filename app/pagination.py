@@ -0,0 +1,126 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Literal, Optional, Sequence
+
+from fastapi import HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, and_, or_
+
+from app.database import AsyncSessionLocal, get_async_engine
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_ROWS = 500  # rows fetched per round trip from the server-side cursor
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class PageParams:
+    """
+    Query parameters shared by every list endpoint (use as `Depends()`).
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description=f"Page size (default {DEFAULT_PAGE_SIZE})"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+        format: Literal["json", "ndjson"] = Query("json", description="ndjson streams every remaining row"),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.streaming = format == "ndjson"
+
+    @property
+    def size(self) -> int:
+        return self.limit or DEFAULT_PAGE_SIZE
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(keys):
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(v) if isinstance(key.type, DateTime) and v is not None else v
+            for key, v in zip(keys, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_predicate(keys: Sequence, values: Sequence, descending: bool = False):
+    """
+    Rows after `values` in the (keys...) ordering, i.e. (k1, k2, ...) > (v1, v2, ...)
+    expanded so every backend can use the index.
+    """
+    clauses = []
+    for i, (key, value) in enumerate(zip(keys, values)):
+        beyond = key < value if descending else key > value
+        clauses.append(and_(*[k == v for k, v in zip(keys[:i], values[:i])], beyond))
+    return or_(*clauses)
+
+
+def paginate(stmt, page: PageParams, keys: Sequence, descending: bool = False):
+    """
+    Apply keyset ordering, the cursor predicate and (unless streaming) the page limit.
+
+    `keys` must end with a unique column (normally the primary key).
+    """
+    if page.cursor:
+        stmt = stmt.where(keyset_predicate(keys, decode_cursor(page.cursor, keys), descending))
+    stmt = stmt.order_by(*[key.desc() if descending else key.asc() for key in keys])
+    if page.streaming:
+        return stmt.limit(page.limit) if page.limit else stmt
+    return stmt.limit(page.size + 1)
+
+
+def finalize_page(rows: List, page: PageParams, keys: Sequence, request: Request, response: Response) -> List:
+    """
+    Trim the look-ahead row and advertise the next cursor in the response headers.
+    """
+    if len(rows) <= page.size:
+        return rows
+    rows = rows[:page.size]
+    next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+    response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return rows
+
+
+def _ndjson_chunk(schema, rows, transform=None) -> str:
+    if transform is not None:
+        rows = map(transform, rows)
+    return "".join(schema.model_validate(row, from_attributes=True).model_dump_json() + "\n" for row in rows)
+
+
+def stream_ndjson(stmt, schema) -> StreamingResponse:
+    """
+    Stream ORM rows as NDJSON, for routes using the sync engine.
+
+    Rows are read through the async engine: the sync MySQL driver
+    (mysqlconnector) has no server-side cursors and would buffer the whole
+    result, while aiomysql streams it.
+    """
+    return stream_ndjson_async(stmt, schema)
+
+
+def stream_ndjson_async(stmt, schema, transform=None) -> StreamingResponse:
+    """
+    Stream ORM rows as NDJSON from a server-side cursor on a dedicated async session.
+
+    `transform` optionally maps each ORM row to what `schema` validates.
+    """
+    async def generate():
+        get_async_engine()
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(stmt.execution_options(yield_per=STREAM_CHUNK_ROWS))
+            async for partition in result.scalars().partitions():
+                yield _ndjson_chunk(schema, partition, transform)
+
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
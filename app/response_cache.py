@@ -0,0 +1,259 @@
+import base64
+import hashlib
+import itertools
+import json
+import secrets
+import threading
+from typing import Dict, Hashable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.cache import TTLCache, invalidate, is_remote_invalidation, on_invalidate
+from app.config import Settings, get_settings
+from app.dependencies import cached_identity
+
+RESPONSE_CACHE_TOPIC = "responses"
+
+# Cached GET endpoints -> the per-user data area their payload depends on
+CACHED_ROUTES = {
+    "/profile/": "profile",
+    "/system/": "systems",
+    "/device-input/": "device_inputs",
+    "/alerts/": "notifications",
+    "/notifications/": "notifications",
+}
+AREAS = frozenset(CACHED_ROUTES.values())
+
+RESPONSE_CACHE_TTL_SECONDS = 60
+RESPONSE_CACHE_MAX_ENTRIES = 10_000
+RESPONSE_CACHE_MAX_BODY_BYTES = 1_000_000  # larger pages are served but not cached
+
+# "memory" keeps entries per process; "shared" uses RESPONSE_CACHE_URL (Redis)
+# so every worker serves the same versions
+RESPONSE_CACHE_BACKEND = get_settings().response_cache_backend
+RESPONSE_CACHE_URL = get_settings().response_cache_url
+
+# Response headers replayed from a cached entry
+_REPLAYED_HEADERS = ("content-type", "x-next-cursor", "link")
+
+
+class MemoryResponseBackend:
+    """
+    Per-process backend: a bounded LRU+TTL map of responses and a version per (user, area).
+
+    Versions come from one process-wide counter under a random per-process
+    prefix, so a version is never reused, even after its entry is evicted.
+    """
+    blocking = False
+    shared = False
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL_SECONDS):
+        self._entries = TTLCache(maxsize, ttl)
+        self._versions = TTLCache(maxsize, 24 * 3600)
+        self._prefix = secrets.token_hex(4)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def version(self, user_id: int, area: str) -> str:
+        key = (user_id, area)
+        version = self._versions.get(key)
+        if version is None:
+            with self._lock:
+                version = self._versions.get(key)
+                if version is None:
+                    version = self._mint(key)
+        return version
+
+    def bump(self, user_id: int, area: str) -> None:
+        with self._lock:
+            self._mint((user_id, area))
+
+    def _mint(self, key: tuple) -> str:
+        version = f"{self._prefix}.{next(self._counter)}"
+        self._versions.set(key, version)
+        return version
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._entries.get(key)
+
+    def set(self, key: str, entry: dict) -> None:
+        self._entries.set(key, entry)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+
+
+class SharedResponseBackend:
+    """
+    Backend on a shared key-value store (a redis.Redis client, or any client with get/set/incr).
+
+    Versions are INCR counters, so every worker agrees on a user's ETags.
+    """
+    blocking = True  # network round trips; called from the threadpool
+    shared = True  # every worker reads the same versions
+
+    def __init__(self, client, ttl: float = RESPONSE_CACHE_TTL_SECONDS, prefix: str = "rc"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def version(self, user_id: int, area: str) -> str:
+        value = self.client.get(f"{self.prefix}:v:{user_id}:{area}")
+        if value is None:
+            return str(self.client.incr(f"{self.prefix}:v:{user_id}:{area}"))
+        return value.decode() if isinstance(value, bytes) else str(value)
+
+    def bump(self, user_id: int, area: str) -> None:
+        self.client.incr(f"{self.prefix}:v:{user_id}:{area}")
+
+    def get(self, key: str) -> Optional[dict]:
+        raw = self.client.get(f"{self.prefix}:r:{key}")
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        entry["body"] = base64.b64decode(entry["body"])
+        return entry
+
+    def set(self, key: str, entry: dict) -> None:
+        raw = json.dumps(dict(entry, body=base64.b64encode(entry["body"]).decode("ascii")))
+        self.client.set(f"{self.prefix}:r:{key}", raw, ex=max(int(self.ttl), 1))
+
+
+def create_backend(kind: str = None, url: str = None):
+    kind = kind or RESPONSE_CACHE_BACKEND
+    if kind == "memory":
+        return MemoryResponseBackend()
+    if kind == "shared":
+        import redis  # optional dependency, only needed for the shared backend
+        return SharedResponseBackend(redis.Redis.from_url(url or RESPONSE_CACHE_URL))
+    raise ValueError(f"Unknown response cache backend: {kind}")
+
+
+class ResponseCacheMiddleware:
+    """
+    ETag / conditional GET and response caching for polled read endpoints.
+
+    The ETag is derived from the caller's data version for the route's area
+    (bumped by `invalidate_responses` on every write) and the request URL.
+    A matching If-None-Match gets a 304 and a cached body is replayed without
+    reaching the route, as long as the caller can be authenticated without
+    the database (bearer claims or a cached Basic verification); other
+    requests pass through and warm the cache.
+    """
+
+    def __init__(self, app, routes: Dict[str, str] = None):
+        self.app = app
+        self.routes = CACHED_ROUTES if routes is None else routes
+
+    async def _call(self, name: str, *args):
+        method = getattr(response_cache, name)
+        if response_cache.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    async def __call__(self, scope, receive, send):
+        area = self.routes.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        query = scope.get("query_string", b"").decode("latin-1")
+        if area is None or "format=ndjson" in query:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        identity = cached_identity(headers.get("authorization"))
+        if identity is None:
+            await self.app(scope, receive, send)
+            return
+
+        version = await self._call("version", identity.id, area)
+        url = f"{scope['path']}?{query}"
+        etag = '"%s-%s"' % (version, hashlib.sha1(f"{identity.id}:{url}".encode()).hexdigest()[:12])
+        common = [(b"etag", etag.encode()), (b"cache-control", b"private, no-cache"), (b"vary", b"authorization")]
+
+        if etag in (tag.strip() for tag in headers.get("if-none-match", "").split(",")):
+            await send({"type": "http.response.start", "status": 304, "headers": common})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        key = f"{identity.id}:{url}"
+        entry = await self._call("get", key)
+        if entry is not None and entry["etag"] == etag:
+            body = entry["body"]
+            replayed = [(name.encode(), value.encode()) for name, value in entry["headers"]]
+            await send({
+                "type": "http.response.start", "status": 200,
+                "headers": common + replayed + [(b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        captured = {"status": None, "headers": [], "body": [], "size": 0}
+
+        async def send_and_capture(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                response_headers = MutableHeaders(scope=message)
+                captured["headers"] = [(name, response_headers[name]) for name in _REPLAYED_HEADERS if name in response_headers]
+                if message["status"] == 200:
+                    for name, value in common:
+                        response_headers[name.decode()] = value.decode()
+            elif message["type"] == "http.response.body" and captured["size"] <= RESPONSE_CACHE_MAX_BODY_BYTES:
+                captured["body"].append(message.get("body", b""))
+                captured["size"] += len(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_and_capture)
+        content_type = dict(captured["headers"]).get("content-type", "")
+        if (
+            captured["status"] == 200
+            and content_type.startswith("application/json")
+            and captured["size"] <= RESPONSE_CACHE_MAX_BODY_BYTES
+        ):
+            await self._call("set", key, {
+                "etag": etag, "headers": captured["headers"], "body": b"".join(captured["body"]),
+            })
+
+
+response_cache = create_backend()
+
+
+def use_backend(backend) -> None:
+    """
+    Replace the process-wide backend (e.g. a SharedResponseBackend on an existing client).
+    """
+    global response_cache
+    response_cache = backend
+
+
+def configure(settings: Settings) -> None:
+    """
+    Switch to the backend of `settings` (no-op if unchanged; call before startup).
+    """
+    global RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_URL
+    if (settings.response_cache_backend, settings.response_cache_url) == (RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_URL):
+        return
+    use_backend(create_backend(settings.response_cache_backend, settings.response_cache_url))
+    RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_URL = settings.response_cache_backend, settings.response_cache_url
+
+
+def _bump(key: Hashable) -> None:
+    if response_cache.shared and is_remote_invalidation():
+        return  # the publishing worker already bumped the shared version
+    user_id, area = key
+    response_cache.bump(user_id, area)
+
+
+def _clear() -> None:
+    if not response_cache.shared:
+        response_cache.clear()
+
+
+on_invalidate(RESPONSE_CACHE_TOPIC, _bump, _clear)
+
+
+def invalidate_responses(user_id: int, *areas: str) -> None:
+    """
+    Signal that `user_id`'s cached responses for `areas` (default: all) are stale.
+    """
+    for area in areas or AREAS:
+        invalidate(RESPONSE_CACHE_TOPIC, (user_id, area))
@@ -1,9 +0,0 @@
-from .auth import router as auth_router
-from .dashboard import router as dashboard_router
-from .device_input import router as device_input_router
-from .filters import router as filter_router
-from .admin import router as admin_router
-from .profile import router as profile_router
-from .notifications import router as notifications_router
-from .alerts import router as alerts_router
-
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List
 from app.database import get_db
-from app.models import User
-from app.schemas import UserResponse, UserUpdate
-from app.dependencies import get_current_user  # Use authentication from dependencies
+from app.models import RetentionPolicy, User
+from app.schemas import RetentionPolicyResponse, RetentionPolicyUpdate, RetentionReport, UserResponse, UserUpdate
+from app.dependencies import get_current_user, invalidate_credentials, invalidate_user  # Use authentication from dependencies
+from app.service.dashboard_service import invalidate_dashboard
+from app.response_cache import invalidate_responses
+from app.service.device_registry import device_registry, invalidate_owner_devices
+from app.service.alert_service import alert_engine
+from app.service.retention_service import retention_manager
+from app.security import get_password_hash
+from app.pagination import PageParams, paginate, finalize_page, stream_ndjson
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -15,12 +23,21 @@ def check_admin(user: User):
     return user
 
 @router.get("/users", response_model=List[UserResponse])
-def get_all_users(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_all_users(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
     """
-    Get a list of all users (Admin only).
+    Get a list of all users, keyset-paginated by id (Admin only).
     """
     check_admin(current_user)  # Ensure user is Admin
-    return db.query(User).all()
+    stmt = paginate(select(User), page, (User.id,))
+    if page.streaming:
+        return stream_ndjson(stmt, UserResponse)
+    return finalize_page(db.scalars(stmt).all(), page, (User.id,), request, response)
 
 @router.put("/users/{user_id}", response_model=UserResponse)
 def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
@@ -33,10 +50,19 @@ def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    for key, value in user_update.dict(exclude_unset=True).items():
+    previous_username = user.username
+
+    update_data = user_update.dict(exclude_unset=True)
+    if "password" in update_data:
+        user.hashed_password = get_password_hash(update_data.pop("password"))
+    for key, value in update_data.items():
         setattr(user, key, value)
 
     db.commit()
+    invalidate_credentials(previous_username)
+    invalidate_credentials(user.username)
+    invalidate_user(user_id)
+    invalidate_responses(user_id, "profile")
     db.refresh(user)
     return user
 
@@ -51,6 +77,66 @@ def delete_user(user_id: int, db: Session = Depends(get_db), current_user: User
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    device_ids = [device.id for device in device_registry.devices_of(user_id)]
     db.delete(user)
     db.commit()
+    invalidate_credentials(user.username)
+    invalidate_user(user_id)
+    invalidate_dashboard(user_id)
+    invalidate_owner_devices(user_id)
+    invalidate_responses(user_id)
+    alert_engine.remove_devices(device_ids)
     return {"message": "User deleted successfully"}
+
+@router.get("/retention", response_model=List[RetentionPolicyResponse])
+def get_retention_policies(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    List per-tenant retention overrides (Admin only).
+    """
+    check_admin(current_user)
+    return db.scalars(select(RetentionPolicy).order_by(RetentionPolicy.table_name, RetentionPolicy.owner_id)).all()
+
+@router.put("/retention", response_model=RetentionPolicyResponse)
+def set_retention_policy(policy: RetentionPolicyUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Set a tenant's retention for a table (Admin only); applied on the next pass.
+    """
+    check_admin(current_user)
+    if db.get(User, policy.owner_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    db_policy = db.get(RetentionPolicy, (policy.table_name, policy.owner_id))
+    if db_policy is None:
+        db_policy = RetentionPolicy(table_name=policy.table_name, owner_id=policy.owner_id)
+        db.add(db_policy)
+    db_policy.days = policy.days
+    db.commit()
+    return db_policy
+
+@router.delete("/retention/{table_name}/{owner_id}")
+def delete_retention_policy(table_name: str, owner_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Remove a tenant's override so the table default applies (Admin only).
+    """
+    check_admin(current_user)
+    db_policy = db.get(RetentionPolicy, (table_name, owner_id))
+    if db_policy is None:
+        raise HTTPException(status_code=404, detail="Retention policy not found")
+    db.delete(db_policy)
+    db.commit()
+    return {"message": "Retention policy deleted successfully"}
+
+@router.get("/retention/report", response_model=RetentionReport)
+def retention_report(current_user: User = Depends(get_current_user)):
+    """
+    Dry run: what the next retention pass would delete, drop and create (Admin only).
+    """
+    check_admin(current_user)
+    return retention_manager.run(dry_run=True)
+
+@router.post("/retention/run", response_model=RetentionReport)
+def run_retention(current_user: User = Depends(get_current_user)):
+    """
+    Run a retention pass now instead of waiting for the scheduler (Admin only).
+    """
+    check_admin(current_user)
+    return retention_manager.run()
@@ -1,16 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database import get_db
+from app.database import get_async_db
 from app.models import Notification
 from app.schemas import NotificationResponse
 from app.dependencies import get_current_user  # Import authentication dependency
+from app.pagination import PageParams, paginate, finalize_page, stream_ndjson_async
 
 router = APIRouter(prefix="/alerts", tags=["Alerts"])
 
+# Newest first: ids are assigned in creation order, so they double as the time key
+ALERT_KEYS = (Notification.id,)
+
 @router.get("/", response_model=List[NotificationResponse])
-def get_alerts(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+async def get_alerts(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
     """
-    Fetch all alerts for the current user.
+    Fetch alerts for the current user, newest first (keyset-paginated).
     """
-    return db.query(Notification).filter(Notification.user_id == current_user.id).all()
+    stmt = paginate(select(Notification).filter(Notification.user_id == current_user.id), page, ALERT_KEYS, descending=True)
+    if page.streaming:
+        return stream_ndjson_async(stmt, NotificationResponse)
+    result = await db.execute(stmt)
+    return finalize_page(result.scalars().all(), page, ALERT_KEYS, request, response)
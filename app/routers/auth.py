@@ -1,75 +1,122 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import timedelta
-from passlib.context import CryptContext
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-import secrets
-from app.security import get_password_hash, verify_password
-from app.database import get_db
+from jose import JWTError
+from app.security import issue_tokens, decode_token, password_fingerprint, tokens_enabled, REFRESH_TOKEN_TYPE
+from app.database import get_db, get_async_db
 from app.models import User
-from app.schemas import UserCreate, ResetPasswordRequest, ResetPasswordConfirm
+from app.schemas import UserCreate, UserLogin, ResetPasswordRequest, ResetPasswordConfirm, Token, TokenRefresh
+from app.dependencies import invalidate_credentials, invalidate_user, rehash_password
+from app.service import password_service
+from app.service import reset_token_service
+from app.service.reset_token_service import RateLimited
+from app.service.notification_service import enqueue_email
 
 # HTTP Basic Auth
 security = HTTPBasic()
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Authentication router
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-def get_current_user(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == credentials.username).first()
-    if not user or not verify_password(credentials.password, user.hashed_password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+def require_tokens():
+    if not tokens_enabled():
+        raise HTTPException(status_code=503, detail="Token authentication is disabled: SECRET_KEY is not configured")
+
+async def authenticate(db: AsyncSession, username: str, password: str) -> User:
+    """
+    Check a username/password pair (bcrypt runs in the password worker pool).
+
+    Upgrades the stored hash when BCRYPT_ROUNDS has changed since it was made.
+    """
+    user = (await db.execute(select(User).where(User.username == username).limit(1))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await password_service.verify_password(password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash is not None:
+        await rehash_password(db, user, new_hash)
+        await db.refresh(user)
     return user
 
 @router.post("/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.username == user.username).first():
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if (await db.execute(select(User.id).where(User.username == user.username).limit(1))).first():
         raise HTTPException(status_code=400, detail="Username already exists")
-    hashed_pw = get_password_hash(user.password)
+    hashed_pw = await password_service.hash_password(user.password)
     new_user = User(username=user.username, email=user.email, hashed_password=hashed_pw)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return {"message": "User registered successfully"}
 
 @router.get("/login")
-def login(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == credentials.username).first()
-    if not user or not verify_password(credentials.password, user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+async def login(credentials: HTTPBasicCredentials = Depends(security), db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate(db, credentials.username, credentials.password)
     return {"message": f"Welcome, {user.username}! You are logged in."}
 
-# Forget Password API
-reset_tokens = {}  # Temporary storage for reset tokens
+@router.post("/token", response_model=Token)
+async def login_for_token(credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    """
+    Verify the password once and issue an access/refresh token pair.
+    """
+    require_tokens()
+    user = await authenticate(db, credentials.username, credentials.password)
+    return issue_tokens(user)
 
+@router.post("/refresh", response_model=Token)
+def refresh_token(request: TokenRefresh, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new token pair (rotated on every use).
+    """
+    require_tokens()
+    try:
+        payload = decode_token(request.refresh_token, expected_type=REFRESH_TOKEN_TYPE)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    user = db.query(User).filter(User.id == payload.get("uid")).first()
+    # Refresh tokens issued before a password change are rejected
+    if not user or payload.get("pwd") != password_fingerprint(user.hashed_password):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return issue_tokens(user)
+
+# Forget Password API
 @router.post("/forgot-password")
-def forgot_password(request: ResetPasswordRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def forgot_password(request: ResetPasswordRequest, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == request.email).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    reset_token = secrets.token_urlsafe(32)
-    reset_tokens[user.email] = reset_token
+    try:
+        reset_token = reset_token_service.reset_token_store.issue(user.email)
+    except RateLimited as exc:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many password reset requests",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
     reset_link = f"http://localhost:8000/auth/reset-password?token={reset_token}"
     
-    # Simulate sending an email
-    background_tasks.add_task(print, f"Reset your password using this link: {reset_link}")
+    # Sent by the delivery worker, outside this request
+    enqueue_email(db, user.email, "Password reset", f"Reset your password using this link: {reset_link}")
     return {"message": "Password reset link sent to your email"}
 
 @router.post("/reset-password")
-def reset_password(confirm: ResetPasswordConfirm, db: Session = Depends(get_db)):
-    for email, token in reset_tokens.items():
-        if token == confirm.token:
-            user = db.query(User).filter(User.email == email).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            user.hashed_password = get_password_hash(confirm.new_password)
-            db.commit()
-            del reset_tokens[email]
-            return {"message": "Password has been reset successfully"}
-    
-    raise HTTPException(status_code=400, detail="Invalid or expired token")
+async def reset_password(confirm: ResetPasswordConfirm, db: AsyncSession = Depends(get_async_db)):
+    email = await run_in_threadpool(reset_token_service.reset_token_store.consume, confirm.token)
+    if email is None:
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
+
+    user = (await db.execute(select(User).where(User.email == email).limit(1))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    user.hashed_password = await password_service.hash_password(confirm.new_password)
+    await db.commit()
+    invalidate_credentials(user.username)
+    invalidate_user(user.id)
+    return {"message": "Password has been reset successfully"}
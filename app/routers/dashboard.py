@@ -1,38 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from typing import List
 from app.database import get_db
-from app.models import Device, User
-from app.schemas import DeviceResponse
-from app.utils import verify_password
+from app.schemas import DashboardSummary
+from app.dependencies import get_current_user
+from app.service.dashboard_service import dashboard_cache, render
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
-security = HTTPBasic()  # Initialize HTTP Basic authentication
 
-def get_current_user(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
+@router.get("/", response_model=DashboardSummary)
+def get_dashboard_data(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     """
-    Authenticate user using HTTP Basic Authentication.
-    """
-    user = db.query(User).filter(User.username == credentials.username).first()
-    
-    if user is None or not verify_password(credentials.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid username or password",
-            headers={"WWW-Authenticate": "Basic"},
-        )
-    
-    return user
+    Summary of the authenticated user's systems, devices, unread alerts and latest readings.
 
-@router.get("/", response_model=List[DeviceResponse])
-def get_dashboard_data(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """
-    Fetch all devices owned by the authenticated user and return their data.
+    Served from a per-user snapshot that writes invalidate and ingestion keeps current.
     """
-    devices = db.query(Device).filter(Device.owner_id == current_user.id).all()
-    
-    if not devices:
-        raise HTTPException(status_code=404, detail="No devices found for the user")
-    
-    return devices
+    return render(dashboard_cache.get(db, current_user.id))
@@ -1,29 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models import DeviceInput, User
 from app.schemas import DeviceInputCreate, DeviceInputResponse
-from app.utils import verify_password
+from app.dependencies import get_current_user
+from app.pagination import PageParams, paginate, finalize_page, stream_ndjson_async
+from app.service.alert_service import alert_engine
+from app.service.device_registry import device_registry, invalidate_devices
+from app.response_cache import invalidate_responses
 
 router = APIRouter(prefix="/device-input", tags=["Device Input Management"])
-security = HTTPBasic()  # Initialize HTTP Basic authentication
 
-def get_current_user(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
+def require_owned_device(device_id: int, owner_id: int) -> None:
     """
-    Authenticate user using HTTP Basic Authentication.
+    404 unless `owner_id` owns the device: a threshold on another user's
+    device would send them alerts about its readings.
     """
-    user = db.query(User).filter(User.username == credentials.username).first()
-    
-    if user is None or not verify_password(credentials.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid username or password",
-            headers={"WWW-Authenticate": "Basic"},
-        )
-    
-    return user
+    if device_registry.unowned({device_id}, owner_id):
+        # Possibly a device created since the registry last loaded
+        device_registry.refresh_devices({device_id})
+        if device_registry.unowned({device_id}, owner_id):
+            raise HTTPException(status_code=404, detail="Device not found")
 
 @router.post("/", response_model=DeviceInputResponse)
 def add_device_input(
@@ -34,21 +34,32 @@ def add_device_input(
     """
     Add a new device input (threshold settings like max/min values).
     """
+    require_owned_device(device_input.device_id, current_user.id)
     new_input = DeviceInput(**device_input.dict(), owner_id=current_user.id)
     db.add(new_input)
     db.commit()
     db.refresh(new_input)
+    invalidate_devices([new_input.device_id])
+    invalidate_responses(current_user.id, "device_inputs")
+    alert_engine.upsert_rule(new_input)
     return new_input
 
 @router.get("/", response_model=List[DeviceInputResponse])
-def get_device_inputs(
-    db: Session = Depends(get_db), 
+async def get_device_inputs(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db), 
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get all device input settings for the authenticated user.
+    Get the device input settings for the authenticated user (keyset-paginated by id).
     """
-    return db.query(DeviceInput).filter(DeviceInput.owner_id == current_user.id).all()
+    stmt = paginate(select(DeviceInput).filter(DeviceInput.owner_id == current_user.id), page, (DeviceInput.id,))
+    if page.streaming:
+        return stream_ndjson_async(stmt, DeviceInputResponse)
+    result = await db.execute(stmt)
+    return finalize_page(result.scalars().all(), page, (DeviceInput.id,), request, response)
 
 @router.put("/{input_id}", response_model=DeviceInputResponse)
 def update_device_input(
@@ -63,12 +74,17 @@ def update_device_input(
     device_input = db.query(DeviceInput).filter(DeviceInput.id == input_id, DeviceInput.owner_id == current_user.id).first()
     if not device_input:
         raise HTTPException(status_code=404, detail="Device input setting not found")
+    require_owned_device(device_input_update.device_id, current_user.id)
 
+    previous_device_id = device_input.device_id
     for key, value in device_input_update.dict().items():
         setattr(device_input, key, value)
     
     db.commit()
     db.refresh(device_input)
+    invalidate_devices({previous_device_id, device_input.device_id})
+    invalidate_responses(current_user.id, "device_inputs")
+    alert_engine.upsert_rule(device_input)
     return device_input
 
 @router.delete("/{input_id}")
@@ -84,6 +100,10 @@ def delete_device_input(
     if not device_input:
         raise HTTPException(status_code=404, detail="Device input setting not found")
 
+    device_id = device_input.device_id
     db.delete(device_input)
     db.commit()
+    invalidate_devices([device_id])
+    invalidate_responses(current_user.id, "device_inputs")
+    alert_engine.remove_rule(input_id)
     return {"message": "Device input setting deleted successfully"}
@@ -1,47 +1,150 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import List, Literal, Optional
+from datetime import datetime
 from app.database import get_db
-from app.models import Device, DeviceInput
-from app.schemas import DeviceResponse, DeviceInputResponse
+from app.service import timeseries_service
+from app.models import Device, DeviceInput, IoTData, System
+from app.schemas import DeviceListItem, DeviceInputResponse, ReadingResponse, ReadingAggregate
 from app.dependencies import get_current_user
+from app.pagination import PageParams, paginate, finalize_page, stream_ndjson
+from app.service.device_registry import device_registry
+from app.service import export_service
+from app.service.reading_query_service import (
+    MAX_HISTOGRAM_BUCKETS, MAX_PERCENTILES, aggregate_readings, reading_conditions,
+)
 
 router = APIRouter(prefix="/filter", tags=["Filtering"])
 
-@router.get("/devices", response_model=List[DeviceResponse])
+# Upper bound on explicitly requested devices per readings query
+MAX_FILTER_DEVICES = 1000
+
+@router.get("/devices", response_model=List[DeviceListItem])
 def filter_devices(
-    device_type: Optional[str] = Query(None, description="Filter by device type"),
-    registered_after: Optional[datetime] = Query(None, description="Filter by registration date"),
+    request: Request,
+    response: Response,
+    name: Optional[str] = Query(None, description="Filter by device name prefix"),
+    system_id: Optional[int] = Query(None, description="Filter by system ID"),
+    status: Optional[bool] = Query(None, description="Filter by enabled/disabled status"),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
     """
-    Filter devices based on type and registration date.
+    Filter the user's devices by name prefix, system and status.
+    """
+    query = select(Device).join(System).filter(System.owner_id == current_user.id)
+
+    if name:
+        query = query.filter(Device.name.startswith(name, autoescape=True))
+
+    if system_id is not None:
+        query = query.filter(Device.system_id == system_id)
+
+    if status is not None:
+        query = query.filter(Device.status.is_(status))
+
+    stmt = paginate(query, page, (Device.id,))
+    if page.streaming:
+        return stream_ndjson(stmt, DeviceListItem)
+    return finalize_page(db.scalars(stmt).all(), page, (Device.id,), request, response)
+
+class ReadingFilter:
+    """
+    Query parameters shared by the readings endpoints (use as `Depends()`).
     """
-    query = db.query(Device).filter(Device.owner_id == current_user.id)
 
-    if device_type:
-        query = query.filter(Device.type == device_type)
+    def __init__(
+        self,
+        device_id: Optional[List[int]] = Query(None, description="Device IDs (repeatable); default all of the user's devices"),
+        parameter: Optional[str] = Query(None, description="Filter by parameter"),
+        start: Optional[datetime] = Query(None, description="Readings at or after this time"),
+        end: Optional[datetime] = Query(None, description="Readings before this time"),
+        min_value: Optional[float] = Query(None, description="Filter values greater than or equal to this"),
+        max_value: Optional[float] = Query(None, description="Filter values less than or equal to this"),
+        current_user=Depends(get_current_user),
+    ):
+        if device_id is None:
+            device_ids = {device.id for device in device_registry.devices_of(current_user.id)}
+        else:
+            device_ids = set(device_id)
+            if len(device_ids) > MAX_FILTER_DEVICES:
+                raise HTTPException(status_code=400, detail=f"At most {MAX_FILTER_DEVICES} device IDs per query")
+            unowned = device_registry.unowned(device_ids, current_user.id)
+            if unowned:
+                device_registry.refresh_devices(unowned)
+                if device_registry.unowned(unowned, current_user.id):
+                    raise HTTPException(status_code=404, detail="Device not found")
+        self.device_ids = sorted(device_ids)
+        self.conditions = reading_conditions(
+            self.device_ids, parameter,
+            timeseries_service.to_naive_utc(start) if start else None,
+            timeseries_service.to_naive_utc(end) if end else None,
+            min_value, max_value,
+        )
 
-    if registered_after:
-        query = query.filter(Device.created_at >= registered_after)
+@router.get("/readings", response_model=List[ReadingResponse])
+def filter_readings(
+    request: Request,
+    response: Response,
+    readings: ReadingFilter = Depends(),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db),
+):
+    """
+    Filter sensor readings by device, parameter, time range and value range
+    (keyset-paginated by device and time).
+    """
+    keys = (IoTData.device_id, IoTData.timestamp, IoTData.id)
+    if not readings.device_ids:
+        return []
+    stmt = paginate(select(IoTData).where(*readings.conditions), page, keys)
+    if page.streaming:
+        return stream_ndjson(stmt, ReadingResponse)
+    return finalize_page(db.scalars(stmt).all(), page, keys, request, response)
 
-    return query.all()
+@router.get("/readings/aggregate", response_model=List[ReadingAggregate])
+def aggregate_filtered_readings(
+    readings: ReadingFilter = Depends(),
+    group_by: List[Literal["device", "parameter"]] = Query([], description="Group results (repeatable)"),
+    percentile: List[float] = Query([], description=f"Percentiles to compute, 0-100 (repeatable, at most {MAX_PERCENTILES})"),
+    buckets: Optional[int] = Query(None, ge=1, le=MAX_HISTOGRAM_BUCKETS, description="Histogram bucket count"),
+    histogram_min: Optional[float] = Query(None, description="Histogram lower bound (default: smallest value)"),
+    histogram_max: Optional[float] = Query(None, description="Histogram upper bound (default: largest value)"),
+    db: Session = Depends(get_db),
+):
+    """
+    Aggregate filtered readings in the database: count, min, max and average,
+    plus optional percentiles and equal-width histogram buckets, per group.
+    """
+    if len(percentile) > MAX_PERCENTILES or any(not 0 <= p <= 100 for p in percentile):
+        raise HTTPException(status_code=400, detail=f"Up to {MAX_PERCENTILES} percentiles between 0 and 100")
+    if histogram_min is not None and histogram_max is not None and histogram_max < histogram_min:
+        raise HTTPException(status_code=400, detail="histogram_max must not be below histogram_min")
+    if not readings.device_ids:
+        return []
+    return aggregate_readings(
+        db, readings.conditions, list(dict.fromkeys(group_by)), percentile, buckets, histogram_min, histogram_max,
+    )
 
 @router.get("/device-inputs", response_model=List[DeviceInputResponse])
 def filter_device_inputs(
+    request: Request,
+    response: Response,
     device_id: Optional[int] = Query(None, description="Filter by device ID"),
     parameter: Optional[str] = Query(None, description="Filter by parameter type"),
     min_value: Optional[float] = Query(None, description="Filter values greater than this"),
     max_value: Optional[float] = Query(None, description="Filter values less than this"),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
     """
     Filter device input settings based on parameters.
     """
-    query = db.query(DeviceInput).filter(DeviceInput.owner_id == current_user.id)
+    query = select(DeviceInput).filter(DeviceInput.owner_id == current_user.id)
 
     if device_id:
         query = query.filter(DeviceInput.device_id == device_id)
@@ -55,4 +158,28 @@ def filter_device_inputs(
     if max_value is not None:
         query = query.filter(DeviceInput.max_value <= max_value)
 
-    return query.all()
+    stmt = paginate(query, page, (DeviceInput.id,))
+    if page.streaming:
+        return stream_ndjson(stmt, DeviceInputResponse)
+    return finalize_page(db.scalars(stmt).all(), page, (DeviceInput.id,), request, response)
+
+@router.get("/readings/export")
+def export_readings(
+    readings: ReadingFilter = Depends(),
+    format: Literal["csv", "ndjson", "arrow", "parquet"] = Query("csv", description="arrow/parquet need pyarrow on the server"),
+    compression: Literal["none", "gzip"] = Query("none", description="gzip the stream (Parquet: compress pages)"),
+):
+    """
+    Download every filtered reading, fetched in keyset-paginated chunks and
+    encoded chunk by chunk.
+    """
+    try:
+        export_service.check_format(format, compression)
+    except export_service.UnsupportedFormat as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    filename = export_service.export_filename(format, compression)
+    return StreamingResponse(
+        export_service.export_readings(readings.conditions, format, compression),
+        media_type="application/gzip" if filename.endswith(".gz") else export_service.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,7 +1,108 @@
-from fastapi import APIRouter
+import json
+from datetime import datetime
+from typing import List, Optional
 
-router = APIRouter()
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-@router.post("/iot-data/")
-async def insert_iot_data(data: dict):
-    return {"message": "IoT data inserted successfully"}
+from app.database import get_async_db
+from app.schemas import IoTReadingCreate, IoTIngestResponse, SeriesResponse
+from app.dependencies import get_current_user
+from app.service.ingestion_service import ingestion_buffer, BufferFull
+from app.service.device_registry import find_unowned
+from app.service import timeseries_service
+
+router = APIRouter(prefix="/iot-data", tags=["IoT Data"])
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+_readings_adapter = TypeAdapter(List[IoTReadingCreate])
+
+
+def _parse_body(body: bytes, content_type: str) -> list:
+    """
+    Decode a JSON array/object or an NDJSON body into a list of raw readings.
+    """
+    try:
+        if content_type.split(";")[0].strip().lower() in NDJSON_MEDIA_TYPES:
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed JSON body")
+    return payload if isinstance(payload, list) else [payload]
+
+
+@router.post("/", response_model=IoTIngestResponse, status_code=status.HTTP_202_ACCEPTED)
+async def insert_iot_data(request: Request, current_user=Depends(get_current_user)):
+    """
+    Ingest a batch of sensor readings (JSON array or NDJSON).
+
+    Readings are validated, checked for device ownership and queued in the
+    write buffer; they are persisted asynchronously in multi-row inserts.
+    """
+    raw = _parse_body(await request.body(), request.headers.get("content-type", ""))
+    if len(raw) > ingestion_buffer.max_rows:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {ingestion_buffer.max_rows} readings")
+
+    try:
+        readings = _readings_adapter.validate_python(raw)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors(include_url=False, include_context=False, include_input=False))
+    if not readings:
+        return {"accepted": 0, "buffered": ingestion_buffer.depth}
+
+    unowned = await find_unowned({r.device_id for r in readings}, current_user.id)
+    if unowned:
+        raise HTTPException(status_code=403, detail=f"Unknown or unauthorized device ids: {sorted(unowned)}")
+
+    received_at = datetime.utcnow()
+    rows = [
+        {
+            "device_id": r.device_id,
+            "parameter": r.parameter,
+            "sensor_value": r.sensor_value,
+            "timestamp": timeseries_service.to_naive_utc(r.timestamp) if r.timestamp else received_at,
+        }
+        for r in readings
+    ]
+    try:
+        depth = ingestion_buffer.submit(rows)
+    except BufferFull as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+    return {"accepted": len(rows), "buffered": depth}
+
+
+@router.get("/series", response_model=SeriesResponse)
+async def get_series(
+    device_id: int,
+    parameter: str,
+    start: datetime,
+    end: datetime,
+    step: Optional[int] = Query(None, ge=1, description="Desired seconds per point"),
+    max_points: int = Query(500, ge=1, le=10_000, description="Upper bound on returned points"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Downsampled readings for one device parameter.
+
+    Served from the coarsest rollup (1m/1h/1d) that still satisfies the
+    requested step, falling back to raw readings for sub-minute steps.
+    """
+    start, end = timeseries_service.to_naive_utc(start), timeseries_service.to_naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    if await find_unowned({device_id}, current_user.id):
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    source, step = timeseries_service.plan_query(start, end, step, max_points)
+    result = await db.execute(timeseries_service.series_statement(device_id, parameter, start, end, source))
+    return {
+        "device_id": device_id,
+        "parameter": parameter,
+        "step": step,
+        "source": timeseries_service.RESOLUTION_NAMES[source],
+        "points": timeseries_service.downsample(result.all(), step),
+    }
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Response
+
+from app.metrics import CONTENT_TYPE, registry
+
+# Mounted without the auth dependency so Prometheus can scrape it
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    All metrics in the Prometheus text format.
+    """
+    return Response(registry.render(), media_type=CONTENT_TYPE)
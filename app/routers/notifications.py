@@ -1,19 +1,104 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models import Notification
-from app.schemas import NotificationResponse
+from app.schemas import NotificationResponse, NotificationIds, BulkUpdateResult
 from app.dependencies import get_current_user
+from app.pagination import PageParams, paginate, finalize_page, stream_ndjson_async
+from app.service.timeseries_service import to_naive_utc
+from app.service.dashboard_service import invalidate_dashboard
+from app.response_cache import invalidate_responses
 from typing import List
 
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
 
+# Newest first: ids are assigned in creation order, so they double as the time key
+NOTIFICATION_KEYS = (Notification.id,)
+
 @router.get("/", response_model=List[NotificationResponse])
-def get_notifications(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+async def get_notifications(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Fetch unread notifications for the current user, newest first (keyset-paginated).
+    """
+    stmt = paginate(
+        select(Notification).filter(Notification.user_id == current_user.id, Notification.is_read == False),
+        page, NOTIFICATION_KEYS, descending=True,
+    )
+    if page.streaming:
+        return stream_ndjson_async(stmt, NotificationResponse)
+    result = await db.execute(stmt)
+    return finalize_page(result.scalars().all(), page, NOTIFICATION_KEYS, request, response)
+
+def _mark_read(db: Session, user_id: int, *criteria) -> int:
+    # One set-based UPDATE; only unread rows are touched so the count is meaningful
+    result = db.execute(
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read == False, *criteria)
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount:
+        invalidate_dashboard(user_id)
+        invalidate_responses(user_id, "notifications")
+    return result.rowcount
+
+@router.put("/read-all", response_model=BulkUpdateResult)
+def mark_all_as_read(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """
+    Mark every unread notification of the current user as read.
+    """
+    count = _mark_read(db, current_user.id)
+    return {"message": "Notifications marked as read", "count": count}
+
+@router.put("/read", response_model=BulkUpdateResult)
+def mark_many_as_read(body: NotificationIds, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """
+    Mark the given notifications as read (ids owned by other users are ignored).
+    """
+    count = _mark_read(db, current_user.id, Notification.id.in_(body.ids)) if body.ids else 0
+    return {"message": "Notifications marked as read", "count": count}
+
+@router.put("/read-before", response_model=BulkUpdateResult)
+def mark_read_before(
+    before: datetime = Query(..., description="Mark notifications created before this time"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
     """
-    Fetch all unread notifications for the current user.
+    Mark every notification created before a timestamp as read.
     """
-    return db.query(Notification).filter(Notification.user_id == current_user.id, Notification.is_read == False).all()
+    count = _mark_read(db, current_user.id, Notification.created_at < to_naive_utc(before))
+    return {"message": "Notifications marked as read", "count": count}
+
+@router.delete("/read", response_model=BulkUpdateResult)
+def delete_read(
+    older_than_days: int = Query(30, ge=0, description="Only delete read notifications older than this"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Delete the current user's read notifications older than N days.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    result = db.execute(
+        delete(Notification)
+        .where(Notification.user_id == current_user.id, Notification.is_read == True, Notification.created_at < cutoff)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount:
+        invalidate_responses(current_user.id, "notifications")
+    return {"message": "Read notifications deleted", "count": result.rowcount}
 
 @router.put("/{notification_id}/read")
 def mark_as_read(notification_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
@@ -26,4 +111,6 @@ def mark_as_read(notification_id: int, db: Session = Depends(get_db), current_us
 
     notification.is_read = True
     db.commit()
+    invalidate_dashboard(current_user.id)
+    invalidate_responses(current_user.id, "notifications")
     return {"message": "Notification marked as read"}
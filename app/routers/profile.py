@@ -3,7 +3,9 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
 from app.schemas import UserResponse, UserUpdate
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, invalidate_credentials, invalidate_user
+from app.security import get_password_hash
+from app.response_cache import invalidate_responses
 
 router = APIRouter(prefix="/profile", tags=["User Profile"])
 
@@ -20,10 +22,18 @@ def update_profile(user_update: UserUpdate, db: Session = Depends(get_db), curre
     Update the logged-in user's profile.
     """
     user = db.query(User).filter(User.id == current_user.id).first()
+    previous_username = user.username
 
-    for key, value in user_update.dict(exclude_unset=True).items():
+    update_data = user_update.dict(exclude_unset=True)
+    if "password" in update_data:
+        user.hashed_password = get_password_hash(update_data.pop("password"))
+    for key, value in update_data.items():
         setattr(user, key, value)
 
     db.commit()
+    invalidate_credentials(previous_username)
+    invalidate_credentials(user.username)
+    invalidate_user(current_user.id)
+    invalidate_responses(current_user.id, "profile")
     db.refresh(user)
     return user
@@ -0,0 +1,162 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal, get_async_engine
+from app.models import Notification
+from app.schemas import NotificationResponse
+from app.dependencies import get_current_user, user_from_authorization
+from app.service.notification_hub import notification_hub, LAGGED
+
+# Not mounted with the router-level auth dependency: WebSocket routes authenticate themselves
+router = APIRouter(prefix="/realtime", tags=["Realtime"])
+
+KEEPALIVE_SECONDS = 15
+RESUME_BACKLOG_LIMIT = 1000  # older gaps should be fetched from GET /notifications/
+
+# Close code sent to WebSocket consumers that fell behind (resume with last_id)
+WS_CLOSE_LAGGED = 4008
+
+
+class NotificationStream:
+    """
+    Live notifications for one user, optionally resuming after `last_id`.
+
+    Subscribes before reading the backlog so nothing created in between is
+    missed; duplicates are filtered by id. `next()` returns an event dict,
+    None when a keepalive is due, or LAGGED if the consumer fell behind.
+    """
+
+    def __init__(self, user_id: int, last_id: Optional[int] = None):
+        self.user_id = user_id
+        self.last_id = last_id
+        self._backlog = []
+
+    async def __aenter__(self):
+        self._subscription = notification_hub.subscribe(self.user_id)
+        if self.last_id is not None:
+            get_async_engine()
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(Notification)
+                    .where(Notification.user_id == self.user_id, Notification.id > self.last_id)
+                    .order_by(Notification.id)
+                    .limit(RESUME_BACKLOG_LIMIT)
+                )
+                self._backlog = [self._event(n) for n in result.scalars()]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        notification_hub.unsubscribe(self._subscription)
+
+    @staticmethod
+    def _event(notification: Notification) -> dict:
+        return {column: getattr(notification, column) for column in NotificationResponse.model_fields}
+
+    async def next(self):
+        if self._backlog:
+            event = self._backlog.pop(0)
+        else:
+            while True:
+                try:
+                    event = await self._subscription.get(KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    return None
+                if event is LAGGED or self.last_id is None or event["id"] > self.last_id:
+                    break
+        if event is not LAGGED:
+            self.last_id = event["id"]
+        return event
+
+
+def _serialize(event: dict) -> str:
+    return NotificationResponse.model_validate(event).model_dump_json()
+
+
+@router.get("/notifications/sse")
+async def notification_events(
+    request: Request,
+    last_id: Optional[int] = Query(None, description="Resume after this notification id"),
+    last_event_id: Optional[str] = Header(None),
+    current_user=Depends(get_current_user),
+):
+    """
+    Server-Sent Events stream of the current user's new notifications.
+
+    Reconnecting browsers resume automatically through the Last-Event-ID header.
+    """
+    if last_id is None and last_event_id and last_event_id.isdigit():
+        last_id = int(last_event_id)
+
+    async def stream():
+        async with NotificationStream(current_user.id, last_id) as events:
+            while not await request.is_disconnected():
+                event = await events.next()
+                if event is None:
+                    yield ": keepalive\n\n"
+                elif event is LAGGED:
+                    yield "event: lagged\ndata: {}\n\n"
+                    return
+                else:
+                    yield f"id: {event['id']}\nevent: notification\ndata: {_serialize(event)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _wait_closed(websocket: WebSocket) -> None:
+    # Client messages are ignored; this only notices the disconnect
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+@router.websocket("/notifications/ws")
+async def notification_socket(
+    websocket: WebSocket,
+    last_id: Optional[int] = None,
+    token: Optional[str] = None,
+):
+    """
+    WebSocket stream of the current user's new notifications.
+
+    Authenticates with the Authorization header, or `?token=<access token>`
+    for browser clients that cannot set headers.
+    """
+    authorization = websocket.headers.get("authorization") or (f"Bearer {token}" if token else None)
+    get_async_engine()
+    try:
+        async with AsyncSessionLocal() as db:
+            current_user = await user_from_authorization(authorization, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    closed = asyncio.ensure_future(_wait_closed(websocket))
+    try:
+        async with NotificationStream(current_user.id, last_id) as events:
+            while True:
+                pending = asyncio.ensure_future(events.next())
+                await asyncio.wait((pending, closed), return_when=asyncio.FIRST_COMPLETED)
+                if closed.done():
+                    pending.cancel()
+                    return
+                event = pending.result()
+                if event is None:
+                    await websocket.send_text(json.dumps({"type": "keepalive"}))
+                elif event is LAGGED:
+                    await websocket.close(code=WS_CLOSE_LAGGED, reason="lagged")
+                    return
+                else:
+                    await websocket.send_text(f'{{"type": "notification", "data": {_serialize(event)}}}')
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
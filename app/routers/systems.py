@@ -1,14 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
-from app.models import System
-from app.schemas import SystemCreate, SystemResponse
+from typing import List, Literal, Optional
+from app.database import get_db, get_async_db
+from app.models import Device, System
+from app.schemas import SystemCreate, SystemResponse, SystemTree, DeviceInputNode, ImportResult
 from app.dependencies import get_current_user
-from app.routers import __init__
+from app.pagination import PageParams, paginate, finalize_page, stream_ndjson_async
+from app.service.alert_service import alert_engine
+from app.service.dashboard_service import invalidate_dashboard
+from app.service.device_registry import invalidate_devices
+from app.service import provisioning_service
+from app.response_cache import invalidate_responses
 
 router = APIRouter(prefix="/system", tags=["System Management"])
 
+# Loader options per (expand, load) profile; collections never lazy-load.
+# "joined" pulls the deepest level in with its parent's query, so a page costs
+# one query per level at most. "selectin" keeps rows narrow but issues one
+# IN query per 500 parents at each level.
+TREE_LOAD_PROFILES = {
+    ("devices", "selectin"): (selectinload(System.devices),),
+    ("devices", "joined"): (joinedload(System.devices),),
+    ("devices.inputs", "selectin"): (selectinload(System.devices).selectinload(Device.device_inputs),),
+    ("devices.inputs", "joined"): (selectinload(System.devices).joinedload(Device.device_inputs),),
+}
+
 def some_function():
     from app.routers import dashboard  # Import inside function
     return dashboard.some_function()
@@ -22,14 +44,104 @@ def add_system(system: SystemCreate, db: Session = Depends(get_db), current_user
     db.add(new_system)
     db.commit()
     db.refresh(new_system)
+    invalidate_dashboard(current_user.id)
+    invalidate_responses(current_user.id, "systems")
     return new_system
 
+@router.post("/import", response_model=ImportResult)
+async def import_systems(
+    request: Request,
+    atomic: bool = Query(True, description="Reject the whole import if any item is invalid"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Provision systems, their devices and device inputs in one call.
+
+    Takes {"systems": [{..., "devices": [{..., "inputs": [...]}]}]} as JSON, or
+    CSV (`Content-Type: text/csv`, one row per device input) and inserts
+    everything in one transaction. Returns a result per item.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").split(";")[0].strip().lower() == "text/csv":
+            site = provisioning_service.site_from_csv(body.decode("utf-8-sig"))
+        else:
+            try:
+                site = json.loads(body)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Malformed JSON body")
+        result = await run_in_threadpool(provisioning_service.import_site, db, current_user.id, site, atomic)
+    except provisioning_service.ImportTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if result["invalid"] and atomic:
+        raise HTTPException(status_code=422, detail=result)
+    return result
+
 @router.get("/", response_model=List[SystemResponse])
-def get_systems(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+async def get_systems(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Get the IoT systems owned by the authenticated user (keyset-paginated by id).
+    """
+    stmt = paginate(select(System).filter(System.owner_id == current_user.id), page, (System.id,))
+    if page.streaming:
+        return stream_ndjson_async(stmt, SystemResponse)
+    result = await db.execute(stmt)
+    return finalize_page(result.scalars().all(), page, (System.id,), request, response)
+
+def _tree_node(system: System, expand: Optional[str]) -> dict:
+    # Built by hand so relationships that were not eager-loaded are never touched
+    node = {
+        "id": system.id, "name": system.name, "description": system.description,
+        "widget_type": system.widget_type, "owner_id": system.owner_id, "devices": None,
+    }
+    if expand:
+        node["devices"] = [
+            {
+                "id": device.id, "name": device.name, "status": bool(device.status),
+                "device_inputs": [
+                    DeviceInputNode.model_validate(device_input, from_attributes=True)
+                    for device_input in device.device_inputs
+                ] if expand == "devices.inputs" else None,
+            }
+            for device in system.devices
+        ]
+    return node
+
+@router.get("/tree", response_model=List[SystemTree])
+async def get_system_tree(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    expand: Optional[Literal["devices", "devices.inputs"]] = Query(None, description="How deep to load the hierarchy"),
+    load: Literal["selectin", "joined"] = Query("joined", description="Eager-loading strategy for the expanded levels"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
     """
-    Get all IoT systems owned by the authenticated user.
+    Get the user's systems with their devices and device inputs nested (keyset-paginated by id).
     """
-    return db.query(System).filter(System.owner_id == current_user.id).all()
+    if page.streaming and load == "joined":
+        # Joined collection loads cannot be combined with a server-side cursor
+        load = "selectin"
+    stmt = select(System).filter(System.owner_id == current_user.id)
+    if expand:
+        stmt = stmt.options(*TREE_LOAD_PROFILES[expand, load])
+    stmt = paginate(stmt, page, (System.id,))
+    if page.streaming:
+        return stream_ndjson_async(stmt, SystemTree, lambda system: _tree_node(system, expand))
+    result = await db.execute(stmt)
+    systems = result.unique().scalars().all()
+    rows = finalize_page(systems, page, (System.id,), request, response)
+    return [_tree_node(system, expand) for system in rows]
 
 @router.put("/{system_id}", response_model=SystemResponse)
 def update_system(system_id: int, system_update: SystemCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
@@ -45,6 +157,8 @@ def update_system(system_id: int, system_update: SystemCreate, db: Session = Dep
     
     db.commit()
     db.refresh(system)
+    invalidate_dashboard(current_user.id)
+    invalidate_responses(current_user.id, "systems")
     return system
 
 @router.delete("/{system_id}")
@@ -56,6 +170,11 @@ def delete_system(system_id: int, db: Session = Depends(get_db), current_user=De
     if not system:
         raise HTTPException(status_code=404, detail="System not found")
 
+    device_ids = [device.id for device in system.devices]
     db.delete(system)
     db.commit()
+    invalidate_devices(device_ids)
+    alert_engine.remove_devices(device_ids)
+    invalidate_dashboard(current_user.id)
+    invalidate_responses(current_user.id, "systems", "device_inputs")
     return {"message": "System deleted successfully"}
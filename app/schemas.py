@@ -1,6 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel,EmailStr
-from typing import Optional
+from pydantic import BaseModel,EmailStr,Field,model_validator
+from typing import Dict, List, Literal, Optional
 class UserCreate(BaseModel):
     username: str
     email: EmailStr
@@ -29,6 +29,11 @@ class UserUpdate(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel): 
     email: Optional[str] = None
@@ -53,6 +58,26 @@ class SystemResponse(SystemCreate):
         orm_mode = True
 
 
+class DeviceInputNode(BaseModel):
+    id: int
+    parameter: str
+    min_value: float
+    max_value: float
+    alert_enabled: bool
+
+    class Config:
+        orm_mode = True
+
+class DeviceNode(BaseModel):
+    id: int
+    name: str
+    status: bool
+    device_inputs: Optional[List[DeviceInputNode]] = None  # None unless expanded
+
+class SystemTree(SystemResponse):
+    devices: Optional[List[DeviceNode]] = None  # None unless expanded
+
+
 class DeviceInputCreate(BaseModel):
     device_id: int
     parameter: str  # e.g., "Temperature", "Humidity"
@@ -60,6 +85,41 @@ class DeviceInputCreate(BaseModel):
     max_value: float
     alert_enabled: bool
 
+class SystemImport(BaseModel):
+    name: str = Field(..., max_length=50)
+    description: Optional[str] = Field(None, max_length=255)
+    widget_type: str = Field(..., max_length=50)
+    devices: List[dict] = []  # DeviceImport items, validated one by one
+
+class DeviceImport(BaseModel):
+    name: str = Field(..., max_length=100)
+    status: bool = True
+    inputs: List[dict] = []  # DeviceInputImport items, validated one by one
+
+class DeviceInputImport(BaseModel):
+    parameter: str = Field(..., max_length=50)
+    min_value: float
+    max_value: float
+    alert_enabled: bool = True
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.min_value > self.max_value:
+            raise ValueError("min_value must not exceed max_value")
+        return self
+
+class ImportItemResult(BaseModel):
+    path: str  # e.g. "systems[0].devices[2].inputs[1]"
+    kind: Literal["system", "device", "device_input"]
+    status: Literal["created", "invalid", "skipped"]
+    id: Optional[int] = None
+    errors: Optional[List[str]] = None
+
+class ImportResult(BaseModel):
+    created: Dict[str, int]  # rows inserted per kind
+    invalid: int
+    items: List[ImportItemResult]
+
 class DeviceInputResponse(DeviceInputCreate):
     id: int
     owner_id: int
@@ -67,6 +127,13 @@ class DeviceInputResponse(DeviceInputCreate):
     class Config:
         orm_mode = True
 
+class NotificationIds(BaseModel):
+    ids: List[int] = Field(..., max_length=10_000)
+
+class BulkUpdateResult(BaseModel):
+    message: str
+    count: int
+
 class NotificationResponse(BaseModel):
     id: int
     message: str
@@ -86,4 +153,116 @@ class DeviceResponse(DeviceCreate):
     owner_id: int
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class DeviceListItem(BaseModel):
+    id: int
+    name: str
+    system_id: int
+    status: bool
+
+    class Config:
+        orm_mode = True
+
+class ReadingResponse(BaseModel):
+    id: int
+    device_id: int
+    parameter: str
+    sensor_value: float
+    timestamp: datetime
+
+    class Config:
+        orm_mode = True
+
+class Histogram(BaseModel):
+    lower: float
+    upper: float
+    bucket_width: float
+    counts: List[int]
+
+class ReadingAggregate(BaseModel):
+    device_id: Optional[int] = None  # Set when grouped by device
+    parameter: Optional[str] = None  # Set when grouped by parameter
+    count: int
+    min_value: float
+    max_value: float
+    avg_value: float
+    percentiles: Dict[str, float] = {}  # e.g. {"p50": 21.5, "p99": 30.1}
+    histogram: Optional[Histogram] = None
+
+class IoTReadingCreate(BaseModel):
+    device_id: int
+    parameter: str = Field(..., max_length=50)  # Must match a DeviceInput parameter to be checked for alerts
+    sensor_value: float = Field(..., allow_inf_nan=False)
+    timestamp: Optional[datetime] = None  # Defaults to the time the batch is accepted
+
+class IoTIngestResponse(BaseModel):
+    accepted: int
+    buffered: int
+
+class SeriesPoint(BaseModel):
+    bucket_start: datetime
+    min_value: float
+    max_value: float
+    avg_value: float
+    count: int
+
+class SeriesResponse(BaseModel):
+    device_id: int
+    parameter: str
+    step: int  # Seconds per point
+    source: str  # "raw", "1m", "1h" or "1d"
+    points: List[SeriesPoint]
+class LatestReading(BaseModel):
+    parameter: str
+    sensor_value: float
+    timestamp: datetime
+
+class DashboardDevice(BaseModel):
+    id: int
+    name: str
+    status: bool
+    online: bool
+    last_seen: Optional[datetime] = None
+    latest_readings: List[LatestReading]
+
+class DashboardSystem(BaseModel):
+    id: int
+    name: str
+    widget_type: str
+    device_count: int
+    online_count: int
+    devices: List[DashboardDevice]
+
+class DashboardSummary(BaseModel):
+    system_count: int
+    device_count: int
+    online_count: int
+    offline_count: int
+    unread_alerts: int
+    generated_at: datetime
+    systems: List[DashboardSystem]
+
+class RetentionPolicyUpdate(BaseModel):
+    table_name: Literal["iot_data", "notifications"]
+    owner_id: int
+    days: int = Field(ge=0)  # 0 keeps the tenant's rows forever
+
+class RetentionPolicyResponse(RetentionPolicyUpdate):
+    class Config:
+        orm_mode = True
+
+class RetentionTableReport(BaseModel):
+    table: str
+    default_days: int
+    overrides: Dict[int, int]  # owner_id -> days
+    rows_deleted: int
+    partitions_dropped: List[str]
+    partitions_created: List[str]
+    partition_rows_dropped: int  # estimate from the table statistics
+
+class RetentionReport(BaseModel):
+    dry_run: bool  # True: nothing was changed; the counts are what a real pass would do
+    started_at: datetime
+    skipped: bool
+    tables: List[RetentionTableReport]
@@ -1,45 +1,112 @@
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
+import hashlib
+import logging
 
+from app.config import Settings, get_settings
 from app.database import get_db
 from app.models import User
+from app.service.password_service import crypt_context
 
-# Secret Key & JWT Configurations
-SECRET_KEY = "your_secret_key"  # Replace with a strong secret key
+logger = logging.getLogger(__name__)
+
+# Secret Key & JWT Configurations. Tokens are disabled until SECRET_KEY is set:
+# with a known key anyone could sign their own.
+SECRET_KEY = get_settings().secret_key
+PLACEHOLDER_SECRET_KEYS = {"", "your_secret_key"}
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 7
+
+# Token types carried in the "typ" claim
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+def tokens_enabled() -> bool:
+    return SECRET_KEY is not None and SECRET_KEY not in PLACEHOLDER_SECRET_KEYS
+
+
+def _warn_if_disabled() -> None:
+    if not tokens_enabled():
+        logger.warning("SECRET_KEY is not set; bearer tokens are disabled (HTTP Basic only)")
+
+
+def configure(settings: Settings) -> None:
+    """
+    Sign and verify tokens with the secret key of `settings` (call before startup).
+    """
+    global SECRET_KEY
+    if settings.secret_key == SECRET_KEY:
+        return
+    SECRET_KEY = settings.secret_key
+    _warn_if_disabled()
 
-# Password Hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_warn_if_disabled()
 
 # OAuth2 Scheme for Token Authentication
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-# Function to Hash Password
+# Function to Hash Password (same policy and work factor as the async password service)
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return crypt_context().hash(password)
 
 # Function to Verify Password
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return crypt_context().verify(plain_password, hashed_password)
 
 # Function to Create JWT Access Token
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
+    if not tokens_enabled():
+        raise RuntimeError("SECRET_KEY is not configured")
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
+    to_encode.setdefault("typ", ACCESS_TOKEN_TYPE)
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# Function to Create JWT Refresh Token
+def create_refresh_token(data: dict, expires_delta: timedelta = None) -> str:
+    to_encode = data.copy()
+    to_encode["typ"] = REFRESH_TOKEN_TYPE
+    return create_access_token(to_encode, expires_delta if expires_delta else timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+# Function to Decode a JWT and check its type (raises JWTError when invalid)
+def decode_token(token: str, expected_type: str = ACCESS_TOKEN_TYPE) -> dict:
+    if not tokens_enabled():
+        raise JWTError("Bearer tokens are disabled")
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    if payload.get("typ", ACCESS_TOKEN_TYPE) != expected_type:
+        raise JWTError("Unexpected token type")
+    return payload
+
+# Fingerprint of the stored hash; refresh tokens stop working once the password changes
+def password_fingerprint(hashed_password: str) -> str:
+    return hashlib.sha256((hashed_password or "").encode("utf-8")).hexdigest()[:16]
+
+# Claims embedded in access tokens so requests can be authorised without a DB lookup
+def user_token_claims(user: User) -> dict:
+    return {"sub": user.email, "uid": user.id, "usr": user.username, "adm": bool(user.is_admin)}
+
+# Issue an access/refresh token pair for a verified user
+def issue_tokens(user: User) -> dict:
+    claims = user_token_claims(user)
+    return {
+        "access_token": create_access_token(claims),
+        "refresh_token": create_refresh_token({"sub": user.email, "uid": user.id, "pwd": password_fingerprint(user.hashed_password)}),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
 # Function to Get Current User (using JWT)
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(status_code=401, detail="Invalid authentication credentials")
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_email: str = payload.get("sub")
         if user_email is None:
             raise credentials_exception
@@ -0,0 +1,526 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Union
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+
+from app.cache import on_invalidate
+from app.database import SessionLocal
+from app.metrics import registry
+from app.models import AlertState, DeviceInput
+from app.service.device_registry import DEVICE_REGISTRY_TOPIC, ThresholdRecord, device_registry
+from app.service.notification_service import create_notifications
+
+logger = logging.getLogger(__name__)
+
+# A rule in alarm only clears once readings are this far (as a fraction of the
+# allowed range) back inside it, so values hovering at a limit do not flap
+HYSTERESIS_FRACTION = 0.05
+
+# After a notification, further breaches of the same rule are only counted and
+# reported as one aggregated notification when the window ends
+ALERT_COOLDOWN_SECONDS = 300
+
+# How often dedup state is written to alert_states (and due summaries are sent)
+CHECKPOINT_INTERVAL_SECONDS = 30
+
+ALERT_EVALUATION_SECONDS = registry.histogram(
+    "alert_evaluation_duration_seconds", "Time to evaluate one ingestion batch against the alert rules.",
+)
+ALERT_READINGS = registry.counter("alert_readings_evaluated_total", "Readings evaluated against the alert rules.")
+ALERT_NOTIFICATIONS = registry.counter("alert_notifications_total", "Alert notifications created from ingestion batches.")
+
+
+class AlertRule(NamedTuple):
+    id: int
+    device_id: int
+    parameter: str
+    min_value: float
+    max_value: float
+    owner_id: int
+    device_name: str
+
+
+class _RuleArrays(NamedTuple):
+    """Immutable, key-sorted snapshot of the enabled rules."""
+    keys: np.ndarray        # int64 (device_id << 32 | parameter code), sorted
+    min_values: np.ndarray  # float64
+    max_values: np.ndarray  # float64
+    clear_low: np.ndarray   # float64, min_value raised by the hysteresis band
+    clear_high: np.ndarray  # float64, max_value lowered by the hysteresis band
+    rules: List[AlertRule]  # same order as the arrays
+
+
+_EMPTY = _RuleArrays(np.empty(0, np.int64), np.empty(0), np.empty(0), np.empty(0), np.empty(0), [])
+
+
+class _AlertState:
+    """Dedup state of one rule; times are epoch seconds so checkpoints survive restarts."""
+    __slots__ = ("active", "cooldown_until", "window_start", "suppressed", "last_value")
+
+    def __init__(self, active=False, cooldown_until=0.0, window_start=0.0, suppressed=0, last_value=None):
+        self.active = active
+        self.cooldown_until = cooldown_until
+        self.window_start = window_start
+        self.suppressed = suppressed
+        self.last_value = last_value
+
+
+class AlertEngine:
+    """
+    Threshold evaluation over every enabled DeviceInput.
+
+    Rules are held in a dict for cheap incremental updates and compiled into
+    sorted NumPy arrays on the next evaluation, so a whole batch of readings
+    is matched and compared with a handful of vectorized operations.
+
+    Each rule also carries dedup state: a breach opens an alarm that only
+    clears past the hysteresis band, and breaches while it is open are
+    counted, not re-alarmed. After every notification the rule cools down;
+    everything counted meanwhile goes out as one aggregated notification.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        cooldown: float = ALERT_COOLDOWN_SECONDS,
+        hysteresis: float = HYSTERESIS_FRACTION,
+        checkpoint_interval: float = CHECKPOINT_INTERVAL_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.cooldown = cooldown
+        self.hysteresis = hysteresis
+        self.checkpoint_interval = checkpoint_interval
+        self._rules: Dict[int, AlertRule] = {}
+        self._param_codes: Dict[str, int] = {}
+        self._arrays = _EMPTY
+        self._dirty = False
+        self._loaded = False
+        self._pending: Set[Hashable] = set()  # device registry keys whose rules must be reloaded
+        self._lock = threading.Lock()
+        self._states: Dict[int, _AlertState] = {}
+        self._changed_states: Set[int] = set()  # rule ids to write (or delete) at the next checkpoint
+        self._state_lock = threading.Lock()
+        self._checkpointer = None
+        self._stop = threading.Event()
+
+    # -- rule maintenance ---------------------------------------------------
+
+    def load(self, db=None) -> int:
+        """
+        (Re)load every enabled rule from the device registry, and the dedup
+        state checkpoint from the database. Returns the rule count.
+        """
+        rules = [
+            self._to_rule(threshold, self._device_name(threshold.device_id))
+            for threshold in device_registry.thresholds()
+            if threshold.alert_enabled
+        ]
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            checkpoint = db.execute(select(AlertState)).scalars().all()
+        finally:
+            if own_session:
+                db.close()
+        with self._lock:
+            self._rules = {rule.id: rule for rule in rules}
+            self._dirty = True
+            self._loaded = True
+        with self._state_lock:
+            self._states = {
+                row.rule_id: _AlertState(row.active, row.cooldown_until, row.window_start, row.suppressed, row.last_value)
+                for row in checkpoint
+                if row.rule_id in self._rules
+            }
+        return len(rules)
+
+    def upsert_rule(self, device_input: Union[DeviceInput, ThresholdRecord]) -> None:
+        """
+        Add, replace or (when alerts are disabled) drop a single rule.
+        """
+        if not device_input.alert_enabled:
+            self.remove_rule(device_input.id)
+            return
+        rule = self._to_rule(device_input, self._device_name(device_input.device_id))
+        with self._lock:
+            self._rules[rule.id] = rule
+            self._dirty = True
+
+    def remove_rule(self, rule_id: int) -> None:
+        with self._lock:
+            if self._rules.pop(rule_id, None) is not None:
+                self._dirty = True
+        self._drop_states([rule_id])
+
+    def remove_devices(self, device_ids: Iterable[int]) -> None:
+        device_ids = set(device_ids)
+        with self._lock:
+            stale = [rule_id for rule_id, rule in self._rules.items() if rule.device_id in device_ids]
+            for rule_id in stale:
+                del self._rules[rule_id]
+            self._dirty = self._dirty or bool(stale)
+        self._drop_states(stale)
+
+    def discard(self, key: Hashable) -> None:
+        """
+        Reload the rules behind a device registry key, ("device", id) or
+        ("owner", id), before the next evaluation. Another worker may have
+        changed them, bypassing upsert_rule/remove_rule here.
+        """
+        with self._lock:
+            self._pending.add(key)
+
+    def clear(self) -> None:
+        """
+        Reload every rule before the next evaluation (dedup state is kept).
+        """
+        with self._lock:
+            self._pending.add(None)
+
+    def _refresh(self) -> None:
+        with self._lock:
+            keys, self._pending = self._pending, set()
+            current = list(self._rules.values())
+        if None in keys:
+            device_ids = {rule.device_id for rule in current}
+            thresholds = device_registry.thresholds()
+        else:
+            device_ids = {key[1] for key in keys if key[0] == "device"}
+            owner_ids = {key[1] for key in keys if key[0] == "owner"}
+            device_ids.update(rule.device_id for rule in current if rule.owner_id in owner_ids)
+            for owner_id in owner_ids:
+                device_ids.update(device.id for device in device_registry.devices_of(owner_id))
+            thresholds = [threshold for device_id in device_ids for threshold in device_registry.thresholds(device_id)]
+        device_ids.update(threshold.device_id for threshold in thresholds)
+        rules = [
+            self._to_rule(threshold, self._device_name(threshold.device_id))
+            for threshold in thresholds
+            if threshold.alert_enabled
+        ]
+        with self._lock:
+            stale = {rule_id for rule_id, rule in self._rules.items() if rule.device_id in device_ids}
+            for rule_id in stale:
+                del self._rules[rule_id]
+            self._rules.update((rule.id, rule) for rule in rules)
+            self._dirty = True
+        self._drop_states(stale.difference(rule.id for rule in rules))
+
+    def _drop_states(self, rule_ids: Iterable[int]) -> None:
+        with self._state_lock:
+            for rule_id in rule_ids:
+                if self._states.pop(rule_id, None) is not None:
+                    self._changed_states.add(rule_id)
+
+    @staticmethod
+    def _device_name(device_id: int) -> str:
+        device = device_registry.get(device_id)
+        return device.name if device else f"Device {device_id}"
+
+    @staticmethod
+    def _to_rule(device_input: Union[DeviceInput, ThresholdRecord], device_name: str) -> AlertRule:
+        return AlertRule(
+            id=device_input.id,
+            device_id=device_input.device_id,
+            parameter=device_input.parameter,
+            min_value=float(device_input.min_value),
+            max_value=float(device_input.max_value),
+            owner_id=device_input.owner_id,
+            device_name=device_name,
+        )
+
+    def _param_code(self, parameter: str) -> int:
+        code = self._param_codes.get(parameter)
+        if code is None:
+            code = self._param_codes[parameter] = len(self._param_codes)
+        return code
+
+    def _snapshot(self) -> _RuleArrays:
+        if not self._loaded:
+            self.load()
+        elif self._pending:
+            self._refresh()
+        if not self._dirty:
+            return self._arrays
+        with self._lock:
+            if self._dirty:
+                rules = list(self._rules.values())
+                keys = np.fromiter(
+                    ((rule.device_id << 32) | self._param_code(rule.parameter) for rule in rules),
+                    dtype=np.int64, count=len(rules),
+                )
+                order = np.argsort(keys, kind="stable")
+                min_values = np.fromiter((rule.min_value for rule in rules), np.float64, len(rules))[order]
+                max_values = np.fromiter((rule.max_value for rule in rules), np.float64, len(rules))[order]
+                band = (max_values - min_values) * self.hysteresis
+                self._arrays = _RuleArrays(
+                    keys=keys[order],
+                    min_values=min_values,
+                    max_values=max_values,
+                    clear_low=min_values + band,
+                    clear_high=max_values - band,
+                    rules=[rules[i] for i in order],
+                )
+                self._dirty = False
+            return self._arrays
+
+    # -- evaluation ---------------------------------------------------------
+
+    def _match(self, device_ids, parameters, values):
+        """
+        Pair readings with their rules: (arrays, reading_idx, rule_idx, readings).
+
+        Pairs are in reading order.
+        """
+        arrays = self._snapshot()
+        count = len(values)
+        if count == 0 or len(arrays.rules) == 0:
+            return arrays, np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0)
+
+        codes = np.fromiter((self._param_codes.get(p, -1) for p in parameters), np.int64, count)
+        keys = (np.asarray(device_ids, np.int64) << 32) | np.maximum(codes, 0)
+        keys[codes < 0] = -1  # unknown parameter: cannot match any rule
+
+        # Expand each reading into one row per matching rule
+        lo = np.searchsorted(arrays.keys, keys, side="left")
+        matches = np.searchsorted(arrays.keys, keys, side="right") - lo
+        total = int(matches.sum())
+        if total == 0:
+            return arrays, np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0)
+        reading_idx = np.repeat(np.arange(count), matches)
+        rule_idx = np.repeat(lo - (np.cumsum(matches) - matches), matches) + np.arange(total)
+        return arrays, reading_idx, rule_idx, np.asarray(values, np.float64)[reading_idx]
+
+    def evaluate(self, device_ids, parameters, values):
+        """
+        Return (reading_indices, rules) for every reading outside a rule's range.
+        """
+        arrays, reading_idx, rule_idx, readings = self._match(device_ids, parameters, values)
+        breached = (readings < arrays.min_values[rule_idx]) | (readings > arrays.max_values[rule_idx])
+        return reading_idx[breached], [arrays.rules[i] for i in rule_idx[breached]]
+
+    def process_batch(self, rows: List[dict], now: float = None) -> int:
+        """
+        Evaluate a committed ingestion batch and store the notifications it warrants.
+
+        Breaches are reduced per rule with NumPy (count, latest value, and
+        whether the rule ends the batch in alarm), so the Python loop runs once
+        per affected rule rather than once per reading.
+        """
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        self.start()
+        arrays, reading_idx, rule_idx, readings = self._match(
+            [row["device_id"] for row in rows],
+            [row["parameter"] for row in rows],
+            [row["sensor_value"] for row in rows],
+        )
+        breached = (readings < arrays.min_values[rule_idx]) | (readings > arrays.max_values[rule_idx])
+        cleared = (readings >= arrays.clear_low[rule_idx]) & (readings <= arrays.clear_high[rule_idx])
+
+        # Only breaches and clears change state; readings inside the band keep it
+        decisive = breached | cleared
+        rule_idx, breached, readings = rule_idx[decisive], breached[decisive], readings[decisive]
+        notifications = []
+        if len(rule_idx):
+            # Group each rule's decisive readings, keeping reading order within it
+            order = np.argsort(rule_idx, kind="stable")
+            rule_idx, breached, readings = rule_idx[order], breached[order], readings[order]
+            starts = np.r_[True, rule_idx[1:] != rule_idx[:-1]]
+            start_pos = np.flatnonzero(starts)
+            end_pos = np.r_[start_pos[1:], len(rule_idx)] - 1
+            group = np.cumsum(starts) - 1
+            breach_counts = np.add.reduceat(breached.astype(np.int64), start_pos)
+            # A breach right after a clear re-arms and trips the rule again; whether
+            # the first breach of a group is an onset depends on the rule's state
+            onsets = breached & ~starts & ~np.r_[False, breached[:-1]]
+            onset_counts = np.add.reduceat(onsets.astype(np.int64), start_pos)
+            last_breach_value = np.zeros(len(start_pos))
+            breach_pos = np.flatnonzero(breached)
+            # Assigning in order leaves the latest breach per rule
+            last_breach_value[group[breach_pos]] = readings[breach_pos]
+
+            with self._state_lock:
+                for i in range(len(start_pos)):
+                    message = self._apply(
+                        arrays.rules[rule_idx[start_pos[i]]], int(breach_counts[i]), int(onset_counts[i]),
+                        bool(breached[start_pos[i]]), float(last_breach_value[i]), bool(breached[end_pos[i]]), now,
+                    )
+                    if message is not None:
+                        notifications.append(message)
+        # Quiet rules' pending summaries are sent by the checkpoint thread
+        if notifications:
+            self._store(notifications)
+        ALERT_EVALUATION_SECONDS.observe(time.perf_counter() - started)
+        ALERT_READINGS.inc(amount=len(rows))
+        ALERT_NOTIFICATIONS.inc(amount=len(notifications))
+        return len(notifications)
+
+    def _apply(
+        self, rule: AlertRule, breaches: int, onsets: int, starts_breached: bool,
+        last_value: float, ends_active: bool, now: float,
+    ) -> Optional[dict]:
+        """
+        Update a rule's state with one batch's decisive readings. `onsets`
+        counts breaches after a clear within the batch; `starts_breached` is
+        whether the first decisive reading was a breach.
+
+        Only an inactive -> active transition raises an alarm (subject to the
+        cooldown); breaches while the rule is already in alarm are counted
+        into the next summary.
+        """
+        # Caller holds _state_lock
+        state = self._states.get(rule.id)
+        if breaches == 0:
+            # Back inside the clear band: re-armed
+            if state is not None and state.active:
+                state.active = False
+                self._changed_states.add(rule.id)
+            return None
+        if state is None:
+            state = self._states[rule.id] = _AlertState(window_start=now)
+        if starts_breached and not state.active:
+            onsets += 1
+        state.active = ends_active
+        state.last_value = last_value
+        self._changed_states.add(rule.id)
+        if onsets == 0 or now < state.cooldown_until:
+            state.suppressed += breaches
+            return None
+        return self._report(rule, state, state.suppressed + breaches, now)
+
+    def _report(self, rule: AlertRule, state: _AlertState, count: int, now: float, summary: bool = False) -> dict:
+        # Caller holds _state_lock
+        if count == 1 and not summary:
+            message = self.format_message(rule, state.last_value)
+        else:
+            message = self.format_summary(rule, state.last_value, count, now - state.window_start)
+        state.suppressed = 0
+        state.cooldown_until = now + self.cooldown
+        state.window_start = now
+        return {"user_id": rule.owner_id, "message": message}
+
+    def _due_summaries(self, now: float) -> List[dict]:
+        """
+        Report breaches counted during cooldowns that have ended (including
+        repeats of an alarm that is still active), and forget rules that are
+        quiet again.
+        """
+        summaries = []
+        with self._state_lock:
+            for rule_id, state in list(self._states.items()):
+                if now < state.cooldown_until:
+                    continue
+                rule = self._rules.get(rule_id)
+                if state.suppressed and rule is not None:
+                    summaries.append(self._report(rule, state, state.suppressed, now, summary=True))
+                    self._changed_states.add(rule_id)
+                elif not state.active or rule is None:
+                    # Kept while active: a breach must not raise a fresh alarm until the rule re-arms
+                    del self._states[rule_id]
+                    self._changed_states.add(rule_id)
+        return summaries
+
+    @staticmethod
+    def format_message(rule: AlertRule, value: float) -> str:
+        message = (
+            f"Alert: {rule.device_name} reported abnormal {rule.parameter} value {value} "
+            f"(allowed {rule.min_value} to {rule.max_value})"
+        )
+        return message[:255]  # Notification.message length
+
+    @staticmethod
+    def format_summary(rule: AlertRule, value: float, count: int, window: float) -> str:
+        window = f"{max(int(window), 1)} s" if window < 120 else f"{int(window // 60)} min"
+        message = (
+            f"Alert: {rule.device_name} {rule.parameter} value out of range {count} times in last {window} "
+            f"(latest {value}, allowed {rule.min_value} to {rule.max_value})"
+        )
+        return message[:255]
+
+    def _store(self, notifications: List[dict], db=None) -> None:
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            create_notifications(db, notifications)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if own_session:
+                db.close()
+
+
+    # -- checkpointing ------------------------------------------------------
+
+    def checkpoint(self) -> int:
+        """
+        Write changed dedup state to alert_states. Returns the rows written.
+        """
+        with self._state_lock:
+            changed, self._changed_states = self._changed_states, set()
+            updated_at = datetime.utcnow()
+            rows = [
+                {
+                    "rule_id": rule_id, "active": state.active, "cooldown_until": state.cooldown_until,
+                    "window_start": state.window_start, "suppressed": state.suppressed,
+                    "last_value": state.last_value, "updated_at": updated_at,
+                }
+                for rule_id, state in ((rule_id, self._states.get(rule_id)) for rule_id in changed)
+                if state is not None
+            ]
+        if not changed:
+            return 0
+        db = self.session_factory()
+        try:
+            # Delete-then-insert in one transaction works on every backend
+            db.execute(delete(AlertState).where(AlertState.rule_id.in_(changed)))
+            if rows:
+                db.execute(insert(AlertState), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._state_lock:
+                self._changed_states |= changed
+            raise
+        finally:
+            db.close()
+        return len(rows)
+
+    def start(self) -> None:
+        if self._checkpointer is not None and self._checkpointer.is_alive():
+            return
+        with self._state_lock:
+            if self._checkpointer is not None and self._checkpointer.is_alive():
+                return
+            self._stop.clear()
+            self._checkpointer = threading.Thread(target=self._run, name="alert-checkpointer", daemon=True)
+            self._checkpointer.start()
+
+    def stop(self) -> None:
+        """
+        Stop the checkpoint thread and write a final checkpoint.
+        """
+        self._stop.set()
+        if self._checkpointer is not None:
+            self._checkpointer.join()
+            self._checkpointer = None
+        self.checkpoint()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.checkpoint_interval):
+            try:
+                # Summaries must go out even if a device stops reporting
+                summaries = self._due_summaries(time.time())
+                if summaries:
+                    self._store(summaries)
+                self.checkpoint()
+            except Exception:
+                logger.exception("Alert checkpoint failed")
+
+
+alert_engine = AlertEngine()
+on_invalidate(DEVICE_REGISTRY_TOPIC, alert_engine.discard, alert_engine.clear)
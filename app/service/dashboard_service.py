@@ -0,0 +1,203 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from sqlalchemy import and_, func, select
+
+from app.cache import TTLCache, invalidate, on_invalidate
+from app.models import Device, IoTData, Notification, System
+
+DASHBOARD_TOPIC = "dashboard"
+DASHBOARD_CACHE_TTL_SECONDS = 60  # safety net; writes invalidate entries explicitly
+DASHBOARD_CACHE_MAX_ENTRIES = 10_000
+
+# A device counts as online if it is enabled and reported within this window
+DEVICE_ONLINE_WINDOW_SECONDS = 300
+
+
+def build_snapshot(db, user_id: int) -> dict:
+    """
+    Load a user's systems, devices and latest reading per device parameter.
+
+    One joined query for the tree plus one indexed count of unread alerts.
+    """
+    latest = (
+        select(IoTData.device_id, IoTData.parameter, func.max(IoTData.timestamp).label("timestamp"))
+        .join(Device, Device.id == IoTData.device_id)
+        .join(System, System.id == Device.system_id)
+        .where(System.owner_id == user_id)
+        .group_by(IoTData.device_id, IoTData.parameter)
+        .subquery()
+    )
+    rows = db.execute(
+        select(
+            System.id, System.name, System.widget_type,
+            Device.id, Device.name, Device.status,
+            IoTData.parameter, IoTData.sensor_value, IoTData.timestamp,
+        )
+        .select_from(System)
+        .outerjoin(Device, Device.system_id == System.id)
+        .outerjoin(latest, latest.c.device_id == Device.id)
+        .outerjoin(IoTData, and_(
+            IoTData.device_id == latest.c.device_id,
+            IoTData.parameter == latest.c.parameter,
+            IoTData.timestamp == latest.c.timestamp,
+        ))
+        .where(System.owner_id == user_id)
+        .order_by(System.id, Device.id, IoTData.parameter)
+    )
+
+    systems: Dict[int, dict] = {}
+    devices: Dict[int, dict] = {}
+    for system_id, system_name, widget_type, device_id, device_name, device_status, parameter, value, timestamp in rows:
+        system = systems.get(system_id)
+        if system is None:
+            system = systems[system_id] = {"id": system_id, "name": system_name, "widget_type": widget_type, "devices": []}
+        if device_id is None:
+            continue
+        device = devices.get(device_id)
+        if device is None:
+            device = devices[device_id] = {"id": device_id, "name": device_name, "status": bool(device_status), "readings": {}}
+            system["devices"].append(device)
+        if parameter is not None and parameter not in device["readings"]:
+            device["readings"][parameter] = {"parameter": parameter, "sensor_value": value, "timestamp": timestamp}
+
+    unread = db.execute(
+        select(func.count()).select_from(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read == False)
+    ).scalar_one()
+    return {"systems": list(systems.values()), "devices": devices, "unread_alerts": unread}
+
+
+def render(snapshot: dict, now: datetime = None) -> dict:
+    """
+    Turn a cached snapshot into the response, deriving online state at read time.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=DEVICE_ONLINE_WINDOW_SECONDS)
+    systems = []
+    device_count = online_count = 0
+    for system in snapshot["systems"]:
+        devices = []
+        for device in system["devices"]:
+            readings = list(device["readings"].values())
+            last_seen = max((r["timestamp"] for r in readings), default=None)
+            online = device["status"] and last_seen is not None and last_seen >= cutoff
+            devices.append({
+                "id": device["id"], "name": device["name"], "status": device["status"],
+                "online": online, "last_seen": last_seen, "latest_readings": readings,
+            })
+        system_online = sum(d["online"] for d in devices)
+        systems.append({
+            "id": system["id"], "name": system["name"], "widget_type": system["widget_type"],
+            "device_count": len(devices), "online_count": system_online, "devices": devices,
+        })
+        device_count += len(devices)
+        online_count += system_online
+    return {
+        "system_count": len(systems),
+        "device_count": device_count,
+        "online_count": online_count,
+        "offline_count": device_count - online_count,
+        "unread_alerts": snapshot["unread_alerts"],
+        "generated_at": now,
+        "systems": systems,
+    }
+
+
+class _Build:
+    """A snapshot being built; marked stale when the user's data changes meanwhile."""
+    __slots__ = ("stale",)
+
+    def __init__(self):
+        self.stale = False
+
+
+class DashboardCache:
+    """
+    Per-user dashboard snapshots.
+
+    Entries are dropped on invalidation events and patched in place by the
+    ingestion listener, so reading a dashboard rarely touches the database.
+    """
+
+    def __init__(self, maxsize: int = DASHBOARD_CACHE_MAX_ENTRIES, ttl: float = DASHBOARD_CACHE_TTL_SECONDS):
+        self._snapshots = TTLCache(maxsize, ttl)
+        self._device_owners: Dict[int, int] = {}
+        # Builds in progress per user: a build racing with a write is not cached
+        self._builds: Dict[int, List[_Build]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db, user_id: int) -> dict:
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is not None:
+            return snapshot
+        build = _Build()
+        with self._lock:
+            self._builds.setdefault(user_id, []).append(build)
+        snapshot = None
+        try:
+            snapshot = build_snapshot(db, user_id)
+        finally:
+            with self._lock:
+                builds = self._builds[user_id]
+                builds.remove(build)
+                if not builds:
+                    del self._builds[user_id]
+                if snapshot is not None and not build.stale:
+                    self._snapshots.set(user_id, snapshot)
+                    for device_id in snapshot["devices"]:
+                        self._device_owners[device_id] = user_id
+        return snapshot
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            for build in self._builds.get(user_id, ()):
+                build.stale = True
+            snapshot = self._snapshots.pop(user_id)
+            if snapshot is not None:
+                for device_id in snapshot["devices"]:
+                    if self._device_owners.get(device_id) == user_id:
+                        del self._device_owners[device_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            for builds in self._builds.values():
+                for build in builds:
+                    build.stale = True
+            self._snapshots.clear()
+            self._device_owners.clear()
+
+    def apply_readings(self, rows: Iterable[dict]) -> None:
+        """
+        Ingestion listener: fold newer readings into cached snapshots.
+
+        Readings dicts are replaced rather than mutated so concurrent renders
+        never see a dict change size mid-iteration.
+        """
+        with self._lock:
+            for row in rows:
+                owner = self._device_owners.get(row["device_id"])
+                if owner is None:
+                    continue
+                snapshot = self._snapshots.get(owner)
+                device = snapshot and snapshot["devices"].get(row["device_id"])
+                if not device:
+                    continue
+                current = device["readings"].get(row["parameter"])
+                if current is None or row["timestamp"] >= current["timestamp"]:
+                    readings = dict(device["readings"])
+                    readings[row["parameter"]] = {
+                        "parameter": row["parameter"],
+                        "sensor_value": row["sensor_value"],
+                        "timestamp": row["timestamp"],
+                    }
+                    device["readings"] = readings
+
+
+dashboard_cache = DashboardCache()
+on_invalidate(DASHBOARD_TOPIC, dashboard_cache.discard, dashboard_cache.clear)
+
+
+def invalidate_dashboard(user_id: int) -> None:
+    invalidate(DASHBOARD_TOPIC, user_id)
@@ -0,0 +1,273 @@
+import threading
+import time
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, select
+
+from app.cache import invalidate, on_invalidate
+from app.database import SessionLocal
+from app.models import Device, DeviceInput, System
+
+DEVICE_REGISTRY_TOPIC = "devices"
+
+# Full reload interval; catches devices changed outside the API (e.g. provisioning scripts)
+REGISTRY_REFRESH_SECONDS = 300
+
+
+class DeviceRecord:
+    __slots__ = ("id", "name", "system_id", "owner_id", "status", "version")
+
+    def __init__(self, id: int, name: str, system_id: int, owner_id: int, status: bool, version: int):
+        self.id = id
+        self.name = name
+        self.system_id = system_id
+        self.owner_id = owner_id
+        self.status = status
+        self.version = version
+
+
+class ThresholdRecord:
+    __slots__ = ("id", "device_id", "parameter", "min_value", "max_value", "alert_enabled", "owner_id")
+
+    def __init__(self, id: int, device_id: int, parameter: str, min_value: float, max_value: float,
+                 alert_enabled: bool, owner_id: int):
+        self.id = id
+        self.device_id = device_id
+        self.parameter = parameter
+        self.min_value = min_value
+        self.max_value = max_value
+        self.alert_enabled = alert_enabled
+        self.owner_id = owner_id
+
+
+class DeviceRegistry:
+    """
+    Process-local copy of devices, their owners and their thresholds.
+
+    Indexed by device id, by owner and by device for thresholds, so ownership
+    checks and threshold lookups need no query. Writes invalidate keys
+    ("device", id) or ("owner", id); the affected rows are reloaded on the next
+    lookup. Each invalidation is stamped with a version so a key invalidated
+    again while its reload ran stays stale. A full reload runs every
+    `refresh_interval` seconds.
+    """
+
+    def __init__(self, session_factory=SessionLocal, refresh_interval: float = REGISTRY_REFRESH_SECONDS):
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._devices: Dict[int, DeviceRecord] = {}
+        self._by_owner: Dict[int, Set[int]] = {}
+        self._thresholds: Dict[int, ThresholdRecord] = {}
+        self._thresholds_by_device: Dict[int, List[ThresholdRecord]] = {}
+        self._stale: Dict[Hashable, int] = {}  # invalidated key -> version of its latest invalidation
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+    # -- lookups ------------------------------------------------------------
+
+    def get(self, device_id: int) -> Optional[DeviceRecord]:
+        self.sync()
+        return self._devices.get(device_id)
+
+    def devices_of(self, owner_id: int) -> List[DeviceRecord]:
+        self.sync()
+        with self._lock:
+            return [self._devices[device_id] for device_id in self._by_owner.get(owner_id, ())]
+
+    def thresholds(self, device_id: int = None) -> List[ThresholdRecord]:
+        """
+        Threshold records of one device, or of every device when `device_id` is None.
+        """
+        self.sync()
+        with self._lock:
+            if device_id is None:
+                return list(self._thresholds.values())
+            return list(self._thresholds_by_device.get(device_id, ()))
+
+    def unowned(self, device_ids: Iterable[int], owner_id: int) -> Set[int]:
+        """
+        The ids in `device_ids` that do not belong to `owner_id`.
+
+        Pure memory lookup; ids the registry has never seen are reported as
+        unowned, so callers confirm a non-empty result with `refresh_devices`.
+        """
+        self.sync()
+        owned = self._by_owner.get(owner_id, ())
+        return {device_id for device_id in device_ids if device_id not in owned}
+
+    # -- invalidation -------------------------------------------------------
+
+    def discard(self, key: Hashable) -> None:
+        """
+        Invalidation handler: mark ("device", id) or ("owner", id) for reload.
+        """
+        with self._lock:
+            self.version += 1
+            self._stale[key] = self.version
+
+    def refresh_devices(self, device_ids: Iterable[int]) -> None:
+        """
+        Reload the given devices now (e.g. ids first seen on the ingestion path).
+        """
+        for device_id in device_ids:
+            self.discard(("device", device_id))
+        self.sync()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._loaded_at = None
+
+    # -- loading ------------------------------------------------------------
+
+    def is_current(self) -> bool:
+        """
+        Whether lookups can be answered without a reload (async callers sync in a thread otherwise).
+        """
+        return (
+            self._loaded_at is not None and not self._stale
+            and time.monotonic() - self._loaded_at < self.refresh_interval
+        )
+
+    def sync(self) -> None:
+        """
+        Apply pending invalidations, or reload everything when the registry is due.
+        """
+        if self.is_current():
+            return
+        with self._refresh_lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval:
+                self._load_all()
+            elif self._stale:
+                self._load_stale()
+
+    def _load_all(self) -> None:
+        version = self.version
+        loaded_at = time.monotonic()
+        db = self.session_factory()
+        try:
+            devices, thresholds = self._query(db)
+        finally:
+            db.close()
+        with self._lock:
+            self._devices, self._by_owner = {}, {}
+            self._thresholds, self._thresholds_by_device = {}, {}
+            for row in devices:
+                self._put_device(row, version)
+            for record in thresholds:
+                self._put_threshold(record)
+            # Keys invalidated while loading may have missed their write
+            self._stale = {key: stamp for key, stamp in self._stale.items() if stamp > version}
+            self._loaded_at = loaded_at
+
+    def _load_stale(self) -> None:
+        with self._lock:
+            version = self.version
+            keys = list(self._stale)
+        device_ids = {key[1] for key in keys if key[0] == "device"}
+        owner_ids = {key[1] for key in keys if key[0] == "owner"}
+        with self._lock:
+            for owner_id in owner_ids:
+                device_ids.update(self._by_owner.get(owner_id, ()))
+        db = self.session_factory()
+        try:
+            devices, thresholds = self._query(db, device_ids, owner_ids)
+        finally:
+            db.close()
+        with self._lock:
+            device_ids.update(row[0] for row in devices)
+            for device_id in device_ids:
+                self._drop_device(device_id)
+            for row in devices:
+                self._put_device(row, version)
+            for record in thresholds:
+                self._put_threshold(record)
+            # Keys invalidated again mid-reload may have missed their write; retry them
+            self._stale = {key: stamp for key, stamp in self._stale.items() if stamp > version}
+
+    @staticmethod
+    def _query(db, device_ids: Set[int] = None, owner_ids: Set[int] = None):
+        stmt = select(Device.id, Device.name, Device.system_id, System.owner_id, Device.status).join(
+            System, System.id == Device.system_id
+        )
+        if device_ids is not None:
+            conditions = []
+            if device_ids:
+                conditions.append(Device.id.in_(device_ids))
+            if owner_ids:
+                conditions.append(System.owner_id.in_(owner_ids))
+            if not conditions:
+                return [], []
+            stmt = stmt.where(or_(*conditions))
+        devices = [
+            (device_id, name, system_id, owner_id, bool(status))
+            for device_id, name, system_id, owner_id, status in db.execute(stmt)
+        ]
+        threshold_stmt = select(
+            DeviceInput.id, DeviceInput.device_id, DeviceInput.parameter, DeviceInput.min_value,
+            DeviceInput.max_value, DeviceInput.alert_enabled, DeviceInput.owner_id,
+        )
+        if device_ids is not None:
+            threshold_stmt = threshold_stmt.where(
+                DeviceInput.device_id.in_(device_ids | {device[0] for device in devices})
+            )
+        thresholds = [
+            ThresholdRecord(input_id, device_id, parameter, float(min_value), float(max_value), bool(enabled), owner_id)
+            for input_id, device_id, parameter, min_value, max_value, enabled, owner_id in db.execute(threshold_stmt)
+        ]
+        return devices, thresholds
+
+    def _put_device(self, row: tuple, version: int) -> None:
+        # Caller holds _lock
+        record = DeviceRecord(*row, version=version)
+        self._devices[record.id] = record
+        self._by_owner.setdefault(record.owner_id, set()).add(record.id)
+
+    def _put_threshold(self, record: ThresholdRecord) -> None:
+        # Caller holds _lock
+        self._thresholds[record.id] = record
+        self._thresholds_by_device.setdefault(record.device_id, []).append(record)
+
+    def _drop_device(self, device_id: int) -> None:
+        # Caller holds _lock
+        record = self._devices.pop(device_id, None)
+        if record is not None:
+            owned = self._by_owner.get(record.owner_id)
+            if owned is not None:
+                owned.discard(device_id)
+                if not owned:
+                    del self._by_owner[record.owner_id]
+        for threshold in self._thresholds_by_device.pop(device_id, ()):
+            self._thresholds.pop(threshold.id, None)
+
+
+device_registry = DeviceRegistry()
+on_invalidate(DEVICE_REGISTRY_TOPIC, device_registry.discard, device_registry.clear)
+
+
+async def find_unowned(device_ids: Iterable[int], owner_id: int) -> Set[int]:
+    """
+    The ids in `device_ids` not owned by `owner_id`, for async routes.
+
+    Only ids the registry does not know for this owner cost a (targeted)
+    reload, so a known device never triggers a query.
+    """
+    if not device_registry.is_current():
+        await run_in_threadpool(device_registry.sync)
+    unowned = device_registry.unowned(device_ids, owner_id)
+    if unowned:
+        await run_in_threadpool(device_registry.refresh_devices, unowned)
+        unowned = device_registry.unowned(unowned, owner_id)
+    return unowned
+
+
+def invalidate_devices(device_ids: Iterable[int]) -> None:
+    for device_id in device_ids:
+        invalidate(DEVICE_REGISTRY_TOPIC, ("device", device_id))
+
+
+def invalidate_owner_devices(owner_id: int) -> None:
+    invalidate(DEVICE_REGISTRY_TOPIC, ("owner", owner_id))
@@ -0,0 +1,236 @@
+"""
+Streamed bulk export of IoT readings.
+
+Rows are fetched in fixed-size keyset-paginated chunks and each chunk is
+encoded and handed on before the next is fetched, so memory stays flat
+whatever the export size and database driver.
+
+Also usable from the command line:
+
+    python -m app.service.export_service --device 1 --device 2 \\
+        --start 2024-01-01 --end 2024-02-01 --format parquet -o readings.parquet
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import IoTData
+from app.pagination import keyset_predicate
+from app.service.reading_query_service import reading_conditions
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow and Parquet exports are unavailable without pyarrow
+    pa = pq = None
+
+EXPORT_CHUNK_ROWS = 10_000  # rows per query, and per Arrow batch / Parquet row group
+
+EXPORT_COLUMNS = ("id", "device_id", "parameter", "sensor_value", "timestamp")
+# Like the MySQL clustered key, so each chunk is a range scan without sorting
+EXPORT_ORDER = (IoTData.device_id, IoTData.timestamp, IoTData.id)
+
+FORMATS = ("csv", "ndjson", "arrow", "parquet")
+COMPRESSIONS = ("none", "gzip")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class UnsupportedFormat(Exception):
+    """Raised for an unknown format, or Arrow/Parquet without pyarrow installed."""
+
+
+def check_format(fmt: str, compression: str = "none") -> None:
+    if fmt not in FORMATS:
+        raise UnsupportedFormat(f"Unknown export format: {fmt}")
+    if compression not in COMPRESSIONS:
+        raise UnsupportedFormat(f"Unknown compression: {compression}")
+    if fmt in ("arrow", "parquet") and pa is None:
+        raise UnsupportedFormat(f"{fmt} export requires pyarrow")
+
+
+def export_filename(fmt: str, compression: str = "none") -> str:
+    # Parquet compresses its pages internally instead of being wrapped in gzip
+    suffix = ".gz" if compression == "gzip" and fmt != "parquet" else ""
+    return f"readings.{fmt}{suffix}"
+
+
+def iter_chunks(conditions: list, chunk_rows: int = EXPORT_CHUNK_ROWS, session_factory=SessionLocal) -> Iterator[List[tuple]]:
+    """
+    Yield matching readings as lists of tuples (EXPORT_COLUMNS order), one per query.
+
+    Each chunk is its own LIMIT query resuming after the last row of the
+    previous one. A server-side cursor would hold a connection and snapshot
+    for the whole download, and the sync MySQL driver (mysqlconnector) has
+    none: it buffers the full result.
+    """
+    stmt = (
+        select(*(getattr(IoTData, column) for column in EXPORT_COLUMNS))
+        .where(*conditions)
+        .order_by(*EXPORT_ORDER)
+        .limit(chunk_rows)
+    )
+    db = session_factory()
+    try:
+        last = None
+        while True:
+            chunk = stmt if last is None else stmt.where(keyset_predicate(EXPORT_ORDER, last))
+            rows = [tuple(row) for row in db.execute(chunk)]
+            # End the read transaction while the client consumes the chunk
+            db.rollback()
+            if rows:
+                yield rows
+            if len(rows) < chunk_rows:
+                return
+            id_, device_id, _, _, timestamp = rows[-1]
+            last = (device_id, timestamp, id_)
+    finally:
+        db.close()
+
+
+def encode_csv(chunks: Iterable[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows((*row[:4], row[4].isoformat()) for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def encode_ndjson(chunks: Iterable[List[tuple]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, (*row[:4], row[4].isoformat())))) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("device_id", pa.int64()),
+        ("parameter", pa.string()),
+        ("sensor_value", pa.float64()),
+        ("timestamp", pa.timestamp("us")),
+    ])
+
+
+def _record_batch(schema, rows: List[tuple]):
+    columns = list(zip(*rows))
+    return pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+
+def encode_arrow(chunks: Iterable[List[tuple]]) -> Iterator[bytes]:
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in chunks:
+            if rows:
+                writer.write_batch(_record_batch(schema, rows))
+                yield sink.drain()
+    yield sink.drain()
+
+
+def encode_parquet(chunks: Iterable[List[tuple]], compression: str = "none") -> Iterator[bytes]:
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for rows in chunks:
+            if rows:
+                # One row group per chunk; the footer is written on close
+                writer.write_batch(_record_batch(schema, rows))
+                yield sink.drain()
+    yield sink.drain()
+
+
+def gzip_stream(parts: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_readings(
+    conditions: list,
+    fmt: str = "csv",
+    compression: str = "none",
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    session_factory=SessionLocal,
+) -> Iterator[bytes]:
+    """
+    Encoded export of the readings matching `conditions`, as a stream of byte chunks.
+
+    The database session is opened when iteration starts and closed when it ends.
+    """
+    check_format(fmt, compression)
+    chunks = iter_chunks(conditions, chunk_rows, session_factory)
+    if fmt == "parquet":
+        return encode_parquet(chunks, compression)
+    encoded = {"csv": encode_csv, "ndjson": encode_ndjson, "arrow": encode_arrow}[fmt](chunks)
+    return gzip_stream(encoded) if compression == "gzip" else encoded
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export IoT readings without loading them into memory.")
+    parser.add_argument("--device", type=int, action="append", required=True, help="Device ID (repeatable)")
+    parser.add_argument("--parameter", help="Only this parameter")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Readings at or after this time (UTC)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Readings before this time (UTC)")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        check_format(args.format, args.compression)
+    except UnsupportedFormat as exc:
+        parser.error(str(exc))
+    conditions = reading_conditions(args.device, args.parameter, args.start, args.end)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for part in export_readings(conditions, args.format, args.compression, args.chunk_rows):
+            out.write(part)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
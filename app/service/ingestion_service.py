@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.database import SessionLocal
+from app.metrics import registry
+from app.models import IoTData
+
+logger = logging.getLogger(__name__)
+
+# Write-buffer tuning
+FLUSH_BATCH_ROWS = 5_000        # flush as soon as this many rows are pending
+FLUSH_INTERVAL_SECONDS = 1.0    # ...or when the oldest pending row is this old
+MAX_BUFFERED_ROWS = 100_000     # backpressure threshold
+INSERT_CHUNK_ROWS = 1_000       # rows per executemany call
+
+
+INGESTED_ROWS = registry.counter("ingestion_rows_written_total", "IoT readings written by the ingestion buffer.")
+INGESTION_FAILURES = registry.counter("ingestion_flush_failures_total", "Failed ingestion buffer writes (rows re-queued).")
+INGESTION_REJECTED = registry.counter(
+    "ingestion_rows_rejected_total", "IoT readings dropped because the database rejected them.",
+)
+INGESTION_FLUSH_SECONDS = registry.histogram("ingestion_flush_duration_seconds", "Time to write one ingestion batch.")
+
+
+class BufferFull(Exception):
+    """Raised when accepting a batch would exceed the buffer capacity."""
+
+
+class IngestionBuffer:
+    """
+    In-process write buffer for IoT readings.
+
+    Request handlers append validated rows with `submit`; a background thread
+    writes them with multi-row INSERTs when `batch_rows` are pending or
+    `flush_interval` seconds have passed. Listeners registered with
+    `add_listener` receive each committed batch (e.g. for alert evaluation).
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        batch_rows: int = FLUSH_BATCH_ROWS,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        max_rows: int = MAX_BUFFERED_ROWS,
+        chunk_rows: int = INSERT_CHUNK_ROWS,
+    ):
+        self.session_factory = session_factory
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.chunk_rows = chunk_rows
+        self._pending: List[dict] = []
+        self._oldest = None
+        self._listeners: List[Callable[[List[dict]], None]] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._retry_after = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def add_listener(self, listener: Callable[[List[dict]], None]) -> None:
+        # Idempotent, so building several apps doesn't process batches twice
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def submit(self, rows: List[dict]) -> int:
+        """
+        Queue rows for writing and return the buffer depth afterwards.
+        """
+        if not rows:
+            return self.depth
+        self.start()
+        with self._cond:
+            if len(self._pending) + len(rows) > self.max_rows:
+                raise BufferFull(f"Ingestion buffer full ({len(self._pending)} rows pending)")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.extend(rows)
+            depth = len(self._pending)
+            if depth >= self.batch_rows:
+                self._cond.notify()
+        return depth
+
+    def flush(self) -> int:
+        """
+        Write everything currently pending. Returns the number of rows written.
+        """
+        with self._flush_lock:
+            with self._cond:
+                rows, self._pending, self._oldest = self._pending, [], None
+            if not rows:
+                return 0
+            try:
+                with INGESTION_FLUSH_SECONDS.time():
+                    self._write(rows)
+            except (IntegrityError, DataError) as exc:
+                # Some rows can never be written (e.g. their device was deleted):
+                # re-queueing the batch would fail every later flush as well
+                logger.warning("IoT readings rejected (%r); writing the batch in parts", exc.orig)
+                rows, remaining = self._write_isolating(rows)
+                if remaining:
+                    INGESTION_FAILURES.inc()
+                    self._requeue(remaining)
+            except Exception:
+                logger.exception("Failed to write %d IoT readings; re-queueing", len(rows))
+                INGESTION_FAILURES.inc()
+                self._requeue(rows)
+                return 0
+            if not rows:
+                return 0
+            INGESTED_ROWS.inc(amount=len(rows))
+            for listener in self._listeners:
+                try:
+                    listener(rows)
+                except Exception:
+                    logger.exception("Ingestion listener %r failed", listener)
+            return len(rows)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="iot-ingestion-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the flusher thread after writing any pending rows.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _due(self) -> bool:
+        if not self._pending or time.monotonic() < self._retry_after:
+            return False
+        return (
+            len(self._pending) >= self.batch_rows
+            or time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping and not self._due():
+                    timeout = self.flush_interval
+                    if self._oldest is not None:
+                        timeout = max(0.0, self._oldest + self.flush_interval - time.monotonic())
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+            self.flush()
+
+    def _write(self, rows: List[dict]) -> None:
+        db = self.session_factory()
+        try:
+            for start in range(0, len(rows), self.chunk_rows):
+                # executemany: the MySQL drivers rewrite this into multi-row INSERTs
+                db.execute(insert(IoTData), rows[start:start + self.chunk_rows])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_isolating(self, rows: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """
+        Write `rows` in ever smaller parts, dropping the single rows the
+        database rejects. Returns (written, remaining): `remaining` holds the
+        rows not attempted because of another (e.g. connection) error.
+        """
+        written: List[dict] = []
+        # A stack, the earliest part on top; the whole batch has already failed
+        middle = len(rows) // 2
+        parts = [part for part in (rows[middle:], rows[:middle]) if part]
+        while parts:
+            part = parts.pop()
+            try:
+                self._write(part)
+            except (IntegrityError, DataError) as exc:
+                if len(part) > 1:
+                    middle = len(part) // 2
+                    parts += [part[middle:], part[:middle]]
+                    continue
+                logger.error("Dropping IoT reading %r: %r", part[0], exc.orig)
+                INGESTION_REJECTED.inc()
+            except Exception:
+                logger.exception("Failed to write IoT readings; re-queueing the rest")
+                return written, part + [row for rest in reversed(parts) for row in rest]
+            else:
+                written += part
+        return written, []
+
+    def _requeue(self, rows: List[dict]) -> None:
+        with self._cond:
+            room = self.max_rows - len(self._pending)
+            if room < len(rows):
+                logger.error("Dropping %d IoT readings; buffer is full", len(rows) - max(room, 0))
+                rows = rows[:max(room, 0)]
+            self._pending[:0] = rows
+            if self._pending:
+                self._oldest = time.monotonic()
+            # Back off for one interval so a failing database isn't hammered
+            self._retry_after = time.monotonic() + self.flush_interval
+
+
+ingestion_buffer = IngestionBuffer()
+
+registry.gauge("ingestion_buffer_depth", "IoT readings waiting in the ingestion buffer.", lambda: ingestion_buffer.depth)
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Set
+
+# Events buffered per connection before it is treated as a slow consumer
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Delivered instead of further events once a subscriber's queue overflows
+LAGGED = object()
+
+
+class Subscription:
+    """
+    One live connection's view of a user's notification stream.
+
+    Must be created on the event loop that will consume it; publishers on
+    any thread hand events over with `call_soon_threadsafe`.
+    """
+
+    def __init__(self, user_id: int, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.lagged = False
+
+    def _offer(self, event) -> None:
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Drop the backlog and tell the consumer to resync from the database
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(LAGGED)
+
+    async def get(self, timeout: float = None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class NotificationHub:
+    """
+    In-process pub/sub of newly created notifications, keyed by user id.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int, maxsize: int = SUBSCRIBER_QUEUE_SIZE) -> Subscription:
+        subscription = Subscription(user_id, maxsize)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def publish(self, events: Iterable[dict]) -> None:
+        """
+        Fan events (each with a "user_id") out to that user's subscribers. Thread-safe.
+        """
+        if not self._subscribers:
+            return
+        for event in events:
+            with self._lock:
+                subscribers = list(self._subscribers.get(event["user_id"], ()))
+            for subscription in subscribers:
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription._offer, event)
+                except RuntimeError:
+                    # The subscriber's loop has shut down
+                    self.unsubscribe(subscription)
+
+
+notification_hub = NotificationHub()
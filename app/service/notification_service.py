@@ -0,0 +1,297 @@
+import asyncio
+import json
+import logging
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import insert, select, update
+
+from app.config import Settings, get_settings
+from app.database import AsyncSessionLocal, get_async_engine
+from app.models import DeliveryJob, Notification, User
+from app.service.notification_hub import notification_hub
+from app.service.dashboard_service import invalidate_dashboard
+from app.response_cache import invalidate_responses
+from app.service.transports import SEND_TIMEOUT_SECONDS, transports
+
+logger = logging.getLogger(__name__)
+
+# Columns published to live subscribers (matches schemas.NotificationResponse plus user_id)
+_PUBLISHED_COLUMNS = (
+    Notification.id, Notification.user_id, Notification.message,
+    Notification.is_read, Notification.created_at,
+)
+
+# Every notification is also mirrored to this URL when set (e.g. an ops chat integration)
+NOTIFICATION_WEBHOOK_URL = get_settings().notification_webhook_url
+
+NOTIFICATION_SUBJECT = "IoT alert"
+
+# Delivery worker tuning
+DELIVERY_CONCURRENCY = get_settings().delivery_concurrency  # batches sent at once
+DELIVERY_MAX_ATTEMPTS = get_settings().delivery_max_attempts
+DELIVERY_BATCH_MESSAGES = 50  # messages folded into one delivery per recipient
+DELIVERY_CLAIM_JOBS = 500
+DELIVERY_POLL_SECONDS = 5.0
+DELIVERY_LEASE_SECONDS = 300  # a claimed job is retried if its worker dies
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+PENDING, SENDING, SENT, FAILED = "pending", "sending", "sent", "failed"
+
+
+def create_notifications(db, rows: List[dict]) -> List[dict]:
+    """
+    Insert notifications in one statement, queue their delivery, commit, and
+    push them to live subscribers.
+
+    `rows` are dicts with "user_id" and "message". Returns the created rows.
+    """
+    if not rows:
+        return []
+    if db.get_bind().dialect.insert_executemany_returning:
+        result = db.execute(
+            insert(Notification).returning(*_PUBLISHED_COLUMNS, sort_by_parameter_order=True), rows
+        )
+        created = [dict(row._mapping) for row in result]
+    else:
+        # e.g. MySQL: no RETURNING, so let the ORM collect the generated ids
+        objects = [Notification(**row) for row in rows]
+        db.add_all(objects)
+        db.flush()
+        ids = [obj.id for obj in objects]
+        created = [dict(row._mapping) for row in db.execute(
+            select(*_PUBLISHED_COLUMNS).where(Notification.id.in_(ids)).order_by(Notification.id)
+        )]
+    _enqueue_notification_jobs(db, created)
+    db.commit()
+    delivery_worker.notify()
+    for user_id in {row["user_id"] for row in created}:
+        invalidate_dashboard(user_id)
+        invalidate_responses(user_id, "notifications")
+    notification_hub.publish(created)
+    return created
+
+
+def _enqueue_notification_jobs(db, created: List[dict]) -> None:
+    emails = dict(db.execute(
+        select(User.id, User.email).where(User.id.in_({row["user_id"] for row in created}))
+    ).all())
+    jobs = []
+    for row in created:
+        message = {"subject": NOTIFICATION_SUBJECT, "body": row["message"], "notification_id": row["id"]}
+        if "email" in transports and emails.get(row["user_id"]):
+            jobs.append(_job("email", emails[row["user_id"]], message))
+        if NOTIFICATION_WEBHOOK_URL:
+            jobs.append(_job("webhook", NOTIFICATION_WEBHOOK_URL, dict(message, user_id=row["user_id"])))
+    if jobs:
+        db.execute(insert(DeliveryJob), jobs)
+
+
+def _job(channel: str, recipient: str, message: dict) -> dict:
+    now = datetime.utcnow()
+    return {
+        "channel": channel, "recipient": recipient, "payload": json.dumps(message, default=str),
+        "status": PENDING, "attempts": 0, "next_attempt_at": now, "created_at": now,
+    }
+
+
+def enqueue_email(db, recipient: str, subject: str, body: str) -> None:
+    """
+    Queue an email for the delivery worker and commit. Dropped (and logged)
+    when no email transport is configured.
+    """
+    if "email" not in transports:
+        logger.info("No email transport: not sending %r to %s", subject, recipient)
+        return
+    db.execute(insert(DeliveryJob), [_job("email", recipient, {"subject": subject, "body": body})])
+    db.commit()
+    delivery_worker.notify()
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with jitter after `attempts` failed sends.
+    """
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class DeliveryWorker:
+    """
+    Sends queued delivery jobs from the app's event loop.
+
+    Due jobs are claimed in bulk (leased by pushing next_attempt_at forward),
+    grouped per (channel, recipient) so each recipient gets one batched
+    delivery, and sent with at most `concurrency` batches in flight.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = DELIVERY_CONCURRENCY,
+        max_attempts: int = DELIVERY_MAX_ATTEMPTS,
+        batch_messages: int = DELIVERY_BATCH_MESSAGES,
+        claim_jobs: int = DELIVERY_CLAIM_JOBS,
+        poll_interval: float = DELIVERY_POLL_SECONDS,
+    ):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.batch_messages = batch_messages
+        self.claim_jobs = claim_jobs
+        self.poll_interval = poll_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    def notify(self) -> None:
+        """
+        Wake the worker after new jobs were committed. Safe from any thread.
+        """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        get_async_engine()
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        if self._in_flight:
+            await asyncio.wait(self._in_flight, timeout=SEND_TIMEOUT_SECONDS)
+        self._task = self._loop = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                claimed = await self.run_once()
+            except Exception:
+                logger.exception("Delivery worker failed to claim jobs")
+                claimed = 0
+            if claimed < self.claim_jobs:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def run_once(self) -> int:
+        """
+        Claim due jobs and dispatch them; returns how many were claimed.
+        """
+        jobs = await self._claim()
+        for (channel, recipient), group in _group_jobs(jobs).items():
+            for offset in range(0, len(group), self.batch_messages):
+                while len(self._in_flight) >= self.concurrency:
+                    await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                task = asyncio.create_task(self._deliver(channel, recipient, group[offset:offset + self.batch_messages]))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+        return len(jobs)
+
+    async def drain(self) -> None:
+        """
+        Wait for every dispatched batch to finish (used by tests and shutdown).
+        """
+        while self._in_flight:
+            await asyncio.wait(self._in_flight)
+
+    async def _claim(self) -> List[DeliveryJob]:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(DeliveryJob)
+                .where(DeliveryJob.status.in_((PENDING, SENDING)), DeliveryJob.next_attempt_at <= now)
+                .order_by(DeliveryJob.next_attempt_at)
+                .limit(self.claim_jobs)
+                .with_for_update(skip_locked=True)
+            )
+            jobs = result.scalars().all()
+            if jobs:
+                await db.execute(
+                    update(DeliveryJob)
+                    .where(DeliveryJob.id.in_([job.id for job in jobs]))
+                    .values(status=SENDING, next_attempt_at=now + timedelta(seconds=DELIVERY_LEASE_SECONDS))
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+            return jobs
+
+    async def _deliver(self, channel: str, recipient: str, jobs: List[DeliveryJob]) -> None:
+        try:
+            transport = transports[channel]
+            messages = [json.loads(job.payload) for job in jobs]
+            await asyncio.wait_for(transport.send(recipient, messages), SEND_TIMEOUT_SECONDS * 2)
+        except Exception as exc:
+            logger.warning("Delivery of %d %s message(s) to %s failed: %r", len(jobs), channel, recipient, exc)
+            await self._record_failure(jobs, repr(exc))
+        else:
+            await self._record_success(jobs)
+
+    async def _record_success(self, jobs: List[DeliveryJob]) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(DeliveryJob)
+                .where(DeliveryJob.id.in_([job.id for job in jobs]))
+                .values(status=SENT, sent_at=datetime.utcnow(), attempts=DeliveryJob.attempts + 1,
+                        payload=None, last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _record_failure(self, jobs: List[DeliveryJob], error: str) -> None:
+        now = datetime.utcnow()
+        # One delay for the whole batch so it is retried as a batch
+        delay = retry_delay(max(job.attempts for job in jobs) + 1)
+        retrying = False
+        rows = []
+        for job in jobs:
+            attempts = job.attempts + 1
+            give_up = attempts >= self.max_attempts
+            retrying = retrying or not give_up
+            rows.append({
+                "id": job.id,
+                "attempts": attempts,
+                "status": FAILED if give_up else PENDING,
+                "next_attempt_at": now if give_up else now + timedelta(seconds=delay),
+                "last_error": error[:255],
+            })
+        async with AsyncSessionLocal() as db:
+            # Bulk UPDATE by primary key (one executemany)
+            await db.execute(update(DeliveryJob), rows)
+            await db.commit()
+        if retrying and self._loop is not None:
+            # Retry on time even if that is sooner than the next poll
+            self._loop.call_later(delay, self._wake.set)
+
+
+def _group_jobs(jobs: Iterable[DeliveryJob]) -> Dict[tuple, List[DeliveryJob]]:
+    groups: Dict[tuple, List[DeliveryJob]] = defaultdict(list)
+    for job in jobs:
+        groups[job.channel, job.recipient].append(job)
+    return groups
+
+
+delivery_worker = DeliveryWorker()
+
+
+def configure(settings: Settings) -> None:
+    """
+    Apply the webhook mirror and delivery tuning of `settings` (call before startup).
+    """
+    global NOTIFICATION_WEBHOOK_URL
+    NOTIFICATION_WEBHOOK_URL = settings.notification_webhook_url
+    delivery_worker.concurrency = settings.delivery_concurrency
+    delivery_worker.max_attempts = settings.delivery_max_attempts
@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+from app.config import Settings, get_settings
+
+# bcrypt work factor; hashes with any other cost are upgraded on the next successful login
+BCRYPT_ROUNDS = get_settings().bcrypt_rounds
+
+# Processes running bcrypt; 0 falls back to the thread pool (development/tests)
+PASSWORD_HASH_WORKERS = get_settings().password_hash_workers
+
+
+def configure(settings: Settings) -> None:
+    """
+    Use the work factor and hashing processes of `settings` (call before startup).
+    """
+    global BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
+    if PASSWORD_HASH_WORKERS != settings.password_hash_workers:
+        # The pool is sized when it starts
+        shutdown()
+    BCRYPT_ROUNDS = settings.bcrypt_rounds
+    PASSWORD_HASH_WORKERS = settings.password_hash_workers
+
+
+def crypt_context(rounds: Optional[int] = None) -> CryptContext:
+    """
+    The password hashing policy for a given work factor (default: BCRYPT_ROUNDS).
+
+    min/max desired rounds make `verify_and_update` report hashes with a
+    different cost, so raising or lowering BCRYPT_ROUNDS migrates users lazily.
+    """
+    return _crypt_context(BCRYPT_ROUNDS if rounds is None else rounds)
+
+
+@lru_cache(maxsize=None)
+def _crypt_context(rounds: int) -> CryptContext:
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_desired_rounds=rounds,
+        bcrypt__max_desired_rounds=rounds,
+    )
+
+
+# Module-level so they can be pickled into the worker processes
+def _hash(password: str, rounds: int) -> str:
+    return crypt_context(rounds).hash(password)
+
+
+def _verify_and_update(password: str, hashed: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    if not hashed:
+        return False, None
+    try:
+        return crypt_context(rounds).verify_and_update(password, hashed)
+    except ValueError:
+        # Not a recognised hash (e.g. legacy plaintext rows)
+        return False, None
+
+
+def _warm_up(rounds: int) -> None:
+    # Imports passlib and loads the bcrypt backend (it self-tests on first use)
+    crypt_context(rounds).handler("bcrypt").get_backend()
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if _executor is None and PASSWORD_HASH_WORKERS > 0:
+        # spawn: forking a process that already runs the ingestion thread is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def _run(fn, *args):
+    executor = _get_executor()
+    if executor is None:
+        return await run_in_threadpool(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hash a password off the event loop.
+    """
+    return await _run(_hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password off the event loop.
+
+    Returns (valid, new_hash); `new_hash` is set when the stored hash uses a
+    different work factor and should replace it.
+    """
+    return await _run(_verify_and_update, password, hashed, BCRYPT_ROUNDS)
+
+
+async def warm_up() -> None:
+    """
+    Start every hashing process and load bcrypt in it, so the first logins
+    after startup don't wait for process spawn and imports.
+    """
+    _warm_up(BCRYPT_ROUNDS)  # for the synchronous helpers in app.security
+    executor = _get_executor()
+    if executor is None:
+        return
+    loop = asyncio.get_running_loop()
+    # Submitted together, each task finds no idle worker and spawns one
+    await asyncio.gather(*(
+        loop.run_in_executor(executor, _warm_up, BCRYPT_ROUNDS) for _ in range(PASSWORD_HASH_WORKERS)
+    ))
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,263 @@
+import csv
+import io
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import func, insert, select
+
+from app.models import Device, DeviceInput, System
+from app.schemas import DeviceImport, DeviceInputImport, SystemImport
+from app.response_cache import invalidate_responses
+from app.service.alert_service import alert_engine
+from app.service.dashboard_service import invalidate_dashboard
+from app.service.device_registry import ThresholdRecord, invalidate_owner_devices
+
+# Systems + devices + device inputs accepted in one import
+MAX_IMPORT_ITEMS = 10_000
+
+# CSV imports: one row per device input (or per device / system without children)
+CSV_COLUMNS = (
+    "system_name", "system_description", "widget_type", "device_name", "device_status",
+    "parameter", "min_value", "max_value", "alert_enabled",
+)
+
+
+class ImportTooLarge(Exception):
+    pass
+
+
+def site_from_csv(text: str) -> dict:
+    """
+    Fold flat CSV rows into the nested {"systems": [...]} import document.
+
+    Rows are grouped by system name, then by device name within the system;
+    the first row of a system or device supplies its own fields.
+    """
+    systems: Dict[str, dict] = {}
+    devices: Dict[Tuple[str, str], dict] = {}
+    reader = csv.DictReader(io.StringIO(text))
+    unknown = set(reader.fieldnames or ()) - set(CSV_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown CSV columns: {sorted(unknown)}; expected {list(CSV_COLUMNS)}")
+    for row in reader:
+        row = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        system = systems.get(row.get("system_name"))
+        if system is None:
+            system = systems[row.get("system_name")] = _present(
+                name=row.get("system_name"), description=row.get("system_description"),
+                widget_type=row.get("widget_type"), devices=[],
+            )
+        if "device_name" not in row:
+            continue
+        device_key = (row.get("system_name"), row["device_name"])
+        device = devices.get(device_key)
+        if device is None:
+            device = devices[device_key] = _present(name=row["device_name"], status=row.get("device_status"), inputs=[])
+            system["devices"].append(device)
+        if "parameter" in row:
+            device["inputs"].append(_present(
+                parameter=row["parameter"], min_value=row.get("min_value"),
+                max_value=row.get("max_value"), alert_enabled=row.get("alert_enabled"),
+            ))
+    return {"systems": list(systems.values())}
+
+
+def _present(**fields) -> dict:
+    # Missing CSV cells are omitted so model defaults and "field required" errors apply
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+def _validate(model, raw, path: str, kind: str, results: List[dict]) -> Optional[BaseModel]:
+    try:
+        if not isinstance(raw, dict):
+            raise TypeError("expected an object")
+        item = model.model_validate(raw)
+    except (ValidationError, TypeError) as exc:
+        errors = (
+            [f"{'.'.join(map(str, e['loc'])) or 'item'}: {e['msg']}" for e in exc.errors(include_url=False)]
+            if isinstance(exc, ValidationError) else [str(exc)]
+        )
+        results.append({"path": path, "kind": kind, "status": "invalid", "errors": errors})
+        return None
+    results.append({"path": path, "kind": kind, "status": "created"})
+    return item
+
+
+def _children(raw, key: str) -> list:
+    # Child items of a raw node; anything but a list is left to validation to report
+    children = raw.get(key) if isinstance(raw, dict) else None
+    return children if isinstance(children, list) else []
+
+
+def _skip_children(raw, path: str, results: List[dict]) -> None:
+    # Children of an invalid item are reported, never inserted
+    for j, device in enumerate(_children(raw, "devices")):
+        results.append({"path": f"{path}.devices[{j}]", "kind": "device", "status": "skipped"})
+        for k, _ in enumerate(_children(device, "inputs")):
+            results.append({"path": f"{path}.devices[{j}].inputs[{k}]", "kind": "device_input", "status": "skipped"})
+    for k, _ in enumerate(_children(raw, "inputs")):
+        results.append({"path": f"{path}.inputs[{k}]", "kind": "device_input", "status": "skipped"})
+
+
+def validate_site(site) -> Tuple[List[dict], List[tuple]]:
+    """
+    Validate a whole import document in one pass.
+
+    Returns (results, plan): `results` holds one entry per item in document
+    order; `plan` lists the valid (system, [(device, [input, ...]), ...])
+    trees with each node's index into `results`.
+    """
+    raw_systems = site.get("systems") if isinstance(site, dict) else None
+    if not isinstance(raw_systems, list):
+        raise ValueError('Expected {"systems": [...]}')
+    total = sum(
+        1 + sum(1 + len(_children(d, "inputs")) for d in _children(s, "devices"))
+        for s in raw_systems
+    )
+    if total > MAX_IMPORT_ITEMS:
+        raise ImportTooLarge(f"Import has {total} items; the limit is {MAX_IMPORT_ITEMS}")
+
+    results: List[dict] = []
+    plan = []
+    for i, raw_system in enumerate(raw_systems):
+        path = f"systems[{i}]"
+        system = _validate(SystemImport, raw_system, path, "system", results)
+        if system is None:
+            _skip_children(raw_system, path, results)
+            continue
+        system_node = (len(results) - 1, system, [])
+        for j, raw_device in enumerate(system.devices):
+            device_path = f"{path}.devices[{j}]"
+            device = _validate(DeviceImport, raw_device, device_path, "device", results)
+            if device is None:
+                _skip_children(raw_device, device_path, results)
+                continue
+            device_node = (len(results) - 1, device, [])
+            for k, raw_input in enumerate(device.inputs):
+                device_input = _validate(DeviceInputImport, raw_input, f"{device_path}.inputs[{k}]", "device_input", results)
+                if device_input is not None:
+                    device_node[2].append((len(results) - 1, device_input))
+            system_node[2].append(device_node)
+        plan.append(system_node)
+    return results, plan
+
+
+def _insert_ids(db, model, owner_column, rows: List[dict]) -> List[int]:
+    """
+    Insert `rows` in one batched statement and return their ids in order.
+
+    Without RETURNING (e.g. MySQL) the ids are read back like
+    `_insert_children`: the owner's rows above its highest existing id. The
+    transaction's snapshot hides rows other transactions commit meanwhile.
+    """
+    if not rows:
+        return []
+    if db.get_bind().dialect.insert_executemany_returning:
+        return list(db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows).scalars())
+    owner_key = owner_column.key
+    owners = {row[owner_key] for row in rows}
+    floors = dict(db.execute(
+        select(owner_column, func.max(model.id)).where(owner_column.in_(owners)).group_by(owner_column)
+    ).all())
+    db.execute(insert(model), rows)
+    created: Dict[int, deque] = defaultdict(deque)
+    for new_id, owner_id in db.execute(
+        select(model.id, owner_column)
+        .where(owner_column.in_(owners), model.id > min(floors.get(owner, 0) for owner in owners))
+        .order_by(model.id)
+    ):
+        if new_id > floors.get(owner_id, 0):
+            created[owner_id].append(new_id)
+    if sum(map(len, created.values())) != len(rows):
+        # Only possible below REPEATABLE READ, with a concurrent import by the same owner
+        raise RuntimeError(f"Could not read back the ids of the new {model.__tablename__}")
+    return [created[row[owner_key]].popleft() for row in rows]
+
+
+def _insert_children(db, model, parent_column, rows: List[dict]) -> List[int]:
+    """
+    Insert child rows with one executemany and read their ids back in order.
+
+    The parents were created in this (uncommitted) transaction, so every
+    child of them is ours, and ids increase in insertion order per parent.
+    This batches on every backend, unlike RETURNING with parameter order.
+    """
+    if not rows:
+        return []
+    db.execute(insert(model), rows)
+    parent_key = parent_column.key
+    created: Dict[int, deque] = defaultdict(deque)
+    for new_id, parent_id in db.execute(
+        select(model.id, parent_column)
+        .where(parent_column.in_({row[parent_key] for row in rows}))
+        .order_by(model.id)
+    ):
+        created[parent_id].append(new_id)
+    return [created[row[parent_key]].popleft() for row in rows]
+
+
+def import_site(db, owner_id: int, site, atomic: bool = True) -> dict:
+    """
+    Validate and insert a site description in a single transaction.
+
+    One batched INSERT per level (systems, devices, device inputs). With
+    `atomic`, any invalid item aborts the import before anything is written;
+    otherwise invalid items and their children are skipped.
+    """
+    results, plan = validate_site(site)
+    invalid = sum(result["status"] == "invalid" for result in results)
+    if invalid and atomic:
+        for result in results:
+            if result["status"] == "created":
+                result["status"] = "skipped"
+        return {"created": {"systems": 0, "devices": 0, "device_inputs": 0}, "invalid": invalid, "items": results}
+
+    try:
+        system_ids = _insert_ids(db, System, System.owner_id, [
+            {"name": system.name, "description": system.description, "widget_type": system.widget_type, "owner_id": owner_id}
+            for _, system, _ in plan
+        ])
+        device_nodes = [
+            (system_id, device_node)
+            for system_id, (_, _, devices) in zip(system_ids, plan)
+            for device_node in devices
+        ]
+        device_ids = _insert_children(db, Device, Device.system_id, [
+            {"name": device.name, "status": device.status, "system_id": system_id}
+            for system_id, (_, device, _) in device_nodes
+        ])
+        input_nodes = [
+            (device_id, input_node)
+            for device_id, (_, (_, _, inputs)) in zip(device_ids, device_nodes)
+            for input_node in inputs
+        ]
+        input_ids = _insert_children(db, DeviceInput, DeviceInput.device_id, [
+            {**device_input.dict(), "device_id": device_id, "owner_id": owner_id}
+            for device_id, (_, device_input) in input_nodes
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    invalidate_dashboard(owner_id)
+    invalidate_owner_devices(owner_id)
+    invalidate_responses(owner_id, "systems", "device_inputs")
+    for new_id, (device_id, (_, device_input)) in zip(input_ids, input_nodes):
+        alert_engine.upsert_rule(ThresholdRecord(
+            new_id, device_id, device_input.parameter, device_input.min_value, device_input.max_value,
+            device_input.alert_enabled, owner_id,
+        ))
+
+    for new_id, (index, _, _) in zip(system_ids, plan):
+        results[index]["id"] = new_id
+    for new_id, (_, (index, _, _)) in zip(device_ids, device_nodes):
+        results[index]["id"] = new_id
+    for new_id, (_, (index, _)) in zip(input_ids, input_nodes):
+        results[index]["id"] = new_id
+    return {
+        "created": {"systems": len(system_ids), "devices": len(device_ids), "device_inputs": len(input_ids)},
+        "invalid": invalid,
+        "items": results,
+    }
@@ -0,0 +1,134 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import case, func, select
+
+from app.models import IoTData
+
+# Columns a caller may group aggregates by
+GROUP_COLUMNS = {"device": IoTData.device_id, "parameter": IoTData.parameter}
+
+MAX_PERCENTILES = 10
+MAX_HISTOGRAM_BUCKETS = 1000
+
+
+def reading_conditions(
+    device_ids: Sequence[int],
+    parameter: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+) -> list:
+    """
+    WHERE clauses for a readings filter.
+
+    Every column involved is in ix_iot_data_device_param_ts (device_id,
+    parameter, timestamp, sensor_value), so filters and aggregates are
+    answered from the index without reading table rows.
+    """
+    conditions = [IoTData.device_id.in_(device_ids)]
+    if parameter is not None:
+        conditions.append(IoTData.parameter == parameter)
+    if start is not None:
+        conditions.append(IoTData.timestamp >= start)
+    if end is not None:
+        conditions.append(IoTData.timestamp < end)
+    if min_value is not None:
+        conditions.append(IoTData.sensor_value >= min_value)
+    if max_value is not None:
+        conditions.append(IoTData.sensor_value <= max_value)
+    return conditions
+
+
+def aggregate_readings(
+    db,
+    conditions: list,
+    group_by: Sequence[str] = (),
+    percentiles: Sequence[float] = (),
+    buckets: Optional[int] = None,
+    histogram_min: Optional[float] = None,
+    histogram_max: Optional[float] = None,
+) -> List[dict]:
+    """
+    Count/min/max/avg per group, plus optional percentiles and a histogram.
+
+    Each part is one grouped query, so the result size depends on the number
+    of groups and buckets, never on the number of readings.
+    """
+    keys = [GROUP_COLUMNS[name] for name in group_by]
+    stats = db.execute(
+        select(*keys, func.count(), func.min(IoTData.sensor_value), func.max(IoTData.sensor_value),
+               func.avg(IoTData.sensor_value))
+        .where(*conditions)
+        .group_by(*keys)
+    ).all()
+    groups: Dict[tuple, dict] = {}
+    for row in stats:
+        group, (count, low, high, mean) = tuple(row[:len(keys)]), row[len(keys):]
+        if not count:
+            continue  # ungrouped aggregate over no rows
+        groups[group] = {
+            "device_id": group[group_by.index("device")] if "device" in group_by else None,
+            "parameter": group[group_by.index("parameter")] if "parameter" in group_by else None,
+            "count": count,
+            "min_value": low,
+            "max_value": high,
+            "avg_value": float(mean),
+            "percentiles": {},
+            "histogram": None,
+        }
+    if not groups:
+        return []
+    if percentiles:
+        _add_percentiles(db, conditions, keys, percentiles, groups)
+    if buckets:
+        low = min(g["min_value"] for g in groups.values()) if histogram_min is None else histogram_min
+        high = max(g["max_value"] for g in groups.values()) if histogram_max is None else histogram_max
+        _add_histograms(db, conditions, keys, buckets, low, high, groups)
+    return list(groups.values())
+
+
+def _add_percentiles(db, conditions, keys, percentiles, groups) -> None:
+    # Nearest-rank percentiles: the smallest value whose cumulative share
+    # reaches p. cume_dist() needs MySQL 8+, SQLite 3.25+ or PostgreSQL.
+    ranked = select(
+        *keys,
+        IoTData.sensor_value,
+        func.cume_dist().over(partition_by=keys or None, order_by=IoTData.sensor_value).label("share"),
+    ).where(*conditions).subquery()
+    group_keys = [ranked.c[key.key] for key in keys]
+    rows = db.execute(
+        select(*group_keys, *[
+            func.min(case((ranked.c.share >= p / 100, ranked.c.sensor_value)))
+            for p in percentiles
+        ]).group_by(*group_keys)
+    )
+    for row in rows:
+        group = groups.get(tuple(row[:len(keys)]))
+        if group is not None:
+            group["percentiles"] = {_percentile_label(p): value for p, value in zip(percentiles, row[len(keys):])}
+
+
+def _add_histograms(db, conditions, keys, buckets, low, high, groups) -> None:
+    width = (high - low) / buckets if high > low else 1.0
+    bucket = case(
+        (IoTData.sensor_value >= high, buckets - 1),  # the top edge belongs to the last bucket
+        else_=func.floor((IoTData.sensor_value - low) / width),
+    )
+    for group in groups.values():
+        group["histogram"] = {"lower": low, "upper": high, "bucket_width": width, "counts": [0] * buckets}
+    rows = db.execute(
+        select(*keys, bucket, func.count())
+        .where(*conditions, IoTData.sensor_value.between(low, high))
+        .group_by(*keys, bucket)
+    )
+    for row in rows:
+        group = groups.get(tuple(row[:len(keys)]))
+        if group is not None:
+            index, count = row[len(keys):]
+            group["histogram"]["counts"][min(int(index), buckets - 1)] += count
+
+
+def _percentile_label(p: float) -> str:
+    return f"p{p:g}"
@@ -0,0 +1,272 @@
+import hashlib
+import logging
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+
+from app.config import Settings, get_settings
+from app.database import SessionLocal
+from app.models import PasswordResetToken
+
+logger = logging.getLogger(__name__)
+
+RESET_TOKEN_TTL_SECONDS = 15 * 60
+
+# At most RESET_RATE_LIMIT tokens per email in any RESET_RATE_WINDOW_SECONDS
+RESET_RATE_LIMIT = 3
+RESET_RATE_WINDOW_SECONDS = 60 * 60
+
+EVICTION_INTERVAL_SECONDS = 60
+
+# "db" shares tokens across workers and restarts; "memory" is for single-process setups
+RESET_TOKEN_STORE = get_settings().reset_token_store
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many reset requests; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class ResetTokenStore(ABC):
+    """
+    Password reset tokens, looked up by the sha256 of the token.
+
+    Issuing a token revokes the email's previous one. Expired entries are
+    removed by a background eviction thread, started on first use.
+    Subclasses implement the storage: `_store`, `_consume` and `evict_expired`.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESET_TOKEN_TTL_SECONDS,
+        rate_limit: int = RESET_RATE_LIMIT,
+        rate_window: float = RESET_RATE_WINDOW_SECONDS,
+        eviction_interval: float = EVICTION_INTERVAL_SECONDS,
+    ):
+        self.ttl = ttl
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.eviction_interval = eviction_interval
+        self._evictor = None
+        self._stop = threading.Event()
+
+    def issue(self, email: str) -> str:
+        """
+        Create a token for `email`; raises RateLimited when the email is over its quota.
+        """
+        self.start()
+        token = secrets.token_urlsafe(32)
+        self._store(email, hash_token(token))
+        return token
+
+    def consume(self, token: str) -> Optional[str]:
+        """
+        Redeem a token once; returns its email, or None if unknown, used or expired.
+        """
+        return self._consume(hash_token(token))
+
+    @abstractmethod
+    def _store(self, email: str, token_hash: str) -> None:
+        """
+        Record `token_hash` as the email's only valid token; raises RateLimited.
+        """
+
+    @abstractmethod
+    def _consume(self, token_hash: str) -> Optional[str]:
+        """
+        Mark the token used; its email if it was valid, else None.
+        """
+
+    @abstractmethod
+    def evict_expired(self) -> int:
+        """
+        Remove expired entries; returns how many were removed.
+        """
+
+    def start(self) -> None:
+        if self._evictor is not None and self._evictor.is_alive():
+            return
+        self._stop.clear()
+        self._evictor = threading.Thread(target=self._run, name="reset-token-evictor", daemon=True)
+        self._evictor.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._evictor is not None:
+            self._evictor.join()
+            self._evictor = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.eviction_interval):
+            try:
+                self.evict_expired()
+            except Exception:
+                logger.exception("Reset token eviction failed")
+
+
+class MemoryResetTokenStore(ResetTokenStore):
+    """
+    In-process store: dicts keyed by token hash and email, plus a bounded
+    issue history per email for the rate limit.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tokens: Dict[str, Tuple[str, float]] = {}  # token hash -> (email, expires_at)
+        self._by_email: Dict[str, str] = {}  # email -> its current token hash
+        self._issued: Dict[str, Deque[float]] = {}  # email -> recent issue times
+        self._lock = threading.Lock()
+
+    def _store(self, email: str, token_hash: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            issued = self._issued.setdefault(email, deque(maxlen=self.rate_limit))
+            if len(issued) == self.rate_limit and now - issued[0] < self.rate_window:
+                raise RateLimited(int(self.rate_window - (now - issued[0])) + 1)
+            issued.append(now)
+            previous = self._by_email.pop(email, None)
+            if previous is not None:
+                self._tokens.pop(previous, None)
+            self._tokens[token_hash] = (email, now + self.ttl)
+            self._by_email[email] = token_hash
+
+    def _consume(self, token_hash: str) -> Optional[str]:
+        with self._lock:
+            entry = self._tokens.pop(token_hash, None)
+            if entry is None:
+                return None
+            email, expires_at = entry
+            if self._by_email.get(email) == token_hash:
+                del self._by_email[email]
+        return email if expires_at > time.monotonic() else None
+
+    def evict_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [h for h, (_, expires_at) in self._tokens.items() if expires_at <= now]
+            for token_hash in expired:
+                email, _ = self._tokens.pop(token_hash)
+                if self._by_email.get(email) == token_hash:
+                    del self._by_email[email]
+            stale = [e for e, issued in self._issued.items() if not issued or now - issued[-1] >= self.rate_window]
+            for email in stale:
+                del self._issued[email]
+        return len(expired)
+
+
+class DatabaseResetTokenStore(ResetTokenStore):
+    """
+    Store backed by the password_reset_tokens table, shared by every worker.
+
+    Lookups go through the unique token_hash index; rows are kept (marked
+    used) for the rate-limit window and then evicted.
+    """
+
+    def __init__(self, session_factory=SessionLocal, **kwargs):
+        super().__init__(**kwargs)
+        self.session_factory = session_factory
+
+    def _store(self, email: str, token_hash: str) -> None:
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            recent = db.execute(
+                select(func.count(), func.min(PasswordResetToken.created_at))
+                .where(
+                    PasswordResetToken.email == email,
+                    PasswordResetToken.created_at > now - timedelta(seconds=self.rate_window),
+                )
+            ).one()
+            if recent[0] >= self.rate_limit:
+                retry_after = self.rate_window - (now - recent[1]).total_seconds()
+                raise RateLimited(max(int(retry_after) + 1, 1))
+            # Only the newest token for an email stays valid
+            db.execute(
+                update(PasswordResetToken)
+                .where(PasswordResetToken.email == email, PasswordResetToken.used_at.is_(None))
+                .values(used_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.add(PasswordResetToken(
+                token_hash=token_hash, email=email, created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl),
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def _consume(self, token_hash: str) -> Optional[str]:
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            row = db.execute(
+                select(PasswordResetToken.id, PasswordResetToken.email)
+                .where(
+                    PasswordResetToken.token_hash == token_hash,
+                    PasswordResetToken.used_at.is_(None),
+                    PasswordResetToken.expires_at > now,
+                )
+            ).first()
+            if row is None:
+                return None
+            # Conditional update so two concurrent redemptions cannot both succeed
+            claimed = db.execute(
+                update(PasswordResetToken)
+                .where(PasswordResetToken.id == row.id, PasswordResetToken.used_at.is_(None))
+                .values(used_at=now)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            return row.email if claimed else None
+        finally:
+            db.close()
+
+    def evict_expired(self) -> int:
+        # Expired a full window ago: also too old to count towards the rate limit
+        cutoff = datetime.utcnow() - timedelta(seconds=self.rate_window)
+        db = self.session_factory()
+        try:
+            deleted = db.execute(
+                delete(PasswordResetToken)
+                .where(PasswordResetToken.expires_at < cutoff)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+def create_token_store(kind: str = None) -> ResetTokenStore:
+    kind = kind or RESET_TOKEN_STORE
+    if kind == "memory":
+        return MemoryResetTokenStore()
+    if kind == "db":
+        return DatabaseResetTokenStore()
+    raise ValueError(f"Unknown reset token store: {kind}")
+
+
+reset_token_store = create_token_store()
+
+
+def configure(settings: Settings) -> None:
+    """
+    Switch to the token store kind of `settings` (call before startup).
+    """
+    global RESET_TOKEN_STORE, reset_token_store
+    if settings.reset_token_store == RESET_TOKEN_STORE:
+        return
+    store = create_token_store(settings.reset_token_store)
+    reset_token_store.stop()
+    RESET_TOKEN_STORE, reset_token_store = settings.reset_token_store, store
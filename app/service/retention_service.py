@@ -0,0 +1,367 @@
+"""
+Retention for the tables that only grow: iot_data and notifications.
+
+Each table has a default retention (IOT_DATA_RETENTION_DAYS,
+NOTIFICATION_RETENTION_DAYS) and optional per-tenant overrides in
+retention_policies; 0 days keeps rows forever.
+
+On MySQL iot_data is partitioned by month of timestamp. Partitions are
+created a few months ahead, and a partition is dropped once all of it is
+older than the longest iot_data retention in force, so readings go away a
+whole month at a time instead of row by row. Tenants with a shorter
+retention, other backends and notifications are purged with chunked
+deletes. A background thread runs a pass every RETENTION_INTERVAL_SECONDS.
+
+Also usable from the command line:
+
+    python -m app.service.retention_service --dry-run
+"""
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import delete, func, select, text
+
+from app.config import Settings, get_settings
+from app.database import SessionLocal
+from app.metrics import registry
+from app.models import Device, IoTData, Notification, RetentionPolicy, System
+from app.response_cache import invalidate_responses
+from app.service.dashboard_service import invalidate_dashboard
+
+logger = logging.getLogger(__name__)
+
+RETENTION_TABLES = ("iot_data", "notifications")
+
+
+def default_retention_days(settings: Settings) -> Dict[str, int]:
+    """
+    Default retention per table in days (0 keeps rows forever).
+    """
+    return {"iot_data": settings.iot_data_retention_days, "notifications": settings.notification_retention_days}
+
+
+DEFAULT_RETENTION_DAYS = default_retention_days(get_settings())
+RETENTION_INTERVAL_SECONDS = get_settings().retention_interval_seconds
+RETENTION_INITIAL_DELAY_SECONDS = 60  # first pass shortly after startup
+
+PURGE_CHUNK_ROWS = 5_000
+PURGE_PAUSE_SECONDS = 0.05  # between chunks, so row locks and replication lag stay short
+
+# Monthly iot_data partitions kept ready beyond the current month (MySQL)
+PARTITIONS_AHEAD_MONTHS = 3
+MAXVALUE_PARTITION = "pmax"
+_PARTITION_NAME = re.compile(r"^p\d{6}$|^pmax$")
+
+# Only one worker process runs a pass at a time (MySQL named lock)
+RETENTION_LOCK_NAME = "iot_backend_retention"
+
+RETENTION_ROWS_DELETED = registry.counter("retention_rows_deleted_total", "Rows deleted by retention purges.", ("table",))
+RETENTION_PARTITIONS_DROPPED = registry.counter("retention_partitions_dropped_total", "Expired iot_data partitions dropped.")
+RETENTION_RUN_SECONDS = registry.histogram(
+    "retention_run_duration_seconds", "Duration of retention passes.", buckets=(1, 5, 15, 60, 300, 900, 3600),
+)
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_clause(month: datetime) -> str:
+    # pYYYYMM holds [month, next month)
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{next_month(month):%Y-%m-%d %H:%M:%S}')"
+
+
+def _devices_owned(condition):
+    return select(Device.id).join(System, System.id == Device.system_id).where(condition)
+
+
+def _longest(days: Sequence[int]) -> Optional[int]:
+    # None: something is kept forever
+    return None if 0 in days else max(days)
+
+
+class RetentionManager:
+    """
+    Applies the retention policies, from a background thread or on demand.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        interval: float = RETENTION_INTERVAL_SECONDS,
+        initial_delay: float = RETENTION_INITIAL_DELAY_SECONDS,
+        chunk_rows: int = PURGE_CHUNK_ROWS,
+        pause: float = PURGE_PAUSE_SECONDS,
+        defaults: Dict[str, int] = None,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.chunk_rows = chunk_rows
+        self.pause = pause
+        self.defaults = dict(DEFAULT_RETENTION_DAYS if defaults is None else defaults)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def policies(self, db) -> Dict[str, Tuple[int, Dict[int, int]]]:
+        """
+        table -> (default days, {owner_id: days}) for every retention table.
+        """
+        overrides: Dict[str, Dict[int, int]] = {table: {} for table in RETENTION_TABLES}
+        for table_name, owner_id, days in db.execute(
+            select(RetentionPolicy.table_name, RetentionPolicy.owner_id, RetentionPolicy.days)
+        ):
+            if table_name in overrides:
+                overrides[table_name][owner_id] = days
+        return {table: (self.defaults[table], overrides[table]) for table in RETENTION_TABLES}
+
+    def run(self, dry_run: bool = False, now: datetime = None) -> dict:
+        """
+        One retention pass over every table.
+
+        With `dry_run` nothing is changed and the report gives what a real
+        pass would delete, drop and create.
+        """
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            with self._exclusive(db, dry_run) as acquired:
+                if not acquired:
+                    logger.info("Retention pass skipped: another worker holds the lock")
+                    return {"dry_run": dry_run, "started_at": now, "skipped": True, "tables": []}
+                policies = self.policies(db)
+                tables = [
+                    self._iot_data(db, *policies["iot_data"], now, dry_run),
+                    self._notifications(db, *policies["notifications"], now, dry_run),
+                ]
+        finally:
+            db.close()
+        if not dry_run:
+            RETENTION_RUN_SECONDS.observe(time.perf_counter() - started)
+        return {"dry_run": dry_run, "started_at": now, "skipped": False, "tables": tables}
+
+    @contextmanager
+    def _exclusive(self, db, dry_run: bool):
+        bind = db.get_bind()
+        if dry_run or bind.dialect.name != "mysql":
+            yield True
+            return
+        # A dedicated connection: the session may switch connections between commits
+        with bind.connect() as conn:
+            acquired = conn.scalar(text("SELECT GET_LOCK(:name, 0)"), {"name": RETENTION_LOCK_NAME}) == 1
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    conn.scalar(text("SELECT RELEASE_LOCK(:name)"), {"name": RETENTION_LOCK_NAME})
+
+    def _report(self, table: str, default: int, overrides: Dict[int, int]) -> dict:
+        return {
+            "table": table,
+            "default_days": default,
+            "overrides": dict(overrides),
+            "rows_deleted": 0,
+            "partitions_dropped": [],
+            "partitions_created": [],
+            "partition_rows_dropped": 0,
+        }
+
+    def _iot_data(self, db, default: int, overrides: Dict[int, int], now: datetime, dry_run: bool) -> dict:
+        report = self._report("iot_data", default, overrides)
+        groups = [
+            (days, IoTData.device_id.in_(_devices_owned(System.owner_id == owner_id)))
+            for owner_id, days in overrides.items()
+        ]
+        # Readings of devices that no longer exist follow the default
+        others = IoTData.device_id.not_in(_devices_owned(System.owner_id.in_(list(overrides)))) if overrides else None
+        groups.append((default, others))
+
+        partitions = self._partitions(db)
+        keep = _longest([days for days, _ in groups])
+        if partitions:
+            self._manage_partitions(db, partitions, now, keep, dry_run, report)
+        for days, condition in groups:
+            # Rows of the longest retention go with their partitions
+            if days and (not partitions or days != keep):
+                conditions = [IoTData.timestamp < now - timedelta(days=days)]
+                if condition is not None:
+                    conditions.append(condition)
+                report["rows_deleted"] += self._purge(db, IoTData, conditions, dry_run)[0]
+        if not dry_run:
+            RETENTION_ROWS_DELETED.inc(("iot_data",), report["rows_deleted"])
+        return report
+
+    def _notifications(self, db, default: int, overrides: Dict[int, int], now: datetime, dry_run: bool) -> dict:
+        report = self._report("notifications", default, overrides)
+        groups = [(days, Notification.user_id == owner_id) for owner_id, days in overrides.items()]
+        groups.append((default, Notification.user_id.not_in(list(overrides)) if overrides else None))
+        touched: Set[int] = set()
+        for days, condition in groups:
+            if not days:
+                continue
+            conditions = [Notification.created_at < now - timedelta(days=days)]
+            if condition is not None:
+                conditions.append(condition)
+            deleted, users = self._purge(db, Notification, conditions, dry_run, Notification.user_id)
+            report["rows_deleted"] += deleted
+            touched |= users
+        for user_id in touched:
+            invalidate_responses(user_id, "notifications")
+            invalidate_dashboard(user_id)
+        if not dry_run:
+            RETENTION_ROWS_DELETED.inc(("notifications",), report["rows_deleted"])
+        return report
+
+    def _purge(self, db, model, conditions: list, dry_run: bool, owner_column=None) -> Tuple[int, Set[int]]:
+        """
+        Delete matching rows PURGE_CHUNK_ROWS at a time, committing each chunk.
+
+        Returns the number of rows (matching rows when `dry_run`) and the
+        distinct `owner_column` values of the deleted rows.
+        """
+        if dry_run:
+            return db.scalar(select(func.count()).select_from(model).where(*conditions)), set()
+        deleted, owners = 0, set()
+        columns = [model.id] if owner_column is None else [model.id, owner_column]
+        while not self._stop.is_set():
+            rows = db.execute(select(*columns).where(*conditions).limit(self.chunk_rows)).all()
+            if not rows:
+                break
+            db.execute(
+                delete(model).where(model.id.in_([row[0] for row in rows])),
+                execution_options={"synchronize_session": False},
+            )
+            db.commit()
+            deleted += len(rows)
+            if owner_column is not None:
+                owners.update(row[1] for row in rows)
+            if len(rows) < self.chunk_rows:
+                break
+            self._stop.wait(self.pause)
+        return deleted, owners
+
+    def _partitions(self, db) -> List[Tuple[str, Optional[datetime], int]]:
+        """
+        iot_data's partitions as (name, exclusive upper bound or None for MAXVALUE, estimated rows).
+        """
+        if db.get_bind().dialect.name != "mysql":
+            return []
+        rows = db.execute(text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'iot_data' AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        )).all()
+        return [
+            (name, None if bound == "MAXVALUE" else datetime.fromisoformat(bound.strip("'")), estimate or 0)
+            for name, bound, estimate in rows
+        ]
+
+    def _manage_partitions(self, db, partitions, now: datetime, keep: Optional[int], dry_run: bool, report: dict) -> None:
+        if any(not _PARTITION_NAME.match(name) for name, _, _ in partitions):
+            logger.warning("iot_data has unexpected partitions %s; not managing them", [p[0] for p in partitions])
+            return
+        finite = [(name, bound, estimate) for name, bound, estimate in partitions if bound is not None]
+        if not finite:
+            logger.warning("iot_data has no monthly partitions; run the migrations")
+            return
+
+        # Create: every month from the last bound up to PARTITIONS_AHEAD_MONTHS past this one
+        target = month_start(now)
+        for _ in range(PARTITIONS_AHEAD_MONTHS + 1):
+            target = next_month(target)
+        months, month = [], finite[-1][1]
+        while month < target:
+            months.append(month)
+            month = next_month(month)
+        report["partitions_created"] = [f"p{month:%Y%m}" for month in months]
+
+        # Drop: partitions entirely older than the longest retention
+        expired = [] if keep is None else [
+            (name, estimate) for name, bound, estimate in finite if bound <= now - timedelta(days=keep)
+        ]
+        report["partitions_dropped"] = [name for name, _ in expired]
+        report["partition_rows_dropped"] = sum(estimate for _, estimate in expired)
+        if dry_run:
+            return
+
+        if months:
+            clauses = ", ".join(partition_clause(month) for month in months)
+            if partitions[-1][1] is None:
+                # Split the catch-all partition (empty while partitions exist ahead)
+                db.execute(text(
+                    f"ALTER TABLE iot_data REORGANIZE PARTITION `{partitions[-1][0]}` INTO "
+                    f"({clauses}, PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE))"
+                ))
+            else:
+                db.execute(text(f"ALTER TABLE iot_data ADD PARTITION ({clauses})"))
+        if expired:
+            db.execute(text(f"ALTER TABLE iot_data DROP PARTITION {', '.join(f'`{name}`' for name, _ in expired)}"))
+            RETENTION_PARTITIONS_DROPPED.inc(amount=len(expired))
+            logger.info("Dropped expired iot_data partitions %s", report["partitions_dropped"])
+        db.commit()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the scheduler; a running purge stops after its current chunk.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        delay = self.initial_delay
+        while not self._stop.wait(delay):
+            delay = self.interval
+            try:
+                report = self.run()
+            except Exception:
+                logger.exception("Retention pass failed")
+                continue
+            for table in report["tables"]:
+                if table["rows_deleted"] or table["partitions_dropped"]:
+                    logger.info(
+                        "Retention on %s: %d rows deleted, partitions dropped %s",
+                        table["table"], table["rows_deleted"], table["partitions_dropped"],
+                    )
+
+
+retention_manager = RetentionManager()
+
+
+def configure(settings: Settings) -> None:
+    """
+    Apply the default retentions and pass interval of `settings` (call before startup).
+    """
+    retention_manager.defaults = default_retention_days(settings)
+    retention_manager.interval = settings.retention_interval_seconds
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Apply (or preview) the data retention policies once.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without changing anything")
+    args = parser.parse_args(argv)
+    print(json.dumps(retention_manager.run(dry_run=args.dry_run), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
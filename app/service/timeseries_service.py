@@ -0,0 +1,186 @@
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app.database import SessionLocal
+from app.models import IoTData, IoTDataRollup
+
+# Rollup bucket widths in seconds, finest first
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+RESOLUTION_NAMES = {0: "raw", 60: "1m", 3600: "1h", 86400: "1d"}
+
+_EPOCH = datetime(1970, 1, 1)
+
+RollupKey = Tuple[int, int, str, datetime]
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """
+    Normalise a timestamp to naive UTC, the convention used by every DateTime column.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(value: datetime, width: int) -> datetime:
+    seconds = int((value - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=seconds - seconds % width)
+
+
+def aggregate_rows(rows: Iterable[dict], resolutions=ROLLUP_RESOLUTIONS) -> Dict[RollupKey, list]:
+    """
+    Fold readings into [min, max, sum, count] per (resolution, device, parameter, bucket).
+    """
+    buckets: Dict[RollupKey, list] = {}
+    for row in rows:
+        value = row["sensor_value"]
+        for width in resolutions:
+            key = (width, row["device_id"], row["parameter"], bucket_start(row["timestamp"], width))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [value, value, value, 1]
+            else:
+                if value < agg[0]:
+                    agg[0] = value
+                if value > agg[1]:
+                    agg[1] = value
+                agg[2] += value
+                agg[3] += 1
+    return buckets
+
+
+def _upsert_statement(dialect_name: str):
+    table = IoTDataRollup.__table__
+    if dialect_name == "mysql":
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update(
+            min_value=func.least(table.c.min_value, stmt.inserted.min_value),
+            max_value=func.greatest(table.c.max_value, stmt.inserted.max_value),
+            sum_value=table.c.sum_value + stmt.inserted.sum_value,
+            sample_count=table.c.sample_count + stmt.inserted.sample_count,
+        )
+    if dialect_name in ("sqlite", "postgresql"):
+        module = sqlite if dialect_name == "sqlite" else postgresql
+        least, greatest = (func.min, func.max) if dialect_name == "sqlite" else (func.least, func.greatest)
+        stmt = module.insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=[c.name for c in table.primary_key.columns],
+            set_={
+                "min_value": least(table.c.min_value, stmt.excluded.min_value),
+                "max_value": greatest(table.c.max_value, stmt.excluded.max_value),
+                "sum_value": table.c.sum_value + stmt.excluded.sum_value,
+                "sample_count": table.c.sample_count + stmt.excluded.sample_count,
+            },
+        )
+    raise NotImplementedError(f"Rollup upsert is not implemented for {dialect_name}")
+
+
+def upsert_rollups(db, buckets: Dict[RollupKey, list], chunk_rows: int = 1_000) -> None:
+    values = [
+        {
+            "resolution": width,
+            "device_id": device_id,
+            "parameter": parameter,
+            "bucket_start": start,
+            "min_value": agg[0],
+            "max_value": agg[1],
+            "sum_value": agg[2],
+            "sample_count": agg[3],
+        }
+        for (width, device_id, parameter, start), agg in buckets.items()
+    ]
+    statement = _upsert_statement(db.get_bind().dialect.name)
+    for offset in range(0, len(values), chunk_rows):
+        db.execute(statement, values[offset:offset + chunk_rows])
+
+
+def update_rollups(rows: List[dict]) -> None:
+    """
+    Ingestion listener: merge a committed batch into the 1m/1h/1d rollups.
+    """
+    db = SessionLocal()
+    try:
+        upsert_rollups(db, aggregate_rows(rows))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# -- querying ---------------------------------------------------------------
+
+def plan_query(start: datetime, end: datetime, step: int = None, max_points: int = 500) -> Tuple[int, int]:
+    """
+    Pick (source resolution, output step) for a range.
+
+    The step is widened until the range fits in `max_points`; the source is the
+    coarsest rollup no wider than that step (0 means raw readings), and the step
+    is rounded up to a whole number of source buckets.
+    """
+    span = max((end - start).total_seconds(), 1)
+    step = max(step or 1, math.ceil(span / max_points))
+    source = max((width for width in ROLLUP_RESOLUTIONS if width <= step), default=0)
+    if source:
+        step = math.ceil(step / source) * source
+    return source, step
+
+
+def series_statement(device_id: int, parameter: str, start: datetime, end: datetime, source: int):
+    """
+    Select (bucket_start, min, max, sum, count) rows from the chosen source.
+    """
+    if source == 0:
+        return (
+            select(
+                IoTData.timestamp, IoTData.sensor_value, IoTData.sensor_value,
+                IoTData.sensor_value, literal(1),
+            )
+            .where(
+                IoTData.device_id == device_id,
+                IoTData.parameter == parameter,
+                IoTData.timestamp >= start,
+                IoTData.timestamp < end,
+            )
+            .order_by(IoTData.timestamp)
+        )
+    return (
+        select(
+            IoTDataRollup.bucket_start, IoTDataRollup.min_value, IoTDataRollup.max_value,
+            IoTDataRollup.sum_value, IoTDataRollup.sample_count,
+        )
+        .where(
+            IoTDataRollup.resolution == source,
+            IoTDataRollup.device_id == device_id,
+            IoTDataRollup.parameter == parameter,
+            IoTDataRollup.bucket_start >= bucket_start(start, source),
+            IoTDataRollup.bucket_start < end,
+        )
+        .order_by(IoTDataRollup.bucket_start)
+    )
+
+
+def downsample(rows: Iterable[tuple], step: int) -> List[dict]:
+    """
+    Merge ordered (bucket_start, min, max, sum, count) rows into `step`-second points.
+    """
+    points: List[dict] = []
+    current = None
+    for ts, low, high, total, count in rows:
+        start = bucket_start(ts, step)
+        if current is None or current["bucket_start"] != start:
+            current = {"bucket_start": start, "min_value": low, "max_value": high, "sum": total, "count": count}
+            points.append(current)
+        else:
+            current["min_value"] = min(current["min_value"], low)
+            current["max_value"] = max(current["max_value"], high)
+            current["sum"] += total
+            current["count"] += count
+    for point in points:
+        point["avg_value"] = point.pop("sum") / point["count"]
+    return points
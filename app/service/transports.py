@@ -0,0 +1,124 @@
+import json
+import logging
+import smtplib
+import urllib.request
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+SEND_TIMEOUT_SECONDS = 10
+
+
+class Transport:
+    """
+    Delivers a batch of messages to one recipient; raises on failure so the job is retried.
+
+    Each message is a dict with "subject" and "body".
+    """
+    channel: str
+
+    async def send(self, recipient: str, messages: List[dict]) -> None:
+        raise NotImplementedError
+
+
+class EmailTransport(Transport):
+    channel = "email"
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 587,
+        sender: str = "alerts@localhost",
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = True,
+    ):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+
+    def _message(self, recipient: str, messages: List[dict]) -> EmailMessage:
+        email = EmailMessage()
+        email["From"] = self.sender
+        email["To"] = recipient
+        if len(messages) == 1:
+            email["Subject"] = messages[0]["subject"]
+            email.set_content(messages[0]["body"])
+        else:
+            # One digest instead of an email per alert
+            email["Subject"] = f"{len(messages)} new notifications"
+            email.set_content("\n\n".join(f"{m['subject']}\n{m['body']}" for m in messages))
+        return email
+
+    def _send(self, recipient: str, messages: List[dict]) -> None:
+        with smtplib.SMTP(self.host, self.port, timeout=SEND_TIMEOUT_SECONDS) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(self._message(recipient, messages))
+
+    async def send(self, recipient: str, messages: List[dict]) -> None:
+        await run_in_threadpool(self._send, recipient, messages)
+
+
+class WebhookTransport(Transport):
+    """
+    POSTs {"messages": [...]} as JSON to the recipient URL; any non-2xx status fails.
+    """
+    channel = "webhook"
+
+    def _send(self, url: str, messages: List[dict]) -> None:
+        request = urllib.request.Request(
+            url,
+            data=json.dumps({"messages": messages}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=SEND_TIMEOUT_SECONDS):
+            pass  # urlopen raises HTTPError for non-2xx responses
+
+    async def send(self, recipient: str, messages: List[dict]) -> None:
+        await run_in_threadpool(self._send, recipient, messages)
+
+
+transports: Dict[str, Transport] = {"webhook": WebhookTransport()}
+
+
+def register_transport(transport: Transport) -> None:
+    """
+    Install or replace the transport for `transport.channel`.
+    """
+    transports[transport.channel] = transport
+
+
+def configure(settings: Settings) -> None:
+    """
+    Send email through the SMTP server of `settings` (no-op if unchanged);
+    without smtp_host there is no email channel and nothing is queued for it.
+    """
+    global _smtp_settings
+    smtp_settings = (
+        settings.smtp_host, settings.smtp_port, settings.smtp_from,
+        settings.smtp_user, settings.smtp_password, settings.smtp_starttls,
+    )
+    if smtp_settings == _smtp_settings:
+        return
+    _smtp_settings = smtp_settings
+    if settings.smtp_host:
+        register_transport(EmailTransport(*smtp_settings))
+    else:
+        transports.pop("email", None)
+        logger.warning("SMTP_HOST is not set: notifications and password reset emails are not sent")
+
+
+_smtp_settings = None
+configure(get_settings())
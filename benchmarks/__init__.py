@@ -0,0 +1,8 @@
+"""
+Benchmark and load-test suite for the API's hot paths.
+
+    python -m benchmarks.run --seed --readings 1000000 --output results.json
+    python -m benchmarks.run --baseline results.json
+
+See benchmarks/run.py for the scenarios and options.
+"""
@@ -0,0 +1,471 @@
+"""
+Drive the API's hot paths at a fixed concurrency and report throughput,
+latency percentiles and SQL statements per request as JSON.
+
+    # seed a fresh SQLite database and run every scenario in-process
+    python -m benchmarks.run --seed --output results.json
+
+    # same scenarios over real HTTP (uvicorn in a background thread)
+    python -m benchmarks.run --mode http --concurrency 50
+
+    # compare against a stored run; exits 1 on a regression
+    python -m benchmarks.run --baseline results.json
+
+The database is BENCH_DATABASE_URL / --database-url (default
+sqlite:///./benchmark.db), never DATABASE_URL, because --seed drops every
+table. Against --url (a server started separately on the same database)
+statement counts are not available and are reported as null.
+"""
+import argparse
+import asyncio
+import base64
+import contextvars
+import json
+import os
+import platform
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "sqlite:///./benchmark.db")
+
+DEFAULT_REQUESTS = 500
+DEFAULT_CONCURRENCY = 10
+DEFAULT_WARMUP_ROUNDS = 2  # unrecorded requests per user before each scenario
+INGEST_BATCH_ROWS = 100
+
+# A scenario is slower than its baseline beyond this fraction of throughput or p95
+DEFAULT_TOLERANCE = 0.10
+
+# Statements issued while a request is being handled, including its threadpool
+# and async-driver work; None outside requests (background threads)
+_request_queries: contextvars.ContextVar = contextvars.ContextVar("bench_request_queries", default=None)
+
+
+class QueryCounter:
+    """
+    ASGI wrapper that counts SQL statements per request.
+
+    Statements from background threads (ingestion flushes, delivery worker,
+    checkpoints) are counted separately.
+    """
+
+    def __init__(self, app):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        self.app = app
+        self.requests = 0
+        self.queries = 0
+        self.background = 0
+        self._lock = threading.Lock()
+        event.listen(Engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args) -> None:
+        counts = _request_queries.get()
+        if counts is not None:
+            counts[0] += 1
+            return
+        with self._lock:
+            self.background += 1
+
+    def reset(self) -> Tuple[int, int, int]:
+        with self._lock:
+            totals = (self.requests, self.queries, self.background)
+            self.requests = self.queries = self.background = 0
+        return totals
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        counts = [0]
+        token = _request_queries.set(counts)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_queries.reset(token)
+            with self._lock:
+                self.requests += 1
+                self.queries += counts[0]
+
+
+def _basic(user: dict) -> dict:
+    credential = base64.b64encode(f"{user['username']}:{user['password']}".encode()).decode()
+    return {"authorization": f"Basic {credential}"}
+
+
+def _bearer(user: dict) -> dict:
+    return {"authorization": f"Bearer {user['access_token']}"}
+
+
+def _pick_device(user: dict, i: int) -> int:
+    return user["device_ids"][i % len(user["device_ids"])]
+
+
+def _ingest_body(user: dict, i: int) -> list:
+    rng = random.Random(i)
+    now = datetime.utcnow()
+    readings = []
+    for n in range(INGEST_BATCH_ROWS):
+        device_id = rng.choice(user["device_ids"])
+        readings.append({
+            "device_id": device_id,
+            "parameter": rng.choice(user["parameters"][device_id] or ["temperature"]),
+            "sensor_value": rng.uniform(-10, 110),
+            "timestamp": (now - timedelta(milliseconds=n)).isoformat(),
+        })
+    return readings
+
+
+# name -> (description, request builder(user, i) -> (method, url, httpx kwargs))
+SCENARIOS: Dict[str, Tuple[str, Callable[[dict, int], Tuple[str, str, dict]]]] = {
+    "auth_token": (
+        "POST /auth/token: password check (bcrypt) and token pair",
+        lambda user, i: ("POST", "/auth/token", {"json": {"username": user["username"], "password": user["password"]}}),
+    ),
+    "profile_basic": (
+        "GET /profile/ with Basic auth (credential cache)",
+        lambda user, i: ("GET", "/profile/", {"headers": _basic(user)}),
+    ),
+    "profile_bearer": (
+        "GET /profile/ with a bearer token",
+        lambda user, i: ("GET", "/profile/", {"headers": _bearer(user)}),
+    ),
+    "systems": (
+        "GET /system/ first page",
+        lambda user, i: ("GET", "/system/?limit=100", {"headers": _basic(user)}),
+    ),
+    "system_tree": (
+        "GET /system/tree with devices",
+        lambda user, i: ("GET", "/system/tree?expand=devices", {"headers": _basic(user)}),
+    ),
+    "device_inputs": (
+        "GET /device-input/ first page",
+        lambda user, i: ("GET", "/device-input/?limit=100", {"headers": _basic(user)}),
+    ),
+    "notifications": (
+        "GET /notifications/ first page",
+        lambda user, i: ("GET", "/notifications/?limit=100", {"headers": _basic(user)}),
+    ),
+    "alerts": (
+        "GET /alerts/ first page",
+        lambda user, i: ("GET", "/alerts/?limit=100", {"headers": _basic(user)}),
+    ),
+    "admin_users": (
+        "GET /admin/users first page (admin users only)",
+        lambda user, i: ("GET", "/admin/users?limit=100", {"headers": _basic(user)}),
+    ),
+    "dashboard": (
+        "GET /dashboard/",
+        lambda user, i: ("GET", "/dashboard/", {"headers": _basic(user)}),
+    ),
+    "readings": (
+        "GET /filter/readings for one device, 500 rows",
+        lambda user, i: ("GET", f"/filter/readings?device_id={_pick_device(user, i)}&limit=500", {"headers": _basic(user)}),
+    ),
+    "readings_aggregate": (
+        "GET /filter/readings/aggregate for one device with percentiles",
+        lambda user, i: (
+            "GET",
+            f"/filter/readings/aggregate?device_id={_pick_device(user, i)}&group_by=parameter&percentile=50&percentile=95",
+            {"headers": _basic(user)},
+        ),
+    ),
+    "ingest": (
+        f"POST /iot-data/ with {INGEST_BATCH_ROWS} readings",
+        lambda user, i: ("POST", "/iot-data/", {"headers": _basic(user), "json": _ingest_body(user, i)}),
+    ),
+}
+
+ADMIN_SCENARIOS = {"admin_users"}
+BEARER_SCENARIOS = {"profile_bearer"}
+
+
+def percentile(ordered: Sequence[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * p // 100))  # ceil
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], elapsed: float, counted: Optional[Tuple[int, int, int]]) -> dict:
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    requests, queries, background = counted if counted else (None, None, None)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(1000 * sum(ordered) / len(ordered), 3) if ordered else None,
+            **{f"p{p}": round(1000 * percentile(ordered, p), 3) if ordered else None for p in (50, 95, 99)},
+            "max": round(1000 * ordered[-1], 3) if ordered else None,
+        },
+        "queries_per_request": round(queries / requests, 3) if requests else None,
+        "background_queries": background,
+    }
+
+
+async def run_scenario(client, name: str, users: List[dict], requests: int, concurrency: int, warmup: int, counter=None) -> dict:
+    """
+    Send `warmup` unrecorded requests, then `requests` recorded ones from
+    `concurrency` concurrent clients, cycling through `users`.
+    """
+    _, build = SCENARIOS[name]
+
+    async def drive(total: int, latencies: List[float], statuses: Dict[int, int]) -> None:
+        indexes = iter(range(total))
+
+        async def worker():
+            for i in indexes:
+                method, url, kwargs = build(users[i % len(users)], i)
+                started = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    await drive(warmup, [], {})
+    if counter is not None:
+        _flush_ingestion()
+        counter.reset()
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    started = time.perf_counter()
+    await drive(requests, latencies, statuses)
+    elapsed = time.perf_counter() - started
+    if counter is None:
+        return summarize(latencies, statuses, elapsed, None)
+    _flush_ingestion()  # so the scenario's buffered writes count as its background statements
+    return summarize(latencies, statuses, elapsed, counter.reset())
+
+
+def _flush_ingestion() -> None:
+    from app.service.ingestion_service import ingestion_buffer
+    ingestion_buffer.flush()
+
+
+async def _log_in(client, users: List[dict], tokens: bool) -> None:
+    """
+    Verify every user's Basic credentials once (so later requests measure the
+    credential cache, not bcrypt, whatever scenarios run) and fetch tokens.
+    """
+    for user in users:
+        response = await client.get("/profile/", headers=_basic(user))
+        response.raise_for_status()
+        if tokens:
+            response = await client.post("/auth/token", json={"username": user["username"], "password": user["password"]})
+            response.raise_for_status()
+            user["access_token"] = response.json()["access_token"]
+
+
+async def run_all(client, names: Sequence[str], users: List[dict], args, counter=None) -> Dict[str, dict]:
+    await _log_in(client, users, tokens=bool(BEARER_SCENARIOS.intersection(names)))
+    if counter is not None:
+        counter.reset()
+    results = {}
+    for name in names:
+        scenario_users = [user for user in users if user["is_admin"]] if name in ADMIN_SCENARIOS else users
+        results[name] = await run_scenario(
+            client, name, scenario_users, args.requests, args.concurrency, args.warmup * len(scenario_users), counter,
+        )
+        print(_progress_line(name, results[name]), file=sys.stderr)
+    return results
+
+
+def _progress_line(name: str, stats: dict) -> str:
+    latency = stats["latency_ms"]
+    queries = stats["queries_per_request"]
+    return (
+        f"{name:20} {stats['throughput_rps'] or 0:9.1f} req/s  p50 {latency['p50'] or 0:8.2f} ms  "
+        f"p95 {latency['p95'] or 0:8.2f} ms  p99 {latency['p99'] or 0:8.2f} ms  "
+        f"queries/req {'-' if queries is None else queries}  errors {stats['errors']}"
+    )
+
+
+async def _in_process(app, names, users, args) -> Dict[str, dict]:
+    import httpx
+
+    counter = QueryCounter(app)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=counter)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return await run_all(client, names, users, args, counter)
+
+
+async def _over_http(base_url: str, names, users, args, counter=None) -> Dict[str, dict]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        return await run_all(client, names, users, args, counter)
+
+
+def _serve(app):
+    """
+    Start uvicorn on a free localhost port in a background thread.
+    """
+    import uvicorn
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="benchmark-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("benchmark server failed to start")
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def compare(current: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Regressions of `current` against `baseline`: throughput or p95 latency
+    worse by more than `tolerance`, or more statements per request.
+    """
+    regressions = []
+    for name, stats in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        if base["throughput_rps"] and stats["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {stats['throughput_rps']} req/s")
+        base_p95, p95 = base["latency_ms"]["p95"], stats["latency_ms"]["p95"]
+        if base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base_p95} -> {p95} ms")
+        base_queries, queries = base.get("queries_per_request"), stats.get("queries_per_request")
+        if base_queries is not None and queries is not None and queries > base_queries + 0.01:
+            regressions.append(f"{name}: queries/request {base_queries} -> {queries}")
+        if stats["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {stats['errors']}")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API's hot paths.")
+    parser.add_argument("--database-url", default=BENCH_DATABASE_URL, help="Database to seed and serve (default: %(default)s)")
+    parser.add_argument("--seed", action="store_true", help="Drop all tables and seed synthetic data first")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--systems-per-user", type=int, default=5)
+    parser.add_argument("--devices-per-system", type=int, default=4)
+    parser.add_argument("--inputs-per-device", type=int, default=3)
+    parser.add_argument("--notifications-per-user", type=int, default=200)
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--mode", choices=("asgi", "http"), default="asgi",
+                        help="asgi: in-process, no sockets; http: uvicorn on localhost, or --url")
+    parser.add_argument("--url", help="Benchmark an already running server instead (implies --mode http)")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run (repeatable; default all)")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Recorded requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP_ROUNDS, help="Unrecorded requests per user before each scenario")
+    parser.add_argument("--output", "-o", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--list", action="store_true", help="List scenarios and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (description, _) in SCENARIOS.items():
+            print(f"{name:20} {description}")
+        return 0
+
+    # Bearer scenarios need token signing; a throwaway key unless one is configured
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+    import app.database as database
+    from app.config import Settings
+    from benchmarks.seed import load_users, seed
+
+    settings = Settings.from_env(database_url=args.database_url, async_database_url=None)
+    database.configure(settings)
+    engine = database.engine
+
+    seeded = None
+    if args.seed:
+        started = time.perf_counter()
+        seeded = seed(
+            engine, users=args.users, systems_per_user=args.systems_per_user,
+            devices_per_system=args.devices_per_system, inputs_per_device=args.inputs_per_device,
+            notifications_per_user=args.notifications_per_user, readings=args.readings,
+        )
+        print(f"seeded {seeded} in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    users = load_users(engine)
+    if not users:
+        parser.error("no benchmark users in the database; run with --seed")
+
+    names = args.scenario or list(SCENARIOS)
+    mode = "http" if args.url else args.mode
+    if args.url:
+        scenarios = asyncio.run(_over_http(args.url, names, users, args))
+    else:
+        from main import create_app
+
+        app = create_app(settings)
+        if mode == "asgi":
+            scenarios = asyncio.run(_in_process(app, names, users, args))
+        else:
+            counter = QueryCounter(app)
+            server, thread, base_url = _serve(counter)
+            try:
+                scenarios = asyncio.run(_over_http(base_url, names, users, args, counter))
+            finally:
+                server.should_exit = True
+                thread.join()
+
+    result = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "database": engine.url.get_backend_name(),
+            "mode": mode,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "seeded": seeded,
+        },
+        "scenarios": scenarios,
+    }
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"no regressions against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
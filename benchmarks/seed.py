@@ -0,0 +1,165 @@
+"""
+Synthetic data for the benchmarks: users, systems, devices, thresholds,
+notifications and readings, generated from a fixed random seed so every run
+starts from the same database.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import insert, select
+
+from app.database import Base
+from app.models import Device, DeviceInput, IoTData, Notification, System, User
+from app.service.password_service import crypt_context
+
+BENCH_USER_PREFIX = "bench"
+BENCH_PASSWORD = "bench-password"
+PARAMETERS = ("temperature", "humidity", "pressure", "voltage")
+WIDGET_TYPES = ("map", "chart", "indicator")
+
+SEED_CHUNK_ROWS = 10_000  # rows per executemany
+
+
+def seed(
+    engine,
+    users: int = 20,
+    systems_per_user: int = 5,
+    devices_per_system: int = 4,
+    inputs_per_device: int = 3,
+    notifications_per_user: int = 200,
+    readings: int = 1_000_000,
+    days: int = 30,
+    random_seed: int = 42,
+) -> dict:
+    """
+    Drop and recreate every table, then fill them with synthetic data.
+
+    Readings are spread evenly over the device inputs (one series per device
+    and parameter) and over the last `days` days, mostly inside the
+    thresholds. The first user is an admin. Returns the row counts.
+    """
+    rng = random.Random(random_seed)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    hashed = crypt_context().hash(BENCH_PASSWORD)  # one bcrypt hash shared by every user
+    now = datetime.utcnow().replace(microsecond=0)
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "username": f"{BENCH_USER_PREFIX}{i}",
+                "email": f"{BENCH_USER_PREFIX}{i}@example.com",
+                "hashed_password": hashed,
+                "is_admin": i == 0,
+            }
+            for i in range(users)
+        ])
+        user_ids = list(conn.execute(select(User.id).order_by(User.id)).scalars())
+
+        conn.execute(insert(System), [
+            {"name": f"system-{user_id}-{j}", "description": "benchmark system",
+             "widget_type": WIDGET_TYPES[j % len(WIDGET_TYPES)], "owner_id": user_id}
+            for user_id in user_ids
+            for j in range(systems_per_user)
+        ])
+        systems = conn.execute(select(System.id, System.owner_id).order_by(System.id)).all()
+
+        conn.execute(insert(Device), [
+            {"name": f"device-{system_id}-{k}", "system_id": system_id, "status": rng.random() > 0.1}
+            for system_id, _ in systems
+            for k in range(devices_per_system)
+        ])
+        owners = dict(systems)
+        devices = [
+            (device_id, owners[system_id])
+            for device_id, system_id in conn.execute(select(Device.id, Device.system_id).order_by(Device.id))
+        ]
+
+        thresholds = []
+        for device_id, owner_id in devices:
+            for parameter in PARAMETERS[:inputs_per_device]:
+                low = rng.uniform(0, 20)
+                thresholds.append({
+                    "device_id": device_id, "parameter": parameter, "min_value": low,
+                    "max_value": low + rng.uniform(40, 80), "alert_enabled": True, "owner_id": owner_id,
+                })
+        _insert_chunked(conn, DeviceInput, thresholds)
+
+        _insert_chunked(conn, Notification, [
+            {
+                "user_id": user_id,
+                "message": f"Alert: benchmark notification {n}",
+                "is_read": rng.random() < 0.7,
+                "created_at": now - timedelta(minutes=n),
+            }
+            for user_id in user_ids
+            for n in range(notifications_per_user)
+        ])
+
+    per_series = readings // len(thresholds) if thresholds else 0
+    step = timedelta(days=days) / max(per_series, 1)
+    start = now - timedelta(days=days)
+    pending: List[dict] = []
+    for threshold in thresholds:
+        low, high = threshold["min_value"], threshold["max_value"]
+        value = (low + high) / 2
+        for n in range(per_series):
+            # Random walk that occasionally leaves the threshold band
+            value = min(max(value + rng.gauss(0, (high - low) / 20), low - 10), high + 10)
+            pending.append({
+                "device_id": threshold["device_id"], "parameter": threshold["parameter"],
+                "sensor_value": value, "timestamp": start + step * n,
+            })
+            if len(pending) >= SEED_CHUNK_ROWS:
+                with engine.begin() as conn:
+                    conn.execute(insert(IoTData), pending)
+                pending = []
+    if pending:
+        with engine.begin() as conn:
+            conn.execute(insert(IoTData), pending)
+
+    return {
+        "users": len(user_ids),
+        "systems": len(systems),
+        "devices": len(devices),
+        "device_inputs": len(thresholds),
+        "notifications": len(user_ids) * notifications_per_user,
+        "readings": per_series * len(thresholds),
+    }
+
+
+def _insert_chunked(conn, model, rows: List[dict]) -> None:
+    for i in range(0, len(rows), SEED_CHUNK_ROWS):
+        conn.execute(insert(model), rows[i:i + SEED_CHUNK_ROWS])
+
+
+def load_users(engine) -> List[dict]:
+    """
+    The seeded users with their credentials and device ids, admins first.
+    """
+    with engine.connect() as conn:
+        users = conn.execute(
+            select(User.id, User.username, User.is_admin)
+            .where(User.username.like(f"{BENCH_USER_PREFIX}%"))
+            .order_by(User.is_admin.desc(), User.id)
+        ).all()
+        devices = {}
+        for device_id, owner_id in conn.execute(
+            select(Device.id, System.owner_id).join(System, System.id == Device.system_id).order_by(Device.id)
+        ):
+            devices.setdefault(owner_id, []).append(device_id)
+        parameters = {}
+        for device_id, parameter in conn.execute(select(DeviceInput.device_id, DeviceInput.parameter)):
+            parameters.setdefault(device_id, []).append(parameter)
+    return [
+        {
+            "id": user_id,
+            "username": username,
+            "password": BENCH_PASSWORD,
+            "is_admin": bool(is_admin),
+            "device_ids": devices.get(user_id, []),
+            "parameters": {device_id: parameters.get(device_id, []) for device_id in devices.get(user_id, [])},
+        }
+        for user_id, username, is_admin in users
+    ]
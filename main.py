@@ -1,25 +1,153 @@
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends
-from app.routers import auth, dashboard, device_input, filters, admin, profile, notifications, alerts, systems
-from app.database import engine, Base
+from fastapi.concurrency import run_in_threadpool
+
+import app.database as database
+import app.response_cache as response_cache
+import app.security as security
+from app.config import Settings, get_settings
 from app.dependencies import get_current_user  # Import authentication function
+from app.service.ingestion_service import ingestion_buffer
+from app.service.alert_service import alert_engine
+from app.service.timeseries_service import update_rollups
+from app.service.dashboard_service import dashboard_cache
+from app.service import notification_service, password_service, reset_token_service, retention_service, transports
+from app.service.notification_service import delivery_worker
+from app.service.retention_service import retention_manager
+from app.response_cache import ResponseCacheMiddleware
+from app.invalidation_bus import create_transport, default_socket_dir, invalidation_bus
+from app.metrics import MetricsMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Routers that authenticate their own endpoints: the login routes, WebSockets
+# (which cannot use the HTTP security dependencies) and the Prometheus scrape
+# endpoint (unauthenticated like the health check)
+PUBLIC_ROUTERS = {"auth", "realtime", "metrics"}
+
 
-# Initialize database tables
-Base.metadata.create_all(bind=engine)
+async def _warm_start(settings: Settings) -> None:
+    """
+    Do the work the first requests would otherwise pay for: pooled database
+    connections, the password hashing processes, and the device registry and
+    alert rules. Failures are logged; everything still loads on demand.
+    """
+    started = time.perf_counter()
+    steps = {
+        "database pool": run_in_threadpool(database.warm_pool, settings.db_pool_warm),
+        "async database pool": database.warm_async_pool(settings.db_pool_warm),
+        "password workers": password_service.warm_up(),
+        # Loads the device registry on the way
+        "alert rules": run_in_threadpool(alert_engine.load),
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.warning("Warm start: %s failed: %r", step, result)
+    logger.info("Warm start finished in %.2f s", time.perf_counter() - started)
 
-# Initialize FastAPI app
-app = FastAPI(title="IoT Stream Management Backend", version="1.0")
 
-# Register API routes
-app.include_router(auth.router)
-app.include_router(dashboard.router, dependencies=[Depends(get_current_user)])
-app.include_router(device_input.router, dependencies=[Depends(get_current_user)])
-app.include_router(filters.router, dependencies=[Depends(get_current_user)])
-app.include_router(admin.router, dependencies=[Depends(get_current_user)])
-app.include_router(profile.router, dependencies=[Depends(get_current_user)])
-app.include_router(notifications.router, dependencies=[Depends(get_current_user)])
-app.include_router(alerts.router, dependencies=[Depends(get_current_user)])
-app.include_router(systems.router, dependencies=[Depends(get_current_user)])
+def _start_invalidation_bus(settings: Settings) -> None:
+    transport = create_transport(
+        settings.invalidation_bus,
+        path=settings.invalidation_bus_path or default_socket_dir(settings.database_url),
+        url=settings.invalidation_bus_url,
+    )
+    try:
+        invalidation_bus.start(transport)
+    except Exception:
+        # Still serves correctly with one worker; caches expire by TTL otherwise
+        logger.exception("Invalidation bus (%s) not started", settings.invalidation_bus)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = app.state.settings
+    # Before any cache is filled, so other workers' invalidations aren't missed
+    _start_invalidation_bus(settings)
+    if settings.warm_start:
+        await _warm_start(settings)
+    # Sends queued email/webhook notifications off the request path
+    delivery_worker.start()
+    # Expires old readings and notifications (see retention_service)
+    if settings.retention_enabled:
+        retention_manager.start()
+    try:
+        yield
+    finally:
+        await delivery_worker.stop()
+        retention_manager.stop()
+        # Persist readings still waiting in the write buffer
+        ingestion_buffer.stop()
+        # After the flush, so alerts from the final batches are recorded
+        alert_engine.stop()
+        # Also stops aiosqlite's connection threads, which would keep the process alive
+        await database.dispose_async_engine()
+        password_service.shutdown()
+        reset_token_service.reset_token_store.stop()
+        # Last: the steps above may still invalidate caches
+        invalidation_bus.stop()
+
 
-@app.get("/")
 def health_check():
     return {"message": "IoT Backend is Running!"}
+
+
+def create_app(settings: Settings = None) -> FastAPI:
+    """
+    Build the API for `settings` (default: from the environment).
+
+    Only the routers named in `settings.routers` are imported. The schema is
+    not created here: run `alembic upgrade head` (or `python -m app.database`
+    for a throwaway database) before starting the server.
+    """
+    settings = settings or get_settings()
+    # Process-wide engines, keys, pools and backends follow `settings`
+    # (each call is a no-op when its settings are unchanged)
+    database.configure(settings)
+    security.configure(settings)
+    password_service.configure(settings)
+    reset_token_service.configure(settings)
+    transports.configure(settings)
+    notification_service.configure(settings)
+    retention_service.configure(settings)
+    response_cache.configure(settings)
+
+    app = FastAPI(title=settings.title, version=settings.version, lifespan=lifespan)
+    app.state.settings = settings
+
+    # ETag / 304 and cached bodies for the polled list endpoints
+    app.add_middleware(ResponseCacheMiddleware)
+    # Request count/latency/queries per route; added last so it is outermost
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+
+    # Register API routes
+    for name in settings.routers:
+        router = importlib.import_module(f"app.routers.{name}").router
+        if name in PUBLIC_ROUTERS:
+            app.include_router(router)
+        else:
+            app.include_router(router, dependencies=[Depends(get_current_user)])
+    app.add_api_route("/", health_check, methods=["GET"])
+
+    # Evaluate every committed ingestion batch against the alert thresholds
+    ingestion_buffer.add_listener(alert_engine.process_batch)
+    # Keep the 1m/1h/1d rollups current
+    ingestion_buffer.add_listener(update_rollups)
+    # Keep cached dashboards' latest readings current without rebuilding them
+    ingestion_buffer.add_listener(dashboard_cache.apply_readings)
+    return app
+
+
+def __getattr__(name):
+    # `uvicorn main:app` builds the default app on first access, so importing
+    # create_app (benchmarks, other settings) doesn't build a second one
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")